@@ -0,0 +1,219 @@
+# Deterministic, offline stand-in for the Gemini API used by the benchmarks.
+# It replaces genai.embed_content(_async) and genai.GenerativeModel, so every service module
+# (which calls them through the shared `google.generativeai` module) runs unchanged.
+# - Embeddings: precomputed vectors when available (e.g. recorded from Gemini once),
+#   otherwise feature-hashed word/bigram vectors, so similar texts get similar vectors.
+# - Generation: answers each prompt type the pipeline sends (rerank scores, page selection,
+#   numeric extraction, phrasing, answers) with simple word-overlap rules.
+# - Latency: a configurable delay (with deterministic jitter) per embedding and LLM request.
+
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import google.generativeai as genai
+
+from services.lexical_index import tokenize
+from services.llm_client import reset_models
+from services.records import iter_records
+
+DIMENSION = 768
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def hash_embedding(text: str, dimension: int = DIMENSION) -> list:
+    """
+    Feature-hashed bag of words and bigrams with sublinear term weights, L2-normalized.
+    Bare numbers are left out: table pages hold hundreds of them, which would otherwise
+    drown the words that say what the table is about.
+    """
+    words = [w for w in tokenize(text) if not w.isdigit()]
+    counts = Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+    vec = np.zeros(dimension, dtype="float32")
+    for feature, count in counts.items():
+        digest = hashlib.md5(feature.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dimension
+        weight = 1.0 + np.log(count)
+        vec[index] += weight if digest[4] & 1 else -weight
+
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec /= norm
+    return vec.tolist()
+
+
+def load_embeddings(path: str) -> dict:
+    """
+    Reads precomputed vectors from JSON/JSONL records {"text": ..., "embedding": [...]}.
+    """
+    return {_text_key(r["text"]): r["embedding"] for r in iter_records(path)}
+
+
+def _overlap(query: str, text: str) -> float:
+    """
+    Share of the query's words that appear in the text.
+    """
+    query_words = set(tokenize(query))
+    if not query_words:
+        return 0.0
+    return len(query_words & set(tokenize(text))) / len(query_words)
+
+
+def _between(prompt: str, start: str, end: str) -> str:
+    match = re.search(re.escape(start) + r"\s*(.*?)\s*" + re.escape(end), prompt, re.S)
+    return match.group(1) if match else ""
+
+
+class _Usage:
+    def __init__(self, prompt: str, text: str):
+        # Roughly 4 characters per token, like Gemini on English text:
+        self.prompt_token_count = max(1, len(prompt) // 4)
+        self.candidates_token_count = max(1, len(text) // 4)
+
+
+class _Response:
+    def __init__(self, prompt: str, text: str):
+        self.text = text
+        self.usage_metadata = _Usage(prompt, text)
+
+
+class _StreamChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _AsyncStream:
+    def __init__(self, prompt: str, text: str, delay):
+        self.text = text
+        self.usage_metadata = _Usage(prompt, text)
+        self._delay = delay
+
+    async def __aiter__(self):
+        for piece in re.findall(r"\S+\s*", self.text):
+            await asyncio.sleep(self._delay() / 10)
+            yield _StreamChunk(piece)
+
+
+class FakeGemini:
+    def __init__(self, embed_latency_ms: float = 0.0, llm_latency_ms: float = 0.0,
+                 jitter: float = 0.2, embeddings: dict = None, seed: int = 0):
+        """
+        `embed_latency_ms` / `llm_latency_ms` are the mean delays per request; each delay
+        varies by ±`jitter` (as a share of the mean) from a seeded random generator.
+        `embeddings` maps text keys (see load_embeddings) to precomputed vectors.
+        """
+        self.embed_latency = embed_latency_ms / 1000
+        self.llm_latency = llm_latency_ms / 1000
+        self.jitter = jitter
+        self.embeddings = embeddings or {}
+        self.calls = {"embed": 0, "generate": 0}
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _delay(self, mean: float) -> float:
+        with self._lock:
+            return mean * (1 + self._random.uniform(-self.jitter, self.jitter)) if mean else 0.0
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.calls[kind] += 1
+
+    # Embeddings:
+
+    def _vector(self, text: str) -> list:
+        return self.embeddings.get(_text_key(text)) or hash_embedding(text)
+
+    def _embed(self, content):
+        if isinstance(content, str):
+            return {"embedding": self._vector(content)}
+        return {"embedding": [self._vector(t) for t in content]}
+
+    def embed_content(self, model=None, content=None, **kwargs):
+        self._count("embed")
+        time.sleep(self._delay(self.embed_latency))
+        return self._embed(content)
+
+    async def embed_content_async(self, model=None, content=None, **kwargs):
+        self._count("embed")
+        await asyncio.sleep(self._delay(self.embed_latency))
+        return self._embed(content)
+
+    # Generation:
+
+    def answer(self, prompt: str) -> str:
+        """
+        Deterministic reply for each prompt the pipeline sends.
+        """
+        # Reranker: score every chunk by word overlap with the query.
+        if "Return ONLY JSON" in prompt:
+            query = _between(prompt, "User query:", "Below are candidate chunks")
+            chunks = re.findall(r"\[CHUNK (\d+) \| (?:[^\]]+, )?Page \d+\]\n(.*?)(?=\n\n\[CHUNK |\Z)", prompt, re.S)
+            scores = [{"index": int(i), "score": 1 + round(4 * _overlap(query, text))} for i, text in chunks]
+            return str(scores).replace("'", '"')
+
+        # Numeric page selector: the chunk with the highest overlap.
+        if "Respond with ONLY a single integer" in prompt:
+            query = _between(prompt, "User query:", "Retrieved Chunks:")
+            chunks = _between(prompt, "Retrieved Chunks:", "Respond with ONLY").split("\n\n---\n\n")
+            if not chunks or not chunks[0]:
+                return "-1"
+            return str(max(range(len(chunks)), key=lambda i: _overlap(query, chunks[i])))
+
+        # Numeric extractor: the stand-in cannot read tables, so only local lookups score.
+        if "Now return ONLY the numeric result." in prompt:
+            return "NOT FOUND"
+
+        # Numeric phrasing:
+        if "Rewrite the numeric answer" in prompt:
+            value = _between(prompt, "Numeric result:", "Page reference:")
+            page = _between(prompt, "Page reference:", "Rules:")
+            return f"The value is {value} (page {page})."
+
+        # Normal answer: cite the pages in the context (of any shard).
+        pages = sorted(set(re.findall(r"\[(?:[^\]]+, )?Page (\d+)\]", prompt)), key=int)
+        return f"According to the manual, see page(s) {', '.join(pages) or '-'}."
+
+    def model_class(self):
+        """
+        A drop-in replacement for genai.GenerativeModel bound to this stand-in.
+        """
+        fake = self
+
+        class GenerativeModel:
+            def __init__(self, model_name=None, **kwargs):
+                self.model_name = model_name
+
+            def generate_content(self, prompt, stream=False, **kwargs):
+                fake._count("generate")
+                time.sleep(fake._delay(fake.llm_latency))
+                return _Response(prompt, fake.answer(prompt))
+
+            async def generate_content_async(self, prompt, stream=False, **kwargs):
+                fake._count("generate")
+                await asyncio.sleep(fake._delay(fake.llm_latency))
+                if stream:
+                    return _AsyncStream(prompt, fake.answer(prompt), lambda: fake._delay(fake.llm_latency))
+                return _Response(prompt, fake.answer(prompt))
+
+        return GenerativeModel
+
+
+def install(fake: FakeGemini):
+    """
+    Routes every Gemini call of the service modules to the stand-in.
+    """
+    genai.configure = lambda *args, **kwargs: None
+    genai.embed_content = fake.embed_content
+    genai.embed_content_async = fake.embed_content_async
+    genai.GenerativeModel = fake.model_class()
+    reset_models()
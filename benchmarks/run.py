@@ -0,0 +1,257 @@
+# Offline benchmark of retrieval and answer generation.
+# Gemini is replaced by the deterministic stand-in (fake_gemini.py), a temporary index is
+# built from the page text, and the golden set of text and numeric questions is run through
+# Retriever.search and generate_answer. Reports per-stage p50/p95/p99 latency (from the
+# tracing spans), throughput, page-level recall@k and numeric exact-match.
+#
+# Run from the repository root:
+#   python -m benchmarks.run
+#   python -m benchmarks.run --llm-latency-ms 800 --embed-latency-ms 120 --concurrency 4
+#   python -m benchmarks.run --min-recall 0.8 --min-exact-match 1.0   # exit code 1 on regression
+#   python -m benchmarks.run --embedding-backend local                  # local CPU embedder instead of the stand-in
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.fake_gemini import FakeGemini, install, load_embeddings
+from services.confidence import use_calibration
+from services.embedding_backends import create_backend
+from services.embedding_cache import EmbeddingCache
+from services.generator import generate_answer
+from services.index_factory import build_index, save_index
+from services.indexer import _embed_batch, normalize_page_text
+from services.lexical_index import build_lexical_index
+from services.page_store import build_page_store
+from services.records import iter_records
+from services.retriever import Retriever
+from services.shards import shard_meta_path
+from services.tracing import span, start_trace
+
+GOLDEN_SET_PATH = os.path.join(os.path.dirname(__file__), "golden_set.json")
+
+
+def build_temp_index(meta_path: str, workdir: str, index_type: str = "flat",
+                     embedding_backend: str = "gemini") -> dict:
+    """
+    Embeds every page with the stand-in (or the local embedder) and writes the index, page
+    store and BM25 index into `workdir`. Returns the Retriever arguments for these files.
+    """
+    records = list(iter_records(meta_path))
+    texts = [normalize_page_text(r["text"]) for r in records]
+
+    backend = create_backend(embedding_backend)
+    if backend.needs_fit:
+        backend.fit(texts)
+
+    vectors = []
+    for start in range(0, len(texts), 100):
+        vectors.extend(_embed_batch(texts[start:start + 100], backend))
+
+    paths = {
+        "index_path": os.path.join(workdir, "faiss.index"),
+        "meta_path": meta_path,
+        "lexical_path": os.path.join(workdir, "bm25.json"),
+        "text_store_path": os.path.join(workdir, "page_text.bin"),
+        "page_index_path": os.path.join(workdir, "page_text.idx.npy"),
+    }
+
+    index, params = build_index(vectors, [r["id"] for r in records], index_type)
+    backend.save(paths["index_path"])
+    save_index(index, paths["index_path"], index_type, params, backend.config())
+    build_page_store(meta_path, paths["text_store_path"], paths["page_index_path"])
+    build_lexical_index(meta_path, paths["lexical_path"])
+
+    return paths
+
+
+def _percentiles(values: list) -> dict:
+    return {
+        "n": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def _exact_match(answer: str, value: str) -> bool:
+    """
+    True if the expected value appears in the answer as a whole number (not inside a longer one).
+    Thousands separators are ignored ("1,840 m" matches "1840").
+    """
+    answer = re.sub(r"(?<=\d),(?=\d{3})", "", answer)
+    return re.search(rf"(?<![\d.]){re.escape(value)}(?![\d]|\.\d)", answer) is not None
+
+
+def run_question(retriever, item: dict, k: int) -> dict:
+    """
+    Answers one golden question and returns its spans, retrieved pages and answer.
+    """
+    trace = start_trace()
+    decision = {}
+
+    with span("retrieval_total"):
+        chunks = retriever.search(item["question"], top_k=k, decision=decision)
+    with span("generation_total"):
+        answer, _ = generate_answer(item["question"], chunks)
+
+    breakdown = trace.breakdown()
+    return {
+        "spans": breakdown["spans"],
+        "total_ms": breakdown["total_ms"],
+        "pages": [c["page"] for c in chunks],
+        "answer": answer,
+        "path": decision.get("path"),
+    }
+
+
+def run_benchmark(golden: list, k: int = 4, repeat: int = 3, concurrency: int = 1,
+                  index_type: str = "flat", meta_path: str = None, fake: FakeGemini = None,
+                  embedding_backend: str = "gemini") -> dict:
+    """
+    Runs the golden set `repeat` times and returns the report.
+    Accuracy is taken from the first round (the stand-in is deterministic).
+    """
+    fake = fake or FakeGemini()
+    install(fake)
+
+    meta_path = meta_path or shard_meta_path()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = build_temp_index(meta_path, workdir, index_type, embedding_backend)
+
+        # Caching is disabled so every round measures the real embedding path:
+        retriever = Retriever(embed_cache=EmbeddingCache(max_size=0), **paths)
+
+        items = [item for _ in range(repeat) for item in golden]
+        calls_before = dict(fake.calls)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            results = list(pool.map(lambda item: run_question(retriever, item, k), items))
+        wall_seconds = time.perf_counter() - started
+
+    stages = {}
+    for result in results:
+        for s in result["spans"]:
+            stages.setdefault(s["stage"], []).append(s["ms"])
+        stages.setdefault("total", []).append(result["total_ms"])
+
+    first_round = results[:len(golden)]
+    paths = {}
+    for result in first_round:
+        paths[result["path"]] = paths.get(result["path"], 0) + 1
+
+    recall_hits = {"text": [], "numeric": []}
+    exact = []
+    misses = []
+    for item, result in zip(golden, first_round):
+        hit = bool(set(item["pages"]) & set(result["pages"]))
+        recall_hits[item["type"]].append(hit)
+        matched = None
+        if item["type"] == "numeric":
+            matched = _exact_match(result["answer"], item["value"])
+            exact.append(matched)
+        if not hit or matched is False:
+            misses.append({"question": item["question"], "expected_pages": item["pages"],
+                           "pages": result["pages"], "answer": result["answer"]})
+
+    all_hits = recall_hits["text"] + recall_hits["numeric"]
+    return {
+        "questions": len(golden),
+        "rounds": repeat,
+        "concurrency": concurrency,
+        "index_type": index_type,
+        "embedding_backend": embedding_backend,
+        "throughput_qps": round(len(items) / wall_seconds, 2),
+        f"recall@{k}": round(sum(all_hits) / len(all_hits), 4) if all_hits else None,
+        f"recall@{k}_by_type": {t: round(sum(h) / len(h), 4) for t, h in recall_hits.items() if h},
+        "numeric_exact_match": round(sum(exact) / len(exact), 4) if exact else None,
+        "retrieval_paths": dict(sorted(paths.items(), key=lambda p: str(p[0]))),
+        "stages": {stage: _percentiles(values) for stage, values in sorted(stages.items())},
+        "gemini_calls": {kind: fake.calls[kind] - calls_before[kind] for kind in fake.calls},
+        "misses": misses,
+    }
+
+
+def print_report(report: dict, k: int):
+    print(f"[INFO] {report['questions']} questions x {report['rounds']} rounds, "
+          f"concurrency {report['concurrency']}, {report['index_type']} index, "
+          f"{report['embedding_backend']} embeddings")
+    print(f"  throughput       {report['throughput_qps']:.2f} questions/s")
+    print(f"  recall@{k}         {report[f'recall@{k}']}  {report[f'recall@{k}_by_type']}")
+    print(f"  numeric exact    {report['numeric_exact_match']}")
+    print(f"  retrieval paths  {report['retrieval_paths']}")
+    print(f"  gemini calls     {report['gemini_calls']}")
+    print(f"  {'stage':<20} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for stage, p in report["stages"].items():
+        print(f"  {stage:<20} {p['n']:>5} {p['p50_ms']:>10.3f} {p['p95_ms']:>10.3f} {p['p99_ms']:>10.3f}")
+    for miss in report["misses"]:
+        print(f"[WARN] Miss: {miss['question']} (expected {miss['expected_pages']}, got {miss['pages']})")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline retrieval/answer benchmark with a Gemini stand-in.")
+    parser.add_argument("--golden", default=GOLDEN_SET_PATH, help="golden set JSON")
+    parser.add_argument("--meta", default=None, help="page metadata (default: data/meta.jsonl or data/meta.json)")
+    parser.add_argument("--embeddings", default=None, help="precomputed embeddings (JSON/JSONL records with text, embedding)")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--embedding-backend", default="gemini", choices=("gemini", "local"),
+                        help="embed pages and questions with the stand-in (gemini) or the local CPU embedder")
+    parser.add_argument("--confidence", default=None,
+                        help="confidence gate thresholds (calibrate_confidence.py --offline); default: gate uncalibrated")
+    parser.add_argument("--output", default=None, help="write the report as JSON")
+    parser.add_argument("--min-recall", type=float, default=None, help="fail if recall@k is lower")
+    parser.add_argument("--min-exact-match", type=float, default=None, help="fail if numeric exact-match is lower")
+    args = parser.parse_args(argv)
+
+    with open(args.golden, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+
+    # Thresholds calibrated on Gemini embeddings do not fit the stand-in's, so data/confidence.json is not used:
+    if args.confidence:
+        with open(args.confidence, "r", encoding="utf-8") as f:
+            use_calibration(json.load(f))
+    else:
+        use_calibration({})
+
+    fake = FakeGemini(
+        embed_latency_ms=args.embed_latency_ms,
+        llm_latency_ms=args.llm_latency_ms,
+        embeddings=load_embeddings(args.embeddings) if args.embeddings else None,
+    )
+    report = run_benchmark(golden, k=args.k, repeat=args.repeat, concurrency=args.concurrency,
+                           index_type=args.index_type, meta_path=args.meta, fake=fake,
+                           embedding_backend=args.embedding_backend)
+    print_report(report, args.k)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    failed = False
+    if args.min_recall is not None and report[f"recall@{args.k}"] < args.min_recall:
+        print(f"[ERROR] recall@{args.k} {report[f'recall@{args.k}']} is below {args.min_recall}")
+        failed = True
+    if (args.min_exact_match is not None and report["numeric_exact_match"] is not None
+            and report["numeric_exact_match"] < args.min_exact_match):
+        print(f"[ERROR] Numeric exact-match {report['numeric_exact_match']} is below {args.min_exact_match}")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+# This script adds one manual to the fleet library as a shard of the sharded index
+# (data/shards/<id>/, see services/shards.py), or applies a new revision of it.
+# Only this manual is embedded; the other shards and the running API are not touched
+# until the shard's manifest is written, after which the API picks it up on its next request.
+#
+#   python build_shard.py --id b737-800-fcom --pdf "data/Boeing B737 Manual.pdf" --aircraft B737 --document FCOM --variant 800
+#   python build_shard.py --id b737-800-fcom --pdf "data/Boeing B737 Manual rev2.pdf" --update
+
+import argparse
+import os
+
+from services.index_factory import parse_index_params
+from services.shard_builder import build_shard, update_shard
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update one shard of the sharded index.")
+    parser.add_argument("--id", required=True, help="shard id, e.g. b737-800-fcom")
+    parser.add_argument("--pdf", required=True, help="the manual's PDF")
+    parser.add_argument("--aircraft", default=None, help="aircraft type, e.g. B737")
+    parser.add_argument("--document", default=None, help="document type, e.g. FCOM, QRH, AFM")
+    parser.add_argument("--variant", default=None, help="aircraft variant or revision, e.g. 800")
+    parser.add_argument("--update", action="store_true",
+                        help="re-index only the changed pages of an existing shard")
+    args = parser.parse_args()
+
+    if args.update:
+        result = update_shard(args.id, args.pdf, batch_size=32, max_workers=4)
+        print(f"Re-indexed {result['changed']} pages of {args.id}, removed {result['removed']}, "
+              f"failed {result['failed']}.")
+        return
+
+    count = build_shard(
+        args.id,
+        args.pdf,
+        {"aircraft": args.aircraft, "document": args.document, "variant": args.variant},
+        batch_size=32,
+        max_workers=4,
+        index_type=os.getenv("FAISS_INDEX_TYPE", "flat"),
+        index_params=parse_index_params(os.getenv("FAISS_INDEX_PARAMS")),
+        embedding_backend=os.getenv("EMBEDDING_BACKEND", "gemini")
+    )
+    print(f"Built shard {args.id} with {count} pages.")
+
+
+if __name__ == "__main__":
+    main()
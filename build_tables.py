@@ -1,9 +1,39 @@
-# This script extracts tables directly from the PDF and saves them to tables.json.
-
-from services.table_extractor import extract_tables_pdf
-
-PDF_PATH = "data/Boeing B737 Manual.pdf"  
-OUTPUT_JSON = "data/tables.json"
-
-# Extract and save all tables from the PDF:
-extract_tables_pdf(PDF_PATH, OUTPUT_JSON)
+# This script extracts tables directly from the PDF and saves them to tables.json.
+# It then builds the compact, page-indexed table store used at query time,
+# the table router, the page digests used in LLM prompts and the page metadata used by search filters.
+
+from services.page_digest import build_digests
+from services.page_meta import build_page_meta
+from services.table_extractor import extract_tables_pdf
+from services.table_router import build_table_router
+from services.table_store import build_table_store
+
+PDF_PATH = "data/Boeing B737 Manual.pdf"  
+OUTPUT_JSON = "data/tables.json"
+STORE_JSON = "data/table_store.json"
+ROUTER_JSON = "data/table_router.json"
+DIGESTS_JSON = "data/digests.json"
+PAGE_META_JSON = "data/page_meta.json"
+PAGES_JSON = "data/pages.json"     # Page text from extract_pages.py (titles and printed conditions)
+
+# Extraction runs in a process pool, so the script body must only run in the main process:
+if __name__ == "__main__":
+
+    # Extract and save all tables from the PDF (pages are split across all CPU cores):
+    extract_tables_pdf(PDF_PATH, OUTPUT_JSON)
+
+    # Serialize each table once (pipe-delimited) and index it by page:
+    count = build_table_store(OUTPUT_JSON, STORE_JSON)
+    print(f"[INFO] Stored {count} unique tables in {STORE_JSON}.")
+
+    # Index the table pages (titles, axes, units, conditions) for local numeric page routing:
+    routed = build_table_router(OUTPUT_JSON, PAGES_JSON, ROUTER_JSON)
+    print(f"[INFO] Routed {routed} table pages in {ROUTER_JSON}.")
+
+    # Compact per-page digests (title, table headers, key sentences) for the reranker and page selector:
+    digested = build_digests(PAGES_JSON, OUTPUT_JSON, DIGESTS_JSON)
+    print(f"[INFO] Wrote {digested} page digests to {DIGESTS_JSON}.")
+
+    # Chapter and data-table flag per page, for filtered searches:
+    described = build_page_meta(PAGES_JSON, OUTPUT_JSON, PAGE_META_JSON)
+    print(f"[INFO] Wrote metadata of {described} pages to {PAGE_META_JSON}.")
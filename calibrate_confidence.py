@@ -0,0 +1,105 @@
+# This script calibrates the retrieval confidence gate (services/confidence.py).
+# Every question of a held-out labelled set (benchmarks/calibration_set.json, disjoint from the
+# golden set the benchmark scores) is embedded and searched in FAISS; from the distances and
+# the position of the correct page it derives, per query type, the top-hit gap at which the
+# Gemini rerank/select stage can be skipped and how many candidates to keep.
+# The thresholds are written to data/confidence.json, which the API loads on start.
+#
+#   python calibrate_confidence.py                              # Gemini embeddings, data/faiss.index
+#   python calibrate_confidence.py --offline --output /tmp/c.json   # stand-in embeddings, temporary index
+
+import argparse
+import json
+import tempfile
+
+import numpy as np
+
+from services.confidence import CONFIDENCE_PATH, MAX_EXPAND_K, calibrate
+from services.embedding_cache import EmbeddingCache, normalize_query
+from services.query_type import is_numeric_query
+from services.shards import shard_meta_path
+from services.retriever import Retriever
+
+CALIBRATION_SET_PATH = "benchmarks/calibration_set.json"
+GOLDEN_PATH = "benchmarks/golden_set.json"
+
+
+def overlap(labelled: list, golden: list) -> list:
+    """
+    Questions of the calibration set that also appear in the golden set (ignoring case,
+    spacing and trailing punctuation). Calibrating on those would let the benchmark grade the
+    gate on the questions it was tuned on.
+    """
+    scored = {normalize_query(item["question"]) for item in golden}
+    return [item["question"] for item in labelled if normalize_query(item["question"]) in scored]
+
+
+def collect_samples(retriever, labelled: list) -> list:
+    """
+    FAISS distances and the rank of the first correct page for each labelled question.
+    The query type is decided as at query time (is_numeric_query), not taken from the labels.
+    """
+    samples = []
+    for item in labelled:
+        vec = retriever.embed_query(item["question"])
+        if vec is None:
+            print(f"[WARN] Could not embed: {item['question']}")
+            continue
+
+        candidates, distances = retriever._search_rows(np.array([vec]).astype("float32"), MAX_EXPAND_K)[0]
+        pages = [c["page"] for c in candidates]
+        rank = next((i for i, page in enumerate(pages) if page in item["pages"]), None)
+
+        samples.append({
+            "type": "numeric" if is_numeric_query(item["question"]) else "text",
+            "distances": distances,
+            "rank": rank,
+        })
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the retrieval confidence gate.")
+    parser.add_argument("--labels", default=CALIBRATION_SET_PATH, help="held-out labelled questions (question, pages)")
+    parser.add_argument("--output", default=None, help=f"where to write the thresholds (default {CONFIDENCE_PATH})")
+    parser.add_argument("--offline", action="store_true",
+                        help="use the Gemini stand-in and a temporary index (thresholds only fit the stand-in)")
+    args = parser.parse_args()
+
+    with open(args.labels, "r", encoding="utf-8") as f:
+        labelled = json.load(f)
+    with open(GOLDEN_PATH, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+
+    shared = overlap(labelled, golden)
+    if shared:
+        print(f"[ERROR] {len(shared)} calibration questions are also in {GOLDEN_PATH}, e.g.: {shared[0]}")
+        raise SystemExit(1)
+
+    if args.offline:
+        from benchmarks.fake_gemini import FakeGemini, install
+        from benchmarks.run import build_temp_index
+
+        install(FakeGemini())
+        with tempfile.TemporaryDirectory() as workdir:
+            paths = build_temp_index(shard_meta_path(), workdir)
+            samples = collect_samples(Retriever(embed_cache=EmbeddingCache(max_size=0), **paths), labelled)
+        output = args.output
+    else:
+        samples = collect_samples(Retriever(), labelled)
+        output = args.output or CONFIDENCE_PATH
+
+    calibration = calibrate(samples)
+    for query_type, t in calibration.items():
+        print(f"[INFO] {query_type}: skip_gap={t['skip_gap']} margin={t['margin']} "
+              f"skips {t['skip_share']:.0%} of {t['samples']} questions (precision {t['skip_precision']}), "
+              f"{t['missed']} without the correct page in the top {MAX_EXPAND_K}")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(calibration, f, indent=2)
+        print(f"[INFO] Wrote {output}.")
+
+
+if __name__ == "__main__":
+    main()
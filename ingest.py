@@ -0,0 +1,30 @@
+# This script runs the whole preprocessing in one streaming pass:
+# the PDF is opened once, and every page is chunked, embedded and scanned for tables
+# as it is read. Artifacts are written as append-only JSONL (data/meta.jsonl, data/tables.jsonl),
+# so memory stays flat however large the document set is.
+# (It replaces running extract_pages.py, create_chunks.py, build_tables.py and build_indexer.py one by one.)
+
+import os
+
+from services.index_factory import parse_index_params
+from services.ingest import ingest_pdf
+
+PDF_PATH = "data/Boeing B737 Manual.pdf"
+
+
+def main():
+    count = ingest_pdf(
+        PDF_PATH,
+        batch_size=32,
+        max_workers=4,
+        index_type=os.getenv("FAISS_INDEX_TYPE", "flat"),
+        index_params=parse_index_params(os.getenv("FAISS_INDEX_PARAMS")),
+        embedding_backend=os.getenv("EMBEDDING_BACKEND", "gemini")
+    )
+    print(f"Ingested {count} pages.")
+
+
+# Tables are extracted in a process pool, whose workers re-import this script when they are
+# spawned (macOS, Windows), so the run must only start in the main process:
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,155 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from services.retriever import Retriever
-from services.generator import generate_answer
-
-app = FastAPI()
-
-# Initialize retriever only once
-retriever = Retriever()
-
-class QueryRequest(BaseModel):
-    question: str
-
-
-@app.post("/query")
-def query_api(payload: QueryRequest):
-
-    query = payload.question
-
-    # Let retriever internally decide:
-    # - numeric mode → Gemini page selector
-    # - normal mode → reranker
-    retrieved = retriever.search(query)
-
-    # Generate grounded answer
-    answer, pages = generate_answer(query, retrieved)
-
-    return {
-        "answer": answer,
-        "pages": pages
-    }
-
-
-# Run via: python main.py
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+import json
+
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from services.governor import Overloaded
+from services.metrics import render_metrics
+from services.retriever import Retriever
+from services.pipeline import QueryPipeline
+from services.sharded_retriever import ShardedRetriever
+from services.shards import list_shards
+from services.tracing import record_stream_error, start_trace
+
+app = FastAPI()
+
+# Initialize retriever only once (over all manuals in data/shards/ if there are any, else data/)
+retriever = ShardedRetriever() if list_shards() else Retriever()
+
+# Answering pipeline with a semantic answer cache in front of retrieval and generation:
+pipeline = QueryPipeline(retriever)
+
+def overloaded_response(error: Overloaded):
+    """
+    503 with Retry-After, returned when the governor cannot admit a question.
+    """
+    return JSONResponse(
+        status_code=503,
+        content={"error": str(error), "retry_after": error.retry_after},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def invalid_filters_response(filters: dict):
+    """
+    400 for a metadata filter the index cannot apply, else None.
+    """
+    try:
+        retriever.check_filters(filters)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return None
+
+
+class QueryRequest(BaseModel):
+    question: str
+    # Restricts the search, e.g. {"aircraft": "B737", "document": "FCOM", "chapter": "NP", "has_tables": true}
+    filters: dict | None = None
+
+
+class BatchQueryRequest(BaseModel):
+    questions: list[str]
+    filters: dict | None = None
+
+
+@app.post("/query")
+async def query_api(payload: QueryRequest, x_debug_timing: str = Header(default=None)):
+
+    query = payload.question
+
+    # With an "X-Debug-Timing: 1" (or "true") header the response also carries the per-stage
+    # timings (wall time, Gemini tokens, fallbacks and the query-type branch) of this request.
+    # A coalesced request ran no stages itself, so its breakdown only has its total wait:
+    debug_timing = (x_debug_timing or "").strip().lower() in ("1", "true")
+    trace = start_trace() if debug_timing else None
+
+    invalid = invalid_filters_response(payload.filters)
+    if invalid is not None:
+        return invalid
+
+    # Answers near-identical questions from the cache; otherwise retrieves and generates.
+    # (All Gemini and FAISS calls are non-blocking, so one worker can serve many questions at once.)
+    # Under overload the question is turned away at once instead of queueing behind timeouts:
+    try:
+        result = await pipeline.answer_async(query, payload.filters)
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    if trace is not None:
+        result["timings"] = trace.breakdown()
+    return result
+
+
+@app.post("/query/stream")
+async def query_stream_api(payload: QueryRequest):
+    """
+    Server-sent events version of /query for clients that care about time-to-first-byte:
+    the chosen pages are sent as soon as retrieval finishes ("retrieval" event), then the
+    answer is streamed piece by piece ("token" events), and a final "done" event carries
+    the cited pages. A failure after the response has started ends the stream with an
+    "error" event instead of "done".
+    """
+    invalid = invalid_filters_response(payload.filters)
+    if invalid is not None:
+        return invalid
+
+    events = pipeline.stream_async(payload.question, payload.filters)
+
+    # The first event is awaited before the response starts, so a question the governor
+    # turns away still gets a proper 503:
+    try:
+        first = await events.__anext__()
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def event_stream():
+        yield sse(*first)
+        try:
+            async for event, data in events:
+                yield sse(event, data)
+        except Exception as e:
+            print("[ERROR] Stream failed:", e)
+            record_stream_error("pipeline")
+            yield sse("error", {"error": str(e) or type(e).__name__})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream:
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/query/batch")
+async def query_batch_api(payload: BatchQueryRequest):
+    """
+    Answers many questions in one request (e.g. nightly dispatch preparation).
+    Embeddings are batched and FAISS runs a single search for the whole batch;
+    results come back in the order of the questions, each with its own error if it failed.
+    """
+    invalid = invalid_filters_response(payload.filters)
+    if invalid is not None:
+        return invalid
+
+    try:
+        return {"results": await pipeline.answer_batch_async(payload.questions, filters=payload.filters)}
+    except Overloaded as e:
+        return overloaded_response(e)    # Not even the batch's embeddings could be sent
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_api():
+    """
+    Prometheus scrape endpoint: stage latency histograms, Gemini token counters,
+    fallback, query-type and cache counters (per worker process).
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# Run via: python main.py
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,170 @@
+# Semantic answer cache: near-identical questions reuse an earlier answer instead of
+# running the whole selector → extractor → formatter chain again.
+# Two questions match when their query embeddings are close enough and they mention
+# exactly the same numbers ("flaps 5" and "flaps 15" embed almost alike).
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from services.embedding_cache import normalize_query
+from services.query_type import is_numeric_query
+from services.tracing import record_cache
+
+DEFAULT_THRESHOLD = 0.05      # Max cosine distance between two queries to count as the same question
+DEFAULT_MAX_SIZE = 512
+DEFAULT_TTL_SECONDS = 3600
+
+
+def extract_query_numbers(query: str) -> tuple:
+    """
+    Returns the numbers mentioned in a query as a sorted tuple, ignoring units and
+    thousands separators, so "2,000 ft, 30°C" and "30 C at 2000ft" give the same result.
+    """
+    numbers = re.findall(r"\d[\d,]*(?:\.\d+)?", query)
+    return tuple(sorted(float(n.replace(",", "")) for n in numbers))
+
+
+class AnswerCache:
+    def __init__(self,
+                 threshold: float = DEFAULT_THRESHOLD,
+                 max_size: int = DEFAULT_MAX_SIZE,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 watch_paths: tuple = ("data/faiss.index", "data/tables.json")):
+        """
+        Stores final answers keyed by query embedding.
+        Entries expire after `ttl_seconds`, the oldest entries are evicted beyond `max_size`,
+        and the whole cache is cleared when any file in `watch_paths` changes on disk.
+        """
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.watch_paths = tuple(watch_paths)
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = self._artifact_fingerprint()
+
+    def _artifact_fingerprint(self) -> tuple:
+        """
+        Modification time and size of the index/table files the cached answers were built from.
+        """
+        fingerprint = []
+        for path in self.watch_paths:
+            try:
+                st = os.stat(path)
+                fingerprint.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                fingerprint.append((path, None, None))
+        return tuple(fingerprint)
+
+    def _check_artifacts(self):
+        """
+        Drops every cached answer if the FAISS index or table data changed since it was cached.
+        Must be called with the lock held.
+        """
+        current = self._artifact_fingerprint()
+        if current != self._fingerprint:
+            self._entries.clear()
+            self._fingerprint = current
+
+    def _evict_expired(self, now: float):
+        expired = [k for k, e in self._entries.items() if now - e["created_at"] > self.ttl_seconds]
+        for k in expired:
+            del self._entries[k]
+
+    def lookup(self, query: str, query_vec, scope: str = ""):
+        """
+        Returns (answer, pages, sources) of a previously answered, equivalent question with
+        the same search filter (`scope`), or None.
+        """
+        vec = np.asarray(query_vec, dtype="float32")
+        numeric = is_numeric_query(query)
+        numbers = extract_query_numbers(query)
+
+        with self._lock:
+            self._check_artifacts()
+            self._evict_expired(time.time())
+
+            best_key, best_dist = None, None
+            for key, entry in self._entries.items():
+                if entry["numeric"] != numeric or entry["scope"] != scope:
+                    continue
+
+                # Answers depend on the exact values (flap setting, engine number, weight),
+                # not just the wording:
+                if entry["numbers"] != numbers:
+                    continue
+
+                dist = 1.0 - float(np.dot(vec, entry["vec"]) / (np.linalg.norm(vec) * entry["norm"] + 1e-12))
+                if dist <= self.threshold and (best_dist is None or dist < best_dist):
+                    best_key, best_dist = key, dist
+
+            if best_key is None:
+                self.misses += 1
+                record_cache("answer", False)
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            record_cache("answer", True)
+            entry = self._entries[best_key]
+            return entry["answer"], list(entry["pages"]), entry["sources"]
+
+    def store(self, query: str, query_vec, answer: str, pages: list, scope: str = "", sources: list = None):
+        """
+        Caches a final answer. Failed lookups (no pages, NOT FOUND) are not cached.
+        `sources` are the (shard, page) references of an answer from a sharded index.
+        """
+        if not pages or answer.startswith("NOT FOUND"):
+            return
+
+        vec = np.asarray(query_vec, dtype="float32")
+
+        with self._lock:
+            self._check_artifacts()
+
+            key = f"{scope}::{normalize_query(query)}" if scope else normalize_query(query)
+            self._entries[key] = {
+                "scope": scope,
+                "sources": sources,
+                "vec": vec,
+                "norm": float(np.linalg.norm(vec)),
+                "numeric": is_numeric_query(query),
+                "numbers": extract_query_numbers(query),
+                "answer": answer,
+                "pages": list(pages),
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def answer_cache_from_env(watch_paths: tuple) -> AnswerCache:
+    """
+    Builds the answer cache from environment settings:
+    ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE and ANSWER_CACHE_TTL (seconds).
+    """
+    return AnswerCache(
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", DEFAULT_THRESHOLD)),
+        max_size=int(os.getenv("ANSWER_CACHE_SIZE", DEFAULT_MAX_SIZE)),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+        watch_paths=watch_paths
+    )
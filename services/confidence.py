@@ -0,0 +1,157 @@
+# Confidence gate between the FAISS search and the LLM stages of retrieval.
+# Many questions have an obvious top hit: its FAISS distance is well below the runner-up's.
+# For those the Gemini reranker / numeric page selector would only confirm FAISS, so the
+# gate skips them. It also decides how many candidates go on to the later stages:
+# questions with a clear winner keep only a few, questions with many near-ties keep more.
+# The thresholds are calibrated offline per query type (calibrate_confidence.py, written to
+# data/confidence.json). They depend on the embedder and the index, so none are shipped: until
+# the script has been run, nothing is skipped and DEFAULT_EXPAND_K candidates are kept, as before.
+
+import json
+import os
+import threading
+
+import numpy as np
+
+from services.metrics import Counter
+
+CONFIDENCE_PATH = "data/confidence.json"
+
+DEFAULT_EXPAND_K = 8       # Candidates kept without calibration
+MIN_EXPAND_K = 4           # Never fewer than this (the text path returns top_k=4 pages)
+MAX_EXPAND_K = 16          # FAISS is searched this deep, then the candidate list is cut
+
+TARGET_PRECISION = 0.95    # Share of skipped questions whose FAISS top hit must be right
+TARGET_RECALL = 0.95       # Share of questions whose correct page must survive the cut
+# A query type needs at least this many confident samples to skip. Below 30 a single wrong
+# top hit moves the measured precision by more than the 5% that TARGET_PRECISION allows:
+MIN_SAMPLES = 30
+
+GATE_DECISIONS = Counter("rag_gate_decisions_total", "How retrieval chose its pages, by query type.", ("query_type", "path"))
+
+_lock = threading.Lock()
+_calibration = None
+
+
+def top_gap(distances: list):
+    """
+    FAISS distance between the best and the second-best candidate (None with fewer than two).
+    """
+    if len(distances) < 2:
+        return None
+    return float(distances[1] - distances[0])
+
+
+def _load_calibration() -> dict:
+    """
+    Loads data/confidence.json on first use; an empty dict if it has not been calibrated.
+    """
+    global _calibration
+
+    with _lock:
+        if _calibration is None:
+            if os.path.exists(CONFIDENCE_PATH):
+                with open(CONFIDENCE_PATH, "r", encoding="utf-8") as f:
+                    _calibration = json.load(f)
+            else:
+                print("[INFO] No confidence calibration; every question goes through rerank/select.")
+                _calibration = {}
+
+    return _calibration
+
+
+def reset_calibration():
+    """
+    Forgets the loaded thresholds (used after the index has been updated).
+    """
+    global _calibration
+
+    with _lock:
+        _calibration = None
+
+
+def use_calibration(calibration: dict):
+    """
+    Replaces the loaded thresholds, e.g. to benchmark a calibration that is not in data/.
+    """
+    global _calibration
+
+    with _lock:
+        _calibration = dict(calibration)
+
+
+def gate(query_type: str, distances: list) -> dict:
+    """
+    Decides, from the FAISS distances of one question, how many candidates to keep and
+    whether the top hit is clear enough to skip the LLM rerank/select stage.
+    """
+    thresholds = _load_calibration().get(query_type, {})
+
+    margin = thresholds.get("margin")
+    if margin is None:
+        keep = DEFAULT_EXPAND_K
+    else:
+        # Every candidate within `margin` of the top hit, within [MIN_EXPAND_K, MAX_EXPAND_K]:
+        keep = sum(1 for d in distances if d - distances[0] <= margin)
+        keep = max(MIN_EXPAND_K, min(MAX_EXPAND_K, keep))
+
+    gap = top_gap(distances)
+    skip_gap = thresholds.get("skip_gap")
+    confident = len(distances) == 1 or (gap is not None and skip_gap is not None and gap >= skip_gap)
+
+    return {
+        "query_type": query_type,
+        "candidates": min(keep, len(distances)),
+        "gap": None if gap is None else round(gap, 4),
+        "skip_gap": skip_gap,
+        "confident": confident,
+    }
+
+
+def record_path(decision: dict, path: str):
+    """
+    Notes which stage chose the pages (table_router, faiss_confident, numeric_selector,
+    hybrid_rerank, llm_rerank, or a fallback) in the decision and the metrics.
+    """
+    decision["path"] = path
+    decision["llm_skipped"] = path not in ("numeric_selector", "llm_rerank")
+    GATE_DECISIONS.inc(query_type=decision["query_type"], path=path)
+
+
+def calibrate(samples: list) -> dict:
+    """
+    Thresholds per query type from labelled samples {"type", "distances", "rank"}, where
+    `rank` is the position of the first correct page among the MAX_EXPAND_K candidates
+    (None if it was not retrieved).
+    - skip_gap: the lowest top gap at which the FAISS top hit is right for at least
+      TARGET_PRECISION of the questions with that gap or more (None if never).
+    - margin: the distance from the top hit within which the correct page lies for
+      TARGET_RECALL of the questions.
+    """
+    calibration = {}
+
+    for query_type in sorted({s["type"] for s in samples}):
+        typed = [s for s in samples if s["type"] == query_type and len(s["distances"]) >= 2]
+
+        # Walk down from the largest gap; every prefix is the set of questions that would be skipped:
+        ordered = sorted(typed, key=lambda s: top_gap(s["distances"]), reverse=True)
+        skip_gap, correct = None, 0
+        for n, sample in enumerate(ordered, start=1):
+            correct += sample["rank"] == 0
+            if n >= MIN_SAMPLES and correct / n >= TARGET_PRECISION:
+                skip_gap = top_gap(sample["distances"])
+
+        needed = [s["distances"][s["rank"]] - s["distances"][0] for s in typed if s["rank"] is not None]
+        margin = float(np.quantile(needed, TARGET_RECALL)) if needed else None
+
+        skipped = [s for s in typed if skip_gap is not None and top_gap(s["distances"]) >= skip_gap]
+        calibration[query_type] = {
+            "skip_gap": skip_gap,
+            "margin": margin,
+            "samples": len(typed),
+            "skip_share": round(len(skipped) / len(typed), 4) if typed else 0.0,
+            "skip_precision": round(sum(s["rank"] == 0 for s in skipped) / len(skipped), 4) if skipped else None,
+            "missed": sum(s["rank"] is None for s in typed),
+        }
+
+    return calibration
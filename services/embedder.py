@@ -1,25 +1,88 @@
-from dotenv import load_dotenv
-load_dotenv()     # Loads the Gemini API key from the .env file
-import os
-import google.generativeai as genai
-
-# Setting up the Gemini model:
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-EMBED_MODEL = "models/text-embedding-004"
-
-def embed_text(text: str):
-    """
-    Converts a text string into a numerical embedding vector for similarity search using FAISS.
-    """
-    try:
-        response = genai.embed_content(
-            model=EMBED_MODEL,
-            content=text
-        )
-        return response["embedding"]
-    
-    # Fallback in case of error:
-    except Exception as e:
-        print("Embedding error:", e)
-        return None
+# Gemini calls go through the shared client (configured once, with timeouts and retries):
+from services.governor import Overloaded
+from services.llm_client import embed, embed_async
+
+EMBED_MODEL = "models/text-embedding-004"
+MAX_BATCH_SIZE = 100    # Upper limit of texts the Gemini API accepts in one embedding request
+
+def embed_text(text: str):
+    """
+    Converts a text string into a numerical embedding vector for similarity search using FAISS.
+    """
+    try:
+        response = embed(EMBED_MODEL, text)
+        return response["embedding"]
+    
+    # Over the rate limit: the question is rejected (503) rather than answered without context:
+    except Overloaded:
+        raise
+
+    # Fallback in case of error:
+    except Exception as e:
+        print("Embedding error:", e)
+        return None
+
+
+def embed_texts(texts: list):
+    """
+    Embeds a batch of texts with a single Gemini request.
+    Returns one vector per input text (in the same order), or None if the request failed.
+    """
+    if not texts:
+        return []
+
+    if len(texts) > MAX_BATCH_SIZE:
+        raise ValueError(f"Cannot embed more than {MAX_BATCH_SIZE} texts in one request.")
+
+    try:
+        response = embed(EMBED_MODEL, list(texts))
+        return response["embedding"]
+
+    except Overloaded:
+        raise
+
+    # Fallback in case of error:
+    except Exception as e:
+        print("Batch embedding error:", e)
+        return None
+
+
+async def embed_text_async(text: str):
+    """
+    Async counterpart of embed_text(); awaits the Gemini request without blocking the event loop.
+    """
+    try:
+        response = await embed_async(EMBED_MODEL, text)
+        return response["embedding"]
+
+    # Over the rate limit: the question is rejected (503) rather than answered without context:
+    except Overloaded:
+        raise
+
+    # Fallback in case of error:
+    except Exception as e:
+        print("Embedding error:", e)
+        return None
+
+
+async def embed_texts_async(texts: list):
+    """
+    Async counterpart of embed_texts().
+    """
+    if not texts:
+        return []
+
+    if len(texts) > MAX_BATCH_SIZE:
+        raise ValueError(f"Cannot embed more than {MAX_BATCH_SIZE} texts in one request.")
+
+    try:
+        response = await embed_async(EMBED_MODEL, list(texts))
+        return response["embedding"]
+
+    except Overloaded:
+        raise
+
+    # Fallback in case of error:
+    except Exception as e:
+        print("Batch embedding error:", e)
+        return None
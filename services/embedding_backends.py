@@ -0,0 +1,223 @@
+# Embedding backends: the same interface for the index build and for queries.
+# - "gemini": Gemini text-embedding-004 over the network (the default).
+# - "local": CPU-only. Pages and queries are turned into hashed word/bigram TF-IDF features and
+#   projected onto the main directions of the page corpus (a truncated SVD learned when the
+#   index is built, i.e. LSA). A query is embedded in microseconds with a few NumPy operations
+#   and without any network call, for low-latency and air-gapped deployments.
+# The backend that built an index is recorded in its config (<index>.json, "embedding"), and
+# the Retriever always embeds queries with that backend, so query and page vectors always match.
+
+import hashlib
+import os
+import re
+import zlib
+
+import numpy as np
+
+from services.embedder import (EMBED_MODEL, MAX_BATCH_SIZE, embed_text, embed_text_async,
+                               embed_texts, embed_texts_async)
+
+BACKENDS = ("gemini", "local")
+
+LOCAL_FEATURES = 2 ** 15     # Hashed feature space (words and word bigrams)
+LOCAL_DIMENSION = 256        # Vector size (at most one per indexed page)
+LOCAL_FIT_CHUNK = 256        # Pages per block of the feature matrix while fitting
+LOCAL_POWER_ITERATIONS = 2   # Sharpens the randomized SVD
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def model_path_for(index_path: str) -> str:
+    """
+    File holding a fitted local backend, next to the index: data/faiss.index.embedder.npz
+    """
+    return index_path + ".embedder.npz"
+
+
+class GeminiBackend:
+    name = "gemini"
+    needs_fit = False
+    cacheable = True            # Query vectors are worth caching (each one is a network call)
+    max_batch_size = MAX_BATCH_SIZE
+
+    def __init__(self, model: str = EMBED_MODEL):
+        self.model = model
+        self.key = model           # Also the embedding cache key prefix used before backends existed
+
+    def fit(self, texts: list):
+        pass
+
+    def embed_text(self, text: str):
+        return embed_text(text)
+
+    def embed_texts(self, texts: list):
+        return embed_texts(texts)
+
+    async def embed_text_async(self, text: str):
+        return await embed_text_async(text)
+
+    async def embed_texts_async(self, texts: list):
+        return await embed_texts_async(texts)
+
+    def config(self) -> dict:
+        return {"backend": self.name, "model": self.model}
+
+    def save(self, index_path: str):
+        pass
+
+
+class LocalBackend:
+    name = "local"
+    cacheable = False           # Embedding is cheaper than a cache lookup
+    max_batch_size = 10000
+
+    def __init__(self, idf=None, projection=None):
+        """
+        `idf` (per hashed feature) and `projection` (features x dimension) come from fit()
+        or from a saved model; an unfitted backend cannot embed.
+        """
+        self.idf = idf
+        self.projection = projection
+        self.needs_fit = projection is None
+        self.key = f"local:{self.fingerprint()}" if projection is not None else "local:unfitted"
+
+    def fingerprint(self) -> str:
+        digest = hashlib.sha1(np.ascontiguousarray(self.projection).tobytes())
+        digest.update(np.ascontiguousarray(self.idf).tobytes())
+        return digest.hexdigest()[:12]
+
+    @staticmethod
+    def _features(text: str):
+        """
+        Hashed word and bigram counts of a text: (feature ids, sublinear term weights).
+        """
+        words = _WORD_RE.findall(text.lower())
+        terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not terms:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+
+        ids = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in terms), dtype="int64", count=len(terms))
+        ids, counts = np.unique(ids % LOCAL_FEATURES, return_counts=True)
+        return ids, (1.0 + np.log(counts)).astype("float32")
+
+    def _tfidf_rows(self, texts: list, idf) -> np.ndarray:
+        """
+        Dense, L2-normalized TF-IDF rows for a block of texts (only used while fitting).
+        """
+        rows = np.zeros((len(texts), LOCAL_FEATURES), dtype="float32")
+        for r, text in enumerate(texts):
+            ids, weights = self._features(text)
+            rows[r, ids] = weights * idf[ids]
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        return rows / np.maximum(norms, 1e-12)
+
+    def fit(self, texts: list):
+        """
+        Learns the IDF weights and a LOCAL_DIMENSION-dimensional projection from the page
+        texts with a randomized truncated SVD. The feature matrix is only ever built in
+        blocks of LOCAL_FIT_CHUNK pages.
+        """
+        texts = list(texts)
+        n = len(texts)
+        if n == 0:
+            raise ValueError("Cannot fit the local embedding backend without any text.")
+
+        df = np.zeros(LOCAL_FEATURES, dtype="float32")
+        for text in texts:
+            df[self._features(text)[0]] += 1
+        idf = np.log((1 + n) / (1 + df)).astype("float32") + 1.0
+
+        blocks = [texts[i:i + LOCAL_FIT_CHUNK] for i in range(0, n, LOCAL_FIT_CHUNK)]
+
+        def times(matrix):          # X @ matrix, block by block
+            return np.vstack([self._tfidf_rows(b, idf) @ matrix for b in blocks])
+
+        def transposed_times(matrix):   # X.T @ matrix, block by block
+            total = np.zeros((LOCAL_FEATURES, matrix.shape[1]), dtype="float32")
+            for i, b in enumerate(blocks):
+                total += self._tfidf_rows(b, idf).T @ matrix[i * LOCAL_FIT_CHUNK:(i + 1) * LOCAL_FIT_CHUNK]
+            return total
+
+        dimension = min(LOCAL_DIMENSION, n)
+        sketch = min(dimension + 10, n)
+        rng = np.random.default_rng(0)
+
+        q, _ = np.linalg.qr(times(rng.standard_normal((LOCAL_FEATURES, sketch)).astype("float32")))
+        for _ in range(LOCAL_POWER_ITERATIONS):
+            z, _ = np.linalg.qr(transposed_times(q))
+            q, _ = np.linalg.qr(times(z))
+
+        _, _, vt = np.linalg.svd(transposed_times(q).T, full_matrices=False)
+
+        self.idf = idf
+        self.projection = np.ascontiguousarray(vt[:dimension].T, dtype="float32")
+        self.needs_fit = False
+        self.key = f"local:{self.fingerprint()}"
+
+    def embed_text(self, text: str):
+        ids, weights = self._features(text)
+        vec = (weights * self.idf[ids]) @ self.projection[ids]
+        norm = float(np.linalg.norm(vec))
+        return (vec / norm if norm > 0 else vec).tolist()
+
+    def embed_texts(self, texts: list):
+        return [self.embed_text(t) for t in texts]
+
+    async def embed_text_async(self, text: str):
+        return self.embed_text(text)
+
+    async def embed_texts_async(self, texts: list):
+        return self.embed_texts(texts)
+
+    def config(self) -> dict:
+        return {
+            "backend": self.name,
+            "dimension": int(self.projection.shape[1]),
+            "features": LOCAL_FEATURES,
+            "fingerprint": self.fingerprint(),
+        }
+
+    def save(self, index_path: str):
+        np.savez(model_path_for(index_path), idf=self.idf, projection=self.projection)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(idf=data["idf"], projection=data["projection"])
+
+
+def create_backend(name: str = None):
+    """
+    A new backend for building an index (EMBEDDING_BACKEND, default "gemini").
+    An existing backend object is returned as is (e.g. a fitted local model shared by shards).
+    """
+    if name is not None and not isinstance(name, str):
+        return name
+    name = name or os.getenv("EMBEDDING_BACKEND", "gemini")
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "local":
+        return LocalBackend()
+    raise ValueError(f"Unknown embedding backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+
+
+def backend_for_index(index_path: str, config: dict):
+    """
+    The backend that built an index, from its config. Indexes built before backends were
+    recorded were embedded with Gemini text-embedding-004.
+    """
+    embedding = config.get("embedding") or {"backend": "gemini", "model": EMBED_MODEL}
+
+    if embedding["backend"] == "gemini":
+        return GeminiBackend(embedding.get("model", EMBED_MODEL))
+
+    if embedding["backend"] == "local":
+        path = model_path_for(index_path)
+        if not os.path.exists(path):
+            raise RuntimeError(f"The index was built with the local embedder, but {path} is missing.")
+        backend = LocalBackend.load(path)
+        if backend.fingerprint() != embedding.get("fingerprint"):
+            raise RuntimeError(f"{path} does not belong to this index (rebuild the index).")
+        return backend
+
+    raise ValueError(f"Unknown embedding backend '{embedding['backend']}' in the index config.")
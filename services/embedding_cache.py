@@ -0,0 +1,244 @@
+# Caches query embeddings so repeated questions skip the Gemini embedding call.
+# Pilots and dispatchers ask the same questions again and again, so most queries
+# can reuse a vector that was already computed for an earlier request.
+# (With the local embedding backend, vectors are computed directly: that is cheaper than a lookup.)
+
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from services.embedding_backends import GeminiBackend
+from services.tracing import record_cache
+
+DEFAULT_MAX_SIZE = 2048
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizes a question so trivial differences (case, spacing, trailing punctuation)
+    map to the same cache key.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = " ".join(text.split())
+    return re.sub(r"[\s?!.]+$", "", text)
+
+
+class EmbeddingCache:
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, db_path: str = None, backend=None):
+        """
+        Bounded in-memory LRU cache of query embeddings.
+        If `db_path` is given, entries are also written to a SQLite file, so the cache
+        survives restarts and is shared between uvicorn workers on the same host.
+        Vectors come from `backend` (Gemini by default; the Retriever sets the backend
+        that built its index).
+        """
+        self.max_size = max_size
+        self.db_path = db_path
+        self.backend = backend or GeminiBackend()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if db_path:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")  # Lets several workers read while one writes
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                    "key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _key(self, query: str) -> str:
+        # The backend key (model name or local fingerprint) is part of the key so vectors
+        # from different embedders never mix:
+        return f"{self.backend.key}::{normalize_query(query)}"
+
+    def _remember(self, key: str, vec: list):
+        """
+        Stores a vector in the in-memory LRU, evicting the least recently used entry if full.
+        """
+        with self._lock:
+            self._entries[key] = vec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _db_get(self, key: str):
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print("[WARN] Embedding cache read failed:", e)
+            return None
+
+        if row is None:
+            return None
+        return array("f", row[0]).tolist()
+
+    def _db_put(self, key: str, vec: list):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, vector) VALUES (?, ?)",
+                    (key, array("f", vec).tobytes())
+                )
+        except sqlite3.Error as e:
+            print("[WARN] Embedding cache write failed:", e)
+
+    def get(self, query: str):
+        """
+        Returns the cached vector for this question, or None on a miss.
+        """
+        key = self._key(query)
+
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache("embedding", True)
+                return vec
+
+        # Fall back to the shared on-disk store (filled by earlier runs or other workers):
+        if self.db_path:
+            vec = self._db_get(key)
+            if vec is not None:
+                self._remember(key, vec)
+                with self._lock:
+                    self.hits += 1
+                record_cache("embedding", True)
+                return vec
+
+        with self._lock:
+            self.misses += 1
+        record_cache("embedding", False)
+        return None
+
+    def put(self, query: str, vec: list):
+        key = self._key(query)
+        self._remember(key, vec)
+        if self.db_path:
+            self._db_put(key, vec)
+
+    def get_or_embed(self, query: str):
+        """
+        Returns the query embedding, calling Gemini only on a cache miss.
+        """
+        if not self.backend.cacheable:
+            return self.backend.embed_text(query)
+
+        vec = self.get(query)
+        if vec is not None:
+            return vec
+
+        vec = self.backend.embed_text(query)
+        if vec is not None:
+            self.put(query, vec)
+        return vec
+
+    async def get_or_embed_async(self, query: str, on_miss=None):
+        """
+        Async counterpart of get_or_embed().
+        SQLite access runs in a worker thread so the event loop is never blocked on disk.
+        `on_miss` (an async callable) is awaited before the Gemini call, i.e. only on a miss;
+        the pipeline uses it to take its admission slot.
+        """
+        if not self.backend.cacheable:
+            return self.backend.embed_text(query)
+
+        if self.db_path:
+            vec = await asyncio.to_thread(self.get, query)
+        else:
+            vec = self.get(query)
+        if vec is not None:
+            return vec
+
+        if on_miss is not None:
+            await on_miss()
+        vec = await self.backend.embed_text_async(query)
+        if vec is not None:
+            if self.db_path:
+                await asyncio.to_thread(self.put, query, vec)
+            else:
+                self.put(query, vec)
+        return vec
+
+    async def get_or_embed_many_async(self, queries: list, on_miss=None) -> list:
+        """
+        Batch version of get_or_embed_async(): cached questions are served from the cache,
+        and all misses are embedded together in batched Gemini requests.
+        Returns one vector per question (None where embedding failed), in the same order.
+        `on_miss` is awaited once before the first request, if any question was missing.
+        """
+        if not self.backend.cacheable:
+            return self.backend.embed_texts(queries)
+
+        if self.db_path:
+            vecs = await asyncio.to_thread(lambda: [self.get(q) for q in queries])
+        else:
+            vecs = [self.get(q) for q in queries]
+
+        # Each distinct missing question is embedded once, even if it appears several times
+        # (also with different case, spacing or trailing punctuation):
+        missing = {}
+        for q, vec in zip(queries, vecs):
+            if vec is None:
+                missing.setdefault(self._key(q), q)
+        missing = list(missing.values())
+        embedded = {}
+        if missing and on_miss is not None:
+            await on_miss()
+
+        batch_size = self.backend.max_batch_size
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            batch_vecs = await self.backend.embed_texts_async(batch)
+            if batch_vecs is None:
+                continue    # The whole request failed; these questions stay unanswered
+            embedded.update(zip(batch, batch_vecs))
+
+        if embedded:
+            if self.db_path:
+                await asyncio.to_thread(lambda: [self.put(q, vec) for q, vec in embedded.items()])
+            else:
+                for q, vec in embedded.items():
+                    self.put(q, vec)
+
+        embedded = {self._key(q): vec for q, vec in embedded.items()}
+        return [vec if vec is not None else embedded.get(self._key(q)) for q, vec in zip(queries, vecs)]
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters for monitoring how much traffic the cache absorbs.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+def cache_from_env() -> EmbeddingCache:
+    """
+    Builds the embedding cache from environment settings:
+    EMBED_CACHE_SIZE (max in-memory entries) and EMBED_CACHE_PATH (optional SQLite file).
+    """
+    return EmbeddingCache(
+        max_size=int(os.getenv("EMBED_CACHE_SIZE", DEFAULT_MAX_SIZE)),
+        db_path=os.getenv("EMBED_CACHE_PATH") or None
+    )
@@ -1,113 +1,308 @@
-# services/generate_answer.py
-
-from services.query_type import is_numeric_query
-from services.table_loader import get_tables_for_page
-from services.generate_numeric import generate_numeric_answer
-import google.generativeai as genai
-import os
-
-MODEL_NAME = "models/gemini-2.0-flash"
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY")) # Fast and relatively cheap, good for this task
-
-
-def format_numeric_natural_answer(query: str, numeric_value: float, page: int):
-    """
-    This makes the output more readable and understandable while
-    keeping the number unchanged and avoids hallucinations.
-    """
-
-    prompt = f"""
-Rewrite the numeric answer into a natural, aviation-style explanation.
-
-User query:
-{query}
-
-Numeric result: {numeric_value}
-
-Page reference: {page}
-
-Rules:
-- Write a short, professional, pilot-friendly sentence.
-- Combine the context from the query with the numeric result.
-- Use good formatting: e.g., "52.2 (1000 kg)" or "55,800 kg".
-- DO NOT modify or guess the value.
-- Only output the final answer sentence.
-"""
-
-    response = genai.GenerativeModel(MODEL_NAME).generate_content(prompt)
-    return response.text.strip() if response.text else str(numeric_value)
-
-
-def generate_answer(query: str, retrieved_chunks: list):
-    """
-    Generates a grounded answer. Uses two modes:
-    - Numeric mode: table lookup + numeric extraction + natural phrasing.
-    - Normal mode: standard RAG, using text content.
-"""
-    if not retrieved_chunks:
-        return "I could not find related information in the manual.", []
-
-    # Numeric Mode:
-    if is_numeric_query(query):
-                # Only one chunk is returned in numeric mode (since each page has a different table)
-        chunk = retrieved_chunks[0]        
-        page = chunk["page"]
-        page_text = chunk["text"]
-
-        tables = get_tables_for_page(page)
-
-        if not tables:
-            return "NOT FOUND (no tables on this page)", [page]
-
-        # Numeric extractor returns raw string result:
-        numeric_value = generate_numeric_answer(query, page, tables, page_text)
-
-        # parsing string into float for gemini to interpret as number:
-        if isinstance(numeric_value, str):
-            try:
-                cleaned = numeric_value.replace(",", "").strip()
-                numeric_value = float(cleaned)
-            except:
-                # If parsing fails, treat it as error
-                return numeric_value, [page]
-
-
-        # Rewriting in a way that sounds natural:
-        natural_answer = format_numeric_natural_answer(
-            query=query,
-            numeric_value=numeric_value,
-            page=page
-        )
-
-        return natural_answer, [page]
-
-    # Normal mode:
-    context_blocks = []
-    pages = []
-
-    # Build context for Gemini:
-    for chunk in retrieved_chunks:
-        pages.append(chunk["page"])
-        context_blocks.append(f"[Page {chunk['page']}]\n{chunk['text']}")
-
-    context_text = "\n\n---\n\n".join(context_blocks)
-
-    prompt = f"""
-You are an aviation technical assistant grounded strictly in the flight manual.
-
-Answer ONLY using the provided manual excerpts.
-If not found, say: "I could not find this information in the provided manual."
-
-Question:
-{query}
-
-Relevant Manual Excerpts:
-{context_text}
-
-Now answer concisely and cite pages used.
-"""
-
-    response = genai.GenerativeModel(MODEL_NAME).generate_content(prompt)
-    answer = response.text.strip() if response.text else "No answer."
-
-    return answer, sorted(list(set(pages)))
+# services/generate_answer.py
+
+from services.query_type import is_numeric_query
+from services.table_loader import get_table_text_for_page, get_tables_for_page
+from services.generate_numeric import generate_numeric_answer, generate_numeric_answer_async
+from services.numeric_engine import resolve_numeric_answer
+from services.numeric_formatter import detect_quantity, find_unit_in_tables, format_numeric_answer
+from services.governor import Shed
+from services.llm_client import generate, generate_async, stream_async
+from services.page_digest import relevant_passages
+from services.shards import page_label
+from services.tracing import record_fallback, record_tokens, span
+import os
+import re
+
+MODEL_NAME = "models/gemini-2.0-flash" # Fast and relatively cheap, good for this task
+
+NO_RESULTS_ANSWER = "I could not find related information in the manual."
+NO_TABLES_ANSWER = "NOT FOUND (no tables on this page)"
+
+# Numeric answers are phrased with local templates; set NUMERIC_LLM_PHRASING=1
+# to have Gemini reword them instead (one extra request per numeric query):
+NUMERIC_LLM_PHRASING = os.getenv("NUMERIC_LLM_PHRASING", "0") == "1"
+
+
+def _build_format_prompt(query: str, numeric_value: float, page: int) -> str:
+    """
+    Builds the prompt that rewrites a numeric value as a natural sentence.
+    """
+    return f"""
+Rewrite the numeric answer into a natural, aviation-style explanation.
+
+User query:
+{query}
+
+Numeric result: {numeric_value}
+
+Page reference: {page}
+
+Rules:
+- Write a short, professional, pilot-friendly sentence.
+- Combine the context from the query with the numeric result.
+- Use good formatting: e.g., "52.2 (1000 kg)" or "55,800 kg".
+- DO NOT modify or guess the value.
+- Only output the final answer sentence.
+"""
+
+
+def _build_answer_prompt(query: str, retrieved_chunks: list):
+    """
+    Builds the normal-mode RAG prompt.
+    Returns (prompt, cited pages).
+    """
+    context_blocks = []
+    pages = []
+
+    # Build context for Gemini (only the passages of each page that match the question):
+    for chunk in retrieved_chunks:
+        pages.append(chunk["page"])
+        context_blocks.append(f"[{page_label(chunk)}]\n{relevant_passages(query, chunk['text'])}")
+
+    context_text = "\n\n---\n\n".join(context_blocks)
+
+    prompt = f"""
+You are an aviation technical assistant grounded strictly in the flight manual.
+
+Answer ONLY using the provided manual excerpts.
+If not found, say: "I could not find this information in the provided manual."
+
+Question:
+{query}
+
+Relevant Manual Excerpts:
+{context_text}
+
+Now answer concisely and cite pages used.
+"""
+    return prompt, sorted(list(set(pages)))
+
+
+def _parse_numeric_value(numeric_value: str):
+    """
+    Splits the extractor's string result into its number and an optional unit,
+    e.g. "55.8 (1000 KG)" → ("55.8", "1000 KG").
+    Returns (None, None) if the result is not a number (e.g. "NOT FOUND").
+    """
+    match = re.match(r"^\s*(-?[\d,]*\d(?:\.\d+)?)\s*(?:\(([^()]*)\)|([A-Za-z%/]+))?\s*$", numeric_value)
+    if not match:
+        return None, None
+
+    return match.group(1).replace(",", ""), (match.group(2) or match.group(3) or None)
+
+
+def _numeric_result(query: str, page: int, page_text: str, shard: str = None):
+    """
+    Local part of numeric mode: table lookup and unit detection.
+    Returns (local lookup result or None, table unit, quantity label).
+    """
+    local = resolve_numeric_answer(query, page, page_text, shard)
+    if local is not None:
+        return local, local["unit"], local["quantity"]
+
+    unit = find_unit_in_tables(get_tables_for_page(page, shard), detect_quantity(query))
+    return None, unit, None
+
+
+def _numeric_plan(query: str, chunk: dict) -> dict:
+    """
+    Local part of numeric mode up to the Gemini numeric extractor, shared by generate_answer()
+    and generate_answer_async(). Returns the page's context with either "answer" set (the page
+    has no tables) or "raw_value" (the local table lookup), or "extract" when Gemini has to read it.
+    """
+    # Only one chunk is returned in numeric mode (since each page has a different table)
+    plan = {"page": chunk["page"], "page_text": chunk["text"], "shard": chunk.get("shard"),
+            "answer": None, "raw_value": None, "extract": False}
+
+    plan["tables"] = get_table_text_for_page(plan["page"], plan["shard"])
+    if not plan["tables"]:
+        record_fallback("no_tables")
+        plan["answer"] = NO_TABLES_ANSWER
+        return plan
+
+    # Read the cell locally when the table and query parameters resolve it exactly;
+    # otherwise the Gemini numeric extractor returns the raw string result:
+    with span("numeric_engine"):
+        local, plan["unit"], plan["quantity"] = _numeric_result(query, plan["page"], plan["page_text"], plan["shard"])
+    if local is not None:
+        plan["raw_value"] = local["value"]
+    else:
+        record_fallback("numeric_extractor")
+        plan["extract"] = True
+    return plan
+
+
+def _numeric_value_plan(plan: dict, llm_phrasing: bool = None) -> dict:
+    """
+    Parses the looked-up or extracted value and decides whether Gemini phrases the answer
+    (`llm_phrasing`, defaulting to NUMERIC_LLM_PHRASING).
+    """
+    if plan["answer"] is None:
+        plan["value"], plan["result_unit"] = _parse_numeric_value(plan["raw_value"])
+        if plan["value"] is None:
+            # If parsing fails, treat it as error
+            plan["answer"] = plan["raw_value"]
+
+    plan["llm_phrasing"] = plan["answer"] is None and (
+        llm_phrasing if llm_phrasing is not None else NUMERIC_LLM_PHRASING
+    )
+    return plan
+
+
+def _numeric_answer(query: str, plan: dict, natural_answer: str = None) -> str:
+    """
+    The numeric-mode answer: the early answer, Gemini's phrasing, or the local template.
+    """
+    if plan["answer"] is not None:
+        return plan["answer"]
+    if natural_answer is not None:
+        return natural_answer
+
+    with span("format", mode="template"):
+        return format_numeric_answer(query, plan["value"], plan["page"], unit=plan["unit"] or plan["result_unit"],
+                                     quantity_label=plan["quantity"])
+
+
+def format_numeric_natural_answer(query: str, numeric_value: float, page: int):
+    """
+    This makes the output more readable and understandable while
+    keeping the number unchanged and avoids hallucinations.
+    """
+    prompt = _build_format_prompt(query, numeric_value, page)
+
+    response = generate(MODEL_NAME, prompt, stage="format")
+    return response.text.strip() if response.text else str(numeric_value)
+
+
+async def format_numeric_natural_answer_async(query: str, numeric_value: float, page: int):
+    """
+    Async counterpart of format_numeric_natural_answer().
+    """
+    prompt = _build_format_prompt(query, numeric_value, page)
+
+    response = await generate_async(MODEL_NAME, prompt, stage="format")
+    return response.text.strip() if response.text else str(numeric_value)
+
+
+def generate_answer(query: str, retrieved_chunks: list, llm_phrasing: bool = None):
+    """
+    Generates a grounded answer. Uses two modes:
+    - Numeric mode: table lookup + numeric extraction + natural phrasing.
+    - Normal mode: standard RAG, using text content.
+    Numeric answers are phrased from templates unless `llm_phrasing` is set
+    (defaults to the NUMERIC_LLM_PHRASING setting).
+"""
+    if not retrieved_chunks:
+        return NO_RESULTS_ANSWER, []
+
+    # Numeric Mode:
+    if is_numeric_query(query):
+        plan = _numeric_plan(query, retrieved_chunks[0])
+        if plan["extract"]:
+            with span("numeric_extractor"):
+                plan["raw_value"] = generate_numeric_answer(query, plan["page"], plan["tables"],
+                                                            relevant_passages(query, plan["page_text"]))
+
+        plan = _numeric_value_plan(plan, llm_phrasing)
+        natural_answer = None
+        if plan["llm_phrasing"]:
+            # Rewriting in a way that sounds natural (parsed into float for gemini to interpret as number):
+            try:
+                with span("format", mode="llm"):
+                    natural_answer = format_numeric_natural_answer(
+                        query=query,
+                        numeric_value=float(plan["value"]),
+                        page=plan["page"]
+                    )
+            except Shed:
+                record_fallback("format_shed")    # Dropped under load; phrased from the template
+
+        return _numeric_answer(query, plan, natural_answer), [plan["page"]]
+
+    # Normal mode:
+    prompt, pages = _build_answer_prompt(query, retrieved_chunks)
+
+    with span("generate"):
+        response = generate(MODEL_NAME, prompt, stage="generate")
+    answer = response.text.strip() if response.text else "No answer."
+
+    return answer, pages
+
+
+async def generate_answer_async(query: str, retrieved_chunks: list, llm_phrasing: bool = None):
+    """
+    Async counterpart of generate_answer(). Every Gemini call is awaited,
+    so a single worker can serve many questions concurrently.
+    """
+    if not retrieved_chunks:
+        return NO_RESULTS_ANSWER, []
+
+    # Numeric Mode:
+    if is_numeric_query(query):
+        plan = _numeric_plan(query, retrieved_chunks[0])
+        if plan["extract"]:
+            with span("numeric_extractor"):
+                plan["raw_value"] = await generate_numeric_answer_async(query, plan["page"], plan["tables"],
+                                                                        relevant_passages(query, plan["page_text"]))
+
+        plan = _numeric_value_plan(plan, llm_phrasing)
+        natural_answer = None
+        if plan["llm_phrasing"]:
+            try:
+                with span("format", mode="llm"):
+                    natural_answer = await format_numeric_natural_answer_async(
+                        query=query,
+                        numeric_value=float(plan["value"]),
+                        page=plan["page"]
+                    )
+            except Shed:
+                record_fallback("format_shed")
+
+        return _numeric_answer(query, plan, natural_answer), [plan["page"]]
+
+    # Normal mode:
+    prompt, pages = _build_answer_prompt(query, retrieved_chunks)
+
+    with span("generate"):
+        response = await generate_async(MODEL_NAME, prompt, stage="generate")
+    answer = response.text.strip() if response.text else "No answer."
+
+    return answer, pages
+
+
+async def stream_answer_async(query: str, retrieved_chunks: list, llm_phrasing: bool = None):
+    """
+    Streaming counterpart of generate_answer_async().
+    Yields {"text": ...} pieces as the answer is generated, then one final {"pages": [...]}
+    with the cited pages. Normal mode streams Gemini's tokens as they arrive; numeric mode
+    is answered from the tables in one piece (usually without any LLM call).
+    """
+    if not retrieved_chunks or is_numeric_query(query):
+        answer, pages = await generate_answer_async(query, retrieved_chunks, llm_phrasing=llm_phrasing)
+        yield {"text": answer}
+        yield {"pages": pages}
+        return
+
+    # Normal mode:
+    prompt, pages = _build_answer_prompt(query, retrieved_chunks)
+
+    # Only the wait for the first chunk is a span (a span cannot stay open across yields):
+    with span("generate_first_chunk"):
+        response = await stream_async(MODEL_NAME, prompt, stage="generate")
+
+    streamed = False
+    async for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            continue    # Chunks without text parts (e.g. only safety/finish metadata)
+        if text:
+            streamed = True
+            yield {"text": text}
+
+    record_tokens("generate", response)
+
+    if not streamed:
+        yield {"text": "No answer."}
+
+    yield {"pages": pages}
@@ -0,0 +1,306 @@
+# Admission control and rate limiting for Gemini-bound work.
+# - Admission: at most GOVERNOR_MAX_CONCURRENT questions run their retrieval/generation
+#   stages at once; up to GOVERNOR_MAX_QUEUE more wait in line for at most GOVERNOR_MAX_WAIT
+#   seconds. Beyond that a question is rejected at once (503 with Retry-After) instead of
+#   piling up behind timeouts.
+# - Rate limits: every Gemini request takes from a token bucket per model, one for requests
+#   per minute and one for tokens per minute (LLM_RATE_LIMITS). A request waits for the
+#   bucket to refill, or is rejected if that would take longer than it may wait.
+# - Degradation: under pressure (a filling queue, an emptying bucket or a recent 429), the
+#   optional Gemini stages are dropped in a fixed order: first the LLM rerank (the local
+#   hybrid order is used), then the LLM phrasing of numeric answers (templates are used).
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from services.metrics import Counter
+from services.tracing import span
+
+GOVERNOR_MAX_CONCURRENT = int(os.getenv("GOVERNOR_MAX_CONCURRENT", "16"))   # Questions in the LLM stages at once
+GOVERNOR_MAX_QUEUE = int(os.getenv("GOVERNOR_MAX_QUEUE", "64"))             # Questions waiting for a slot
+GOVERNOR_MAX_WAIT = float(os.getenv("GOVERNOR_MAX_WAIT", "10"))             # Seconds a question may wait (slot or rate limit)
+DEGRADE_RERANK_AT = float(os.getenv("GOVERNOR_DEGRADE_RERANK_AT", "0.5"))   # Pressure at which the LLM rerank is dropped
+DEGRADE_FORMAT_AT = float(os.getenv("GOVERNOR_DEGRADE_FORMAT_AT", "0.75"))  # ... and the LLM numeric phrasing
+THROTTLE_COOLDOWN = 10.0       # Seconds of full pressure after Gemini answered 429
+CHARS_PER_TOKEN = 4            # Token estimate before the request (settled with the real count after it)
+
+# Optional stages and the degradation level at which they are dropped:
+OPTIONAL_STAGES = {"llm_rerank": 1, "format": 2}
+
+SHED = Counter("rag_governor_shed_total", "Optional Gemini stages dropped under load.", ("stage",))
+REJECTED = Counter("rag_governor_rejected_total", "Questions or requests rejected by the governor.", ("reason",))
+
+
+class Overloaded(Exception):
+    """
+    Raised when a question cannot be admitted, or a required Gemini request cannot get
+    rate budget in time. `retry_after` is the suggested wait in seconds.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class Shed(Exception):
+    """
+    Raised instead of sending an optional Gemini request (rerank, phrasing) under load;
+    the caller uses its local fallback.
+    """
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        """
+        Holds up to one minute's worth of budget and refills continuously.
+        Reservations may take it below zero; later callers then wait for the refill.
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` and returns the seconds until the budget covers it (0 if it does now).
+        """
+        self._refill(time.monotonic())
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def give_back(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def fill(self) -> float:
+        """
+        Share of the budget currently available (0 when empty or in debt).
+        """
+        self._refill(time.monotonic())
+        return max(0.0, self.tokens / self.capacity)
+
+    def drain(self):
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0)
+
+
+def parse_rate_limits(text: str) -> dict:
+    """
+    Parses "models/gemini-2.0-flash=2000:4000000,models/text-embedding-004=1500:0"
+    (model=requests per minute:tokens per minute, 0 = unlimited) into {model: (rpm, tpm)}.
+    """
+    limits = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            model, values = item.rsplit("=", 1)
+            rpm, _, tpm = values.partition(":")
+            limits[model.strip()] = (float(rpm or 0), float(tpm or 0))
+    return limits
+
+
+_lock = threading.Lock()
+_buckets = {
+    model: (TokenBucket(rpm) if rpm > 0 else None, TokenBucket(tpm) if tpm > 0 else None)
+    for model, (rpm, tpm) in parse_rate_limits(os.getenv("LLM_RATE_LIMITS", "")).items()
+}
+_throttled_until = 0.0
+
+
+def estimate_tokens(content) -> int:
+    """
+    Rough token count of a prompt or of the texts of an embedding request.
+    """
+    if isinstance(content, str):
+        return max(1, len(content) // CHARS_PER_TOKEN)
+    return sum(estimate_tokens(text) for text in content)
+
+
+class AdmissionQueue:
+    def __init__(self, max_concurrent: int = GOVERNOR_MAX_CONCURRENT, max_queue: int = GOVERNOR_MAX_QUEUE,
+                 max_wait: float = GOVERNOR_MAX_WAIT):
+        """
+        FIFO admission for questions on one event loop. A finishing question hands its
+        slot directly to the next one in line.
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = deque()
+        self._service_seconds = 1.0     # Moving average of how long a question holds its slot
+
+    def pressure(self) -> float:
+        """
+        How full the waiting line is (0 = nobody waiting, 1 = full).
+        """
+        if not self._waiters:
+            return 0.0
+        return len(self._waiters) / self.max_queue if self.max_queue else 1.0
+
+    def retry_after(self) -> float:
+        """
+        Rough time until a new question would get a slot.
+        """
+        return self._service_seconds * (len(self._waiters) + 1) / self.max_concurrent
+
+    async def enter(self):
+        """
+        Takes a slot, waiting in line if all are busy. Raises Overloaded when the line is
+        full or the wait would exceed max_wait.
+        """
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            REJECTED.inc(reason="queue_full")
+            raise Overloaded("Too many questions in progress; please retry shortly.", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done():
+                # The slot was handed over just as the wait ended:
+                if isinstance(e, asyncio.TimeoutError):
+                    return
+                self.leave()
+                raise
+            self._waiters.remove(future)
+            future.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            REJECTED.inc(reason="wait_timeout")
+            raise Overloaded("Timed out waiting for a free slot; please retry shortly.", self.retry_after())
+
+    def leave(self):
+        """
+        Frees a slot, or hands it to the first question still waiting.
+        """
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def admit(self):
+        """
+        Holds a slot for the duration of the block (see enter()).
+        """
+        with span("admission"):
+            await self.enter()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * (time.monotonic() - started)
+            self.leave()
+
+    def stats(self) -> dict:
+        return {"active": self.active, "waiting": len(self._waiters), "level": degradation_level()}
+
+
+# One admission line per worker process (it lives on the worker's event loop):
+admission = AdmissionQueue()
+
+
+def degradation_level() -> int:
+    """
+    0 = full pipeline, 1 = no LLM rerank, 2 = also no LLM numeric phrasing.
+    Pressure is the highest of: queue fill, used share of any rate bucket, recent 429.
+    """
+    pressure = admission.pressure()
+    with _lock:
+        for buckets in _buckets.values():
+            for bucket in buckets:
+                if bucket is not None:
+                    pressure = max(pressure, 1.0 - bucket.fill())
+        if time.monotonic() < _throttled_until:
+            pressure = 1.0
+
+    if pressure >= DEGRADE_FORMAT_AT:
+        return 2
+    if pressure >= DEGRADE_RERANK_AT:
+        return 1
+    return 0
+
+
+def _shed(stage: str):
+    SHED.inc(stage=stage)
+    raise Shed(f"{stage} dropped under load")
+
+
+def reserve(model_name: str, stage: str, tokens: int, max_wait: float = None) -> float:
+    """
+    Takes rate budget for one Gemini request and returns how long to wait before sending it.
+    Optional stages raise Shed instead of waiting (or when the load calls for dropping them);
+    required ones raise Overloaded if the wait would exceed `max_wait` (GOVERNOR_MAX_WAIT).
+    """
+    if stage in OPTIONAL_STAGES and degradation_level() >= OPTIONAL_STAGES[stage]:
+        _shed(stage)
+
+    with _lock:
+        rpm, tpm = _buckets.get(model_name, (None, None))
+        taken = [(b, a) for b, a in ((rpm, 1), (tpm, tokens)) if b is not None]
+        wait = max([b.reserve(a) for b, a in taken], default=0.0)
+
+        limit = GOVERNOR_MAX_WAIT if max_wait is None else min(max_wait, GOVERNOR_MAX_WAIT)
+        if wait > 0 and (stage in OPTIONAL_STAGES or wait > limit):
+            for bucket, amount in taken:
+                bucket.give_back(amount)
+        else:
+            return wait
+
+    if stage in OPTIONAL_STAGES:
+        _shed(stage)
+    REJECTED.inc(reason="rate_limit")
+    raise Overloaded(f"Gemini rate limit for {model_name} reached; please retry shortly.", wait)
+
+
+def try_reserve(model_name: str, tokens: int) -> bool:
+    """
+    Takes rate budget for an extra request (a hedge) only if it is available right now.
+    Returns False, taking nothing, if the request would have to wait.
+    """
+    with _lock:
+        rpm, tpm = _buckets.get(model_name, (None, None))
+        taken = [(b, a) for b, a in ((rpm, 1), (tpm, tokens)) if b is not None]
+        if max([b.reserve(a) for b, a in taken], default=0.0) > 0:
+            for bucket, amount in taken:
+                bucket.give_back(amount)
+            return False
+        return True
+
+
+def settle(model_name: str, estimated: int, actual: int):
+    """
+    Corrects the tokens-per-minute bucket once the real token count of a request is known.
+    """
+    with _lock:
+        tpm = _buckets.get(model_name, (None, None))[1]
+        if tpm is not None and actual:
+            tpm.tokens -= actual - estimated
+
+
+def throttled(model_name: str):
+    """
+    Gemini answered 429: empties the model's buckets and drops optional stages for a while.
+    """
+    global _throttled_until
+
+    with _lock:
+        for bucket in _buckets.get(model_name, ()):
+            if bucket is not None:
+                bucket.drain()
+        _throttled_until = time.monotonic() + THROTTLE_COOLDOWN
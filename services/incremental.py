@@ -0,0 +1,200 @@
+# Incremental re-indexing for manual revisions.
+# A content hash is kept for every indexed page (data/page_hashes.json). When a new revision
+# of the PDF arrives, only the pages whose text changed are re-embedded and have their tables
+# re-extracted; the FAISS index (ID-mapped, vector id = page number) is updated in place
+# with remove/add instead of being rebuilt.
+# All artifacts are first written to temporary files and then swapped in with os.replace,
+# so a running Retriever never reads a half-written file and can simply reload().
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+from services.chunker import create_page_chunks
+from services.document_loader import extract_pdf_pages
+from services.embedding_backends import backend_for_index
+from services.index_factory import load_index_config, remove_ids
+from services.indexer import _embed_batch, normalize_page_text, page_hash
+from services.lexical_index import BM25Index
+from services.page_store import build_page_store, store_config_path
+from services.records import iter_records, read_records, signature_path, write_records
+from services.shards import shard_meta_path, shard_tables_path
+from services.table_extractor import extract_tables_for_pages
+from services.page_digest import DIGESTS_PATH, build_digests
+from services.page_meta import build_page_meta
+from services.table_router import TABLE_ROUTER_PATH, build_table_router
+from services.table_store import build_table_store
+
+TMP_SUFFIX = ".tmp"
+
+
+def _tmp_path(path: str) -> str:
+    """
+    Temporary file next to the target, keeping the extension (readers pick JSON vs JSONL by it):
+    data/meta.jsonl -> data/meta.tmp.jsonl
+    """
+    root, ext = os.path.splitext(path)
+    return root + TMP_SUFFIX + ext
+
+
+def load_page_hashes(hashes_path: str, meta_path: str) -> dict:
+    """
+    Returns {page: hash} for the currently indexed pages.
+    Indexes built before hashes were recorded are hashed from meta.json instead.
+    """
+    if os.path.exists(hashes_path):
+        with open(hashes_path, "r", encoding="utf-8") as f:
+            return {int(page): h for page, h in json.load(f).items()}
+
+    return {entry["page"]: page_hash(entry["text"]) for entry in iter_records(meta_path)}
+
+
+def diff_pages(old_hashes: dict, new_hashes: dict):
+    """
+    Compares two revisions. Returns (changed pages incl. new ones, removed pages), both sorted.
+    """
+    changed = sorted(p for p, h in new_hashes.items() if old_hashes.get(p) != h)
+    removed = sorted(p for p in old_hashes if p not in new_hashes)
+    return changed, removed
+
+
+def _to_id_map(index, metadata: list):
+    """
+    Converts an index from before vector ids were page numbers (plain IndexFlatL2,
+    id = row) into an IndexIDMap2 keyed by page. ID-mapped indexes are returned as they are.
+    """
+    if isinstance(index, faiss.IndexIDMap2):
+        return index, metadata
+
+    vectors = index.reconstruct_n(0, index.ntotal)
+    id_map = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+    id_map.add_with_ids(
+        np.array([vectors[e["id"]] for e in metadata]).astype("float32"),
+        np.array([e["page"] for e in metadata], dtype="int64")
+    )
+    return id_map, [{"id": e["page"], "page": e["page"], "text": e["text"]} for e in metadata]
+
+
+def _embed_pages(texts: list, batch_size: int, max_workers: int, backend=None) -> list:
+    """
+    Embeds the changed pages in concurrent batches. Returns one vector (or None) per text.
+    """
+    batch_size = max(1, min(batch_size, 100))
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        results = list(pool.map(lambda batch: _embed_batch(batch, backend), batches))
+
+    return [vec for batch in results for vec in batch]
+
+
+def update_index(pdf_path: str,
+                 pages_path: str = "data/pages.json",
+                 chunks_path: str = "data/chunks.json",
+                 index_path: str = "data/faiss.index",
+                 meta_path: str = None,
+                 hashes_path: str = "data/page_hashes.json",
+                 lexical_path: str = "data/bm25.json",
+                 text_store_path: str = "data/page_text.bin",
+                 page_index_path: str = "data/page_text.idx.npy",
+                 tables_path: str = None,
+                 table_store_path: str = "data/table_store.json",
+                 router_path: str = TABLE_ROUTER_PATH,
+                 digests_path: str = DIGESTS_PATH,
+                 page_meta_path: str = "data/page_meta.json",
+                 batch_size: int = 32,
+                 max_workers: int = 4) -> dict:
+    """
+    Applies a new revision of the manual to the existing artifacts.
+    Only changed pages are re-embedded and re-scanned for tables. Pages whose embedding
+    fails keep their previous vector and hash, so the next run retries them.
+    Returns counts: {"changed", "removed", "failed"}.
+    Metadata and tables are kept in whichever format (.json or .jsonl) the index was built with.
+    """
+    meta_path = meta_path or shard_meta_path()
+    tables_path = tables_path or shard_tables_path()
+
+    # Text extraction and chunking are local and fast, so they always run on the whole PDF:
+    extract_pdf_pages(pdf_path, pages_path)
+    create_page_chunks(pages_path, chunks_path)
+
+    chunks = {c["page"]: c for c in iter_records(chunks_path)}
+
+    old_hashes = load_page_hashes(hashes_path, meta_path)
+    new_hashes = {page: page_hash(c["text"]) for page, c in chunks.items()}
+    changed, removed = diff_pages(old_hashes, new_hashes)
+
+    if not changed and not removed:
+        print("[INFO] No pages changed; index is up to date.")
+        return {"changed": 0, "removed": 0, "failed": 0}
+
+    print(f"[INFO] {len(changed)} changed/new pages, {len(removed)} removed pages.")
+
+    # Re-embed only the changed pages, with the backend that built the index (a local
+    # backend keeps its fitted projection; a full rebuild refits it):
+    backend = backend_for_index(index_path, load_index_config(index_path))
+    vectors = _embed_pages([normalize_page_text(chunks[p]["text"]) for p in changed], batch_size, max_workers, backend)
+    embedded = {p: vec for p, vec in zip(changed, vectors) if vec is not None}
+    failed = [p for p in changed if p not in embedded]
+    for page in failed:
+        print(f"[WARN] Keeping previous version of page {page}: embedding failed.")
+
+    # Update the FAISS index in place (read normally, not memory-mapped, since it is modified):
+    index, metadata = _to_id_map(faiss.read_index(index_path), read_records(meta_path))
+
+    replaced = sorted(set(removed) | set(embedded))
+    index = remove_ids(index, replaced, load_index_config(index_path))
+    if embedded:
+        pages = sorted(embedded)
+        index.add_with_ids(
+            np.array([embedded[p] for p in pages]).astype("float32"),
+            np.array(pages, dtype="int64")
+        )
+
+    entries = {e["page"]: e for e in metadata if e["page"] not in replaced}
+    for page in embedded:
+        entries[page] = {"id": page, "page": page, "text": chunks[page]["text"]}
+    metadata = [entries[p] for p in sorted(entries)]
+
+    hashes = {p: h for p, h in old_hashes.items() if p not in replaced}
+    hashes.update({p: new_hashes[p] for p in embedded})
+
+    # Re-extract tables only for the re-embedded pages; a page whose embedding failed keeps
+    # its old tables along with its old text, vector and hash:
+    table_entries = [t for t in iter_records(tables_path) if t["page"] not in replaced]
+    table_entries += extract_tables_for_pages(pdf_path, sorted(embedded))
+    table_entries.sort(key=lambda t: t["page"])    # Stable, so tables keep their order within a page
+
+    # Write everything next to its target first:
+    tmp = {path: _tmp_path(path) for path in (
+        meta_path, text_store_path, page_index_path, lexical_path,
+        tables_path, table_store_path, router_path, digests_path, page_meta_path, hashes_path, index_path
+    )}
+
+    write_records(tmp[meta_path], metadata)
+    build_page_store(tmp[meta_path], tmp[text_store_path], tmp[page_index_path])
+    BM25Index.build(metadata).save(tmp[lexical_path], tmp[meta_path])
+    write_records(tmp[tables_path], table_entries)
+    build_table_store(tmp[tables_path], tmp[table_store_path])
+    build_table_router(tmp[tables_path], tmp[meta_path], tmp[router_path])
+    build_digests(tmp[meta_path], tmp[tables_path], tmp[digests_path])
+    build_page_meta(tmp[meta_path], tmp[tables_path], tmp[page_meta_path])
+    with open(tmp[hashes_path], "w", encoding="utf-8") as f:
+        json.dump({str(p): h for p, h in sorted(hashes.items())}, f, indent=2)
+    faiss.write_index(index, tmp[index_path])
+
+    # Swap the new artifacts in (the page store's config file together with its text); the
+    # FAISS index goes last because the running Retriever reloads when it sees the index file change:
+    swaps = [(store_config_path(tmp[text_store_path]), store_config_path(text_store_path))]
+    # The content hashes of the new metadata and tables (their mtime and size survive the rename):
+    swaps += [(signature_path(tmp[p]), signature_path(p)) for p in (meta_path, tables_path)
+              if os.path.exists(signature_path(tmp[p]))]
+    swaps += [(tmp_path, path) for path, tmp_path in tmp.items()]
+    for tmp_path, path in swaps:
+        os.replace(tmp_path, path)
+
+    print(f"[INFO] Index updated: {len(embedded)} pages re-embedded, {len(removed)} removed, {index.ntotal} pages indexed.")
+    return {"changed": len(embedded), "removed": len(removed), "failed": len(failed)}
@@ -0,0 +1,258 @@
+# Configurable FAISS index types.
+# The flat index searches by brute force over full float32 vectors, which is exact but grows
+# linearly with the corpus. For larger document sets an approximate (HNSW, IVF) or
+# compressed (PQ, SQ8) index can be chosen instead. The chosen type and its parameters are
+# saved next to the index (<index>.json), so the Retriever restores the same search settings.
+# Every index is wrapped in an IndexIDMap2, so vector ids stay page numbers.
+
+import json
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8")
+
+# Defaults per index type; build-time and search-time parameters can be overridden:
+DEFAULT_PARAMS = {
+    "flat": {},
+    "hnsw": {"M": 32, "ef_construction": 40, "ef_search": 64},
+    "ivf_flat": {"nlist": None, "nprobe": 8},            # nlist=None: chosen from the corpus size
+    "ivf_pq": {"nlist": None, "nprobe": 8, "m": 48, "nbits": 8},
+    "sq8": {},
+}
+
+# Parameters applied at query time (the rest only matter while building):
+SEARCH_PARAMS = {"ef_search": "efSearch", "nprobe": "nprobe"}
+
+
+def config_path_for(index_path: str) -> str:
+    return index_path + ".json"
+
+
+def parse_index_params(text: str) -> dict:
+    """
+    Parses "nlist=64,nprobe=8" (e.g. from the FAISS_INDEX_PARAMS env var) into a dict of ints.
+    """
+    params = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            params[key.strip()] = int(value)
+    return params
+
+
+def resolve_params(index_type: str, n_vectors: int, dimension: int, params: dict = None) -> dict:
+    """
+    Fills in the defaults for an index type and adjusts them to the corpus:
+    IVF needs ~39 training vectors per list, PQ sub-quantizers must divide the dimension
+    and need at least 2^nbits training vectors.
+    """
+    if index_type not in DEFAULT_PARAMS:
+        raise ValueError(f"Unknown index type '{index_type}'. Choose one of: {', '.join(INDEX_TYPES)}")
+
+    resolved = dict(DEFAULT_PARAMS[index_type])
+    resolved.update(params or {})
+
+    if "nlist" in resolved:
+        if resolved["nlist"] is None:
+            resolved["nlist"] = int(4 * math.sqrt(n_vectors))
+        resolved["nlist"] = max(1, min(resolved["nlist"], n_vectors // 39))
+        resolved["nprobe"] = max(1, min(resolved["nprobe"], resolved["nlist"]))
+
+    if "m" in resolved:
+        resolved["m"] = max(d for d in range(1, min(resolved["m"], dimension) + 1) if dimension % d == 0)
+        resolved["nbits"] = max(1, min(resolved["nbits"], int(math.log2(max(n_vectors, 2)))))
+
+    return resolved
+
+
+def _factory_string(index_type: str, params: dict) -> str:
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{params['M']}"
+    if index_type == "ivf_flat":
+        return f"IVF{params['nlist']},Flat"
+    if index_type == "ivf_pq":
+        return f"IVF{params['nlist']},PQ{params['m']}x{params['nbits']}"
+    return "SQ8"
+
+
+def apply_search_params(index, params: dict):
+    """
+    Sets the query-time parameters (efSearch, nprobe) on a loaded index.
+    ParameterSpace reaches through the IndexIDMap2 wrapper.
+    """
+    space = faiss.ParameterSpace()
+    for key, faiss_name in SEARCH_PARAMS.items():
+        if key in params:
+            space.set_index_parameter(index, faiss_name, params[key])
+
+
+def search_parameters(config: dict, selector):
+    """
+    Per-search parameters restricting a search to the ids accepted by `selector`.
+    FAISS only accepts the parameter class of the index type (IVF rejects the plain one), and
+    per-search parameters replace the index's own efSearch / nprobe, so these are carried over
+    from the index config. The IndexIDMap2 wrapper translates the selector to internal ids.
+    """
+    params = config.get("params", {})
+    if config["type"] == "hnsw":
+        search = faiss.SearchParametersHNSW(sel=selector)
+        if "ef_search" in params:
+            search.efSearch = params["ef_search"]
+        return search
+    if config["type"] in ("ivf_flat", "ivf_pq"):
+        search = faiss.SearchParametersIVF(sel=selector)
+        if "nprobe" in params:
+            search.nprobe = params["nprobe"]
+        return search
+    return faiss.SearchParameters(sel=selector)
+
+
+def build_index(vectors, ids, index_type: str = "flat", params: dict = None):
+    """
+    Builds, trains and fills an ID-mapped index of the given type.
+    Returns (index, resolved params).
+    """
+    vectors = np.asarray(vectors, dtype="float32")
+    n_vectors, dimension = vectors.shape
+    params = resolve_params(index_type, n_vectors, dimension, params)
+
+    base = faiss.index_factory(dimension, _factory_string(index_type, params))
+    if index_type == "hnsw":
+        base.hnsw.efConstruction = params["ef_construction"]
+
+    index = faiss.IndexIDMap2(base)
+    index.train(vectors)
+    index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    apply_search_params(index, params)
+
+    return index, params
+
+
+def save_index(index, index_path: str, index_type: str, params: dict, embedding: dict = None):
+    """
+    Writes the index and its config file (type + parameters + the embedding backend that
+    produced the vectors, see services/embedding_backends.py).
+    """
+    faiss.write_index(index, index_path)
+    save_index_config(config_path_for(index_path), index_type, params, index.d, embedding)
+
+
+def save_index_config(config_path: str, index_type: str, params: dict, dimension: int, embedding: dict = None):
+    config = {"type": index_type, "params": params, "dimension": dimension}
+    if embedding:
+        config["embedding"] = embedding
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+
+def load_index_config(index_path: str) -> dict:
+    """
+    Returns the saved config, or the flat config for indexes built before types were configurable.
+    """
+    path = config_path_for(index_path)
+    if not os.path.exists(path):
+        return {"type": "flat", "params": {}}
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def remove_ids(index, ids, config: dict):
+    """
+    Removes vectors by id. HNSW graphs do not support removal, so an HNSW index is rebuilt
+    from its remaining (exactly stored) vectors instead. Returns the resulting index.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    if config["type"] != "hnsw":
+        index.remove_ids(ids)
+        return index
+
+    drop = set(ids.tolist())
+    keep = [int(i) for i in faiss.vector_to_array(index.id_map) if int(i) not in drop]
+    if not keep:
+        return build_index(np.zeros((0, index.d), dtype="float32"), [], "hnsw", config["params"])[0]
+
+    vectors = np.array([index.reconstruct(i) for i in keep], dtype="float32")
+    return build_index(vectors, keep, "hnsw", config["params"])[0]
+
+
+def index_report(vectors, queries=None, k: int = 4, n_queries: int = 200, configs: list = None) -> list:
+    """
+    Compares index types on the given vectors: recall@k against the exact flat index,
+    mean/p95 single-query latency, on-disk/in-memory size and build time.
+    `queries` should be real question embeddings (e.g. the golden-set questions, embedded with
+    the index's backend). Without them, a sample of the indexed vectors with a little noise is
+    used; every such query has a near-duplicate in the index, so recall comes out too high.
+    Each row says which was used ("queries": "questions" or "noisy_pages").
+    """
+    vectors = np.asarray(vectors, dtype="float32")
+    ids = np.arange(len(vectors))
+
+    if queries is not None and len(queries):
+        queries = np.asarray(queries, dtype="float32")
+        source = "questions"
+    else:
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+        scale = float(np.std(vectors)) * 0.1
+        queries = (sample + rng.normal(0, scale, sample.shape)).astype("float32")
+        source = "noisy_pages"
+
+    configs = configs or [(t, {}) for t in INDEX_TYPES]
+    k = min(k, len(vectors))
+
+    exact, _ = build_index(vectors, ids, "flat")
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for index_type, params in configs:
+        started = time.perf_counter()
+        index, resolved = build_index(vectors, ids, index_type, params)
+        build_seconds = time.perf_counter() - started
+
+        latencies = []
+        found = []
+        for q in queries:
+            t0 = time.perf_counter()
+            _, result = index.search(q.reshape(1, -1), k)
+            latencies.append(time.perf_counter() - t0)
+            found.append(result[0])
+
+        hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+
+        rows.append({
+            "type": index_type,
+            "params": resolved,
+            "queries": source,
+            f"recall@{k}": round(hits / (len(queries) * k), 4),
+            "mean_ms": round(1000 * float(np.mean(latencies)), 4),
+            "p95_ms": round(1000 * float(np.percentile(latencies, 95)), 4),
+            "size_bytes": int(len(faiss.serialize_index(index))),
+            "build_seconds": round(build_seconds, 3),
+        })
+
+    return rows
+
+
+def write_index_report(vectors, report_path: str, queries=None, k: int = 4):
+    """
+    Runs index_report() and saves it as JSON, printing a short comparison table.
+    """
+    rows = index_report(vectors, queries, k=k)
+
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+
+    print(f"[INFO] Index comparison on {len(vectors)} vectors with "
+          f"{'real questions' if rows[0]['queries'] == 'questions' else 'noisy page vectors'} as queries "
+          f"(saved to {report_path}):")
+    for row in rows:
+        print(f"  {row['type']:<9} recall@{k}={row[f'recall@{k}']:.3f}  mean={row['mean_ms']:.3f} ms  "
+              f"p95={row['p95_ms']:.3f} ms  size={row['size_bytes'] / 1024:.0f} KiB")
+    return rows
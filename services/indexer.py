@@ -1,57 +1,225 @@
-import json
-import numpy as np
-import faiss
-
-from .embedder import embed_text
-
-def build_faiss_index(chunks_path: str,
-                      index_output_path: str,
-                      meta_output_path: str):
-    """
-    Builds a FAISS index by embedding each chunk(page) using Gemini.
-    A separate metadata file is also saved so each vector ID can be mapped back to its
-    original PDF page during retrieval.
-    """
-
-    # Loading all the chunks: 
-    with open(chunks_path, "r", encoding="utf-8") as f:
-        chunks = json.load(f)
-
-    embeddings = []
-    metadata = []
-
-    # Generate an embedding for each page chunk:
-    for i, chunk in enumerate(chunks):
-        text = " ".join(chunk["text"].split()) # Normalizing whitespace 
-
-        if not text.strip():
-            text = " "    # Embed a placeholder for blank or diagram-only pages
-
-        vec = embed_text(text)
-
-        if vec is None:
-            continue
-        
-        # Stores the embedding and metadata linked to each page:
-        embeddings.append(vec)
-        metadata.append({
-            "id": i,
-            "page": chunk["page"],
-            "text": chunk["text"]
-        })
-
-    embeddings = np.array(embeddings).astype("float32") # Converting the embeddings to a format suited for Faiss index (float32)
-
-    # Creates a L2 FAISS index since L2 works well for small datasets like ours:
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings) # Adds and stores all vectors in the FAISS index
-
-    # Saves the FAISS index file:
-    faiss.write_index(index, index_output_path)
-
-    # Save the metadata file:
-    with open(meta_output_path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
-
-    return len(metadata)
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from .embedding_backends import GeminiBackend, create_backend
+from .index_factory import build_index, save_index, write_index_report
+from .lexical_index import BM25Index
+from .records import read_records, write_records
+
+
+def _text_hash(text: str) -> str:
+    """
+    Short content hash used to check that a checkpointed embedding still matches its page text.
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def normalize_page_text(text: str) -> str:
+    """
+    Whitespace-normalized page text as it is embedded (blank pages become a single space placeholder).
+    """
+    return " ".join(text.split()) or " "
+
+
+def page_hash(text: str) -> str:
+    """
+    Content hash of a page, used to detect which pages changed between manual revisions.
+    """
+    return _text_hash(normalize_page_text(text))
+
+
+def _load_checkpoint(checkpoint_path: str) -> dict:
+    """
+    Reads previously finished embeddings from the checkpoint file (one JSON record per line).
+    Returns a dict: chunk_id -> {"hash": str, "embedding": list}.
+    """
+    done = {}
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return done
+
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line may be cut off if the previous build was interrupted mid-write:
+                continue
+            done[record["chunk_id"]] = record
+
+    return done
+
+
+def _embed_batch(texts: list, backend=None):
+    """
+    Embeds one batch of texts (with Gemini unless another backend is given). If the batch
+    request fails, each text is retried on its own so that a single bad page does not drop
+    the whole batch.
+    """
+    backend = backend or GeminiBackend()
+    vectors = backend.embed_texts(texts)
+    if vectors is not None:
+        return vectors
+
+    return [backend.embed_text(t) for t in texts]
+
+
+def build_faiss_index(chunks_path: str,
+                      index_output_path: str,
+                      meta_output_path: str,
+                      batch_size: int = 32,
+                      max_workers: int = 4,
+                      checkpoint_path: str = None,
+                      lexical_output_path: str = None,
+                      hashes_output_path: str = None,
+                      index_type: str = "flat",
+                      index_params: dict = None,
+                      report_output_path: str = None,
+                      report_questions: list = None,
+                      embedding_backend: str = None):
+    """
+    Builds a FAISS index by embedding each chunk(page) using Gemini (or the backend named by
+    `embedding_backend` / EMBEDDING_BACKEND, e.g. "local"; see services/embedding_backends.py).
+    A separate metadata file is also saved so each vector ID can be mapped back to its
+    original PDF page during retrieval.
+
+    Pages are embedded in batches of `batch_size`, with at most `max_workers` requests in flight.
+    If `checkpoint_path` is given, every finished batch is appended to it, so an interrupted
+    build resumes from where it stopped instead of starting again from page 0.
+    If `lexical_output_path` is given, the BM25 index used for local reranking is saved there too.
+    If `hashes_output_path` is given, the content hash of every indexed page is saved there,
+    so later revisions can be applied incrementally (see services/incremental.py).
+    `index_type` ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8") and `index_params` select the
+    FAISS index (see services/index_factory.py). If `report_output_path` is given, all index
+    types are compared on these vectors (recall@k vs. flat, latency, size) and the report is saved;
+    `report_questions` are embedded as its queries. This trains every index type, so it is
+    only done on request.
+    The backend is recorded in the index config, and a local backend is fitted on these pages
+    and saved next to the index, so queries are always embedded the same way.
+    """
+
+    # Loading all the chunks: 
+    chunks = read_records(chunks_path)
+
+    # Normalizing whitespace (blank or diagram-only pages are embedded as a placeholder):
+    texts = [normalize_page_text(chunk["text"]) for chunk in chunks]
+
+    # The local backend learns its features and projection from these pages first:
+    backend = create_backend(embedding_backend)
+    if backend.needs_fit:
+        backend.fit(texts)
+        print(f"[INFO] Fitted the local embedder on {len(texts)} pages ({backend.key}).")
+
+    # Reuse embeddings from an earlier, interrupted run (only if the page text and backend are unchanged):
+    checkpoint = _load_checkpoint(checkpoint_path)
+    vectors = [None] * len(chunks)
+    pending = []
+
+    for i, chunk in enumerate(chunks):
+        record = checkpoint.get(chunk["chunk_id"])
+        if (record is not None and record["hash"] == _text_hash(texts[i])
+                and record.get("backend", GeminiBackend().key) == backend.key):
+            vectors[i] = record["embedding"]
+        else:
+            pending.append(i)
+
+    if checkpoint:
+        print(f"[INFO] Resuming from checkpoint: {len(chunks) - len(pending)} pages already embedded.")
+
+    batch_size = max(1, min(batch_size, 100))
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+    checkpoint_file = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+
+    # Embed all pending batches concurrently; the pool size bounds the number of requests in flight:
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            futures = {
+                pool.submit(_embed_batch, [texts[i] for i in batch], backend): batch
+                for batch in batches
+            }
+
+            for done_count, future in enumerate(as_completed(futures), start=1):
+                batch = futures[future]
+                batch_vectors = future.result()
+
+                for i, vec in zip(batch, batch_vectors):
+                    if vec is None:
+                        continue
+                    vectors[i] = vec
+
+                    # Checkpoint each finished page so a restart can skip it:
+                    if checkpoint_file:
+                        checkpoint_file.write(json.dumps({
+                            "chunk_id": chunks[i]["chunk_id"],
+                            "hash": _text_hash(texts[i]),
+                            "backend": backend.key,
+                            "embedding": vec
+                        }) + "\n")
+
+                if checkpoint_file:
+                    checkpoint_file.flush()
+
+                print(f"[INFO] Embedded batch {done_count}/{len(batches)}")
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    embeddings = []
+    metadata = []
+
+    for i, chunk in enumerate(chunks):
+        if vectors[i] is None:
+            print(f"[WARN] Skipping page {chunk['page']}: embedding failed.")
+            continue
+
+        # Stores the embedding and metadata linked to each page.
+        # The vector id is the page number, so single pages can later be replaced in place:
+        embeddings.append(vectors[i])
+        metadata.append({
+            "id": chunk["page"],
+            "page": chunk["page"],
+            "text": chunk["text"]
+        })
+
+    if not embeddings:
+        raise RuntimeError("No pages could be embedded; FAISS index was not written.")
+
+    embeddings = np.array(embeddings).astype("float32") # Converting the embeddings to a format suited for Faiss index (float32)
+
+    # Creates the L2 FAISS index (flat by default, since it is exact and fast for a single manual).
+    # It is wrapped in an ID map (vector id = page number) to support add/remove on revisions:
+    index, params = build_index(embeddings, [m["id"] for m in metadata], index_type, index_params)
+
+    # Saves the FAISS index file together with its type, parameters and embedding backend
+    # (a fitted local model is written first, since the Retriever loads it with the index):
+    backend.save(index_output_path)
+    save_index(index, index_output_path, index_type, params, backend.config())
+
+    if report_output_path:
+        queries = [v for v in _embed_batch(report_questions, backend) if v is not None] if report_questions else None
+        write_index_report(embeddings, report_output_path, queries)
+
+    # Save the metadata file:
+    write_records(meta_output_path, metadata)
+
+    # Build the BM25 index over the same pages (ids match the FAISS rows):
+    if lexical_output_path:
+        BM25Index.build(metadata).save(lexical_output_path, meta_output_path)
+
+    if hashes_output_path:
+        with open(hashes_output_path, "w", encoding="utf-8") as f:
+            json.dump({str(m["page"]): page_hash(m["text"]) for m in metadata}, f, indent=2)
+
+    # The build finished, so the checkpoint is no longer needed.
+    # (It is kept if some pages failed, so a rerun only retries those pages.)
+    if checkpoint_path and os.path.exists(checkpoint_path) and len(metadata) == len(chunks):
+        os.remove(checkpoint_path)
+
+    return len(metadata)
@@ -0,0 +1,181 @@
+# Single-pass streaming ingestion.
+# Every page flows through a chain of generators:
+#   read page (text + tables) → chunk → embed (batched) → write
+# Tables are extracted by the same process pool as build_tables.py, a bounded window of pages ahead.
+# Records are appended to JSONL files as they are produced, so page text and tables are
+# never held in memory for the whole document set (only the vectors are, for the index).
+# The text is written once (meta.jsonl); pages.json and chunks.json are not needed in this mode.
+
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz
+
+from services.embedding_backends import create_backend
+from services.index_factory import build_index, save_index
+from services.indexer import _embed_batch, normalize_page_text, page_hash
+from services.lexical_index import build_lexical_index
+from services.page_store import build_page_store
+from services.table_extractor import iter_page_tables
+from services.page_digest import DIGESTS_PATH, build_digests
+from services.page_meta import build_page_meta
+from services.table_router import TABLE_ROUTER_PATH, build_table_router
+from services.table_store import build_table_store
+
+
+def iter_pdf_pages(pdf_path: str, table_workers: int = None):
+    """
+    Stage 1: yields {"page", "text", "tables"} for every page.
+    Text comes from PyMuPDF (as in document_loader) in this process. Tables come from
+    pdfplumber in a pool of `table_workers` processes (default: one per CPU core), in
+    page order and only a few tasks ahead of the text (see table_extractor.iter_page_tables).
+    """
+    with fitz.open(pdf_path) as doc:
+        tables_by_page = iter_page_tables(pdf_path, range(1, len(doc) + 1), table_workers)
+
+        for (page_num, tables), page in zip(tables_by_page, doc):
+            yield {
+                "page": page_num,
+                "text": page.get_text("text").strip(),
+                "tables": tables
+            }
+
+
+def read_page_texts(pdf_path: str) -> list:
+    """
+    Normalized text of every page (PyMuPDF only, no table finding), for fitting a local
+    embedding backend before the streaming pass.
+    """
+    with fitz.open(pdf_path) as doc:
+        return [normalize_page_text(page.get_text("text").strip()) for page in doc]
+
+
+def iter_chunks(pages):
+    """
+    Stage 2: one chunk per page (same rule as chunker.create_page_chunks).
+    """
+    for page in pages:
+        yield {
+            "page": page["page"],
+            "chunk_id": f"page_{page['page']}",
+            "text": page["text"].strip(),
+            "tables": page["tables"]
+        }
+
+
+def _batched(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_embedded(chunks, batch_size: int = 32, max_workers: int = 4, backend=None):
+    """
+    Stage 3: yields (chunk, vector or None) in page order (Gemini unless `backend` is given).
+    Up to `max_workers` batches are embedded concurrently; reading further pages waits
+    until the oldest batch is done, so only a bounded number of pages is held in memory.
+    """
+    batch_size = max(1, min(batch_size, 100))
+    max_workers = max(1, max_workers)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = deque()
+
+        for batch in _batched(chunks, batch_size):
+            texts = [normalize_page_text(c["text"]) for c in batch]
+            in_flight.append((batch, pool.submit(_embed_batch, texts, backend)))
+
+            if len(in_flight) >= max_workers:
+                done_batch, future = in_flight.popleft()
+                yield from zip(done_batch, future.result())
+
+        while in_flight:
+            done_batch, future = in_flight.popleft()
+            yield from zip(done_batch, future.result())
+
+
+def ingest_pdf(pdf_path: str,
+               meta_path: str = "data/meta.jsonl",
+               tables_path: str = "data/tables.jsonl",
+               index_path: str = "data/faiss.index",
+               hashes_path: str = "data/page_hashes.json",
+               lexical_path: str = "data/bm25.json",
+               text_store_path: str = "data/page_text.bin",
+               page_index_path: str = "data/page_text.idx.npy",
+               table_store_path: str = "data/table_store.json",
+               router_path: str = TABLE_ROUTER_PATH,
+               digests_path: str = DIGESTS_PATH,
+               page_meta_path: str = "data/page_meta.json",
+               batch_size: int = 32,
+               max_workers: int = 4,
+               index_type: str = "flat",
+               index_params: dict = None,
+               embedding_backend: str = None) -> int:
+    """
+    Builds every artifact the API needs in one pass over the PDF.
+    meta.jsonl and tables.jsonl are appended page by page. Only the vectors are collected
+    (trained index types need all of them before anything can be added) and go into an
+    ID-mapped FAISS index of `index_type` (vector id = page number). The derived stores
+    (page text store, BM25, table store, router, digests, page metadata) are then built from the JSONL files.
+    `embedding_backend` (default EMBEDDING_BACKEND / "gemini") is recorded in the index config.
+    Returns the number of indexed pages.
+    """
+    started = time.perf_counter()
+
+    # A local backend is fitted on the page text first (a quick text-only read of the PDF):
+    backend = create_backend(embedding_backend)
+    if backend.needs_fit:
+        backend.fit(read_page_texts(pdf_path))
+
+    vectors = []
+    ids = []
+    hashes = {}
+    pages = iter_embedded(iter_chunks(iter_pdf_pages(pdf_path)), batch_size, max_workers, backend)
+
+    with open(meta_path, "w", encoding="utf-8") as meta_file, \
+            open(tables_path, "w", encoding="utf-8") as tables_file:
+
+        for chunk, vec in pages:
+            page_num = chunk["page"]
+
+            for table in chunk["tables"]:
+                tables_file.write(json.dumps({"page": page_num, "table": table}, ensure_ascii=False) + "\n")
+
+            if vec is None:
+                print(f"[WARN] Skipping page {page_num}: embedding failed.")
+                continue
+
+            vectors.append(vec)
+            ids.append(page_num)
+
+            meta_file.write(json.dumps({"id": page_num, "page": page_num, "text": chunk["text"]}, ensure_ascii=False) + "\n")
+            hashes[str(page_num)] = page_hash(chunk["text"])
+
+            print(f"[INFO] Ingested page {page_num}")
+
+    if not vectors:
+        raise RuntimeError("No pages could be embedded; FAISS index was not written.")
+
+    index, params = build_index(vectors, ids, index_type, index_params)
+    backend.save(index_path)
+    save_index(index, index_path, index_type, params, backend.config())
+
+    with open(hashes_path, "w", encoding="utf-8") as f:
+        json.dump(hashes, f, indent=2)
+
+    build_page_store(meta_path, text_store_path, page_index_path)
+    build_lexical_index(meta_path, lexical_path)
+    build_table_store(tables_path, table_store_path)
+    build_table_router(tables_path, meta_path, router_path)
+    build_digests(meta_path, tables_path, digests_path)
+    build_page_meta(meta_path, tables_path, page_meta_path)
+
+    print(f"[INFO] Ingested {index.ntotal} pages in {time.perf_counter() - started:.1f} s.")
+    return index.ntotal
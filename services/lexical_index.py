@@ -0,0 +1,121 @@
+# BM25 inverted index over the page text in meta.json.
+# Built at index time and used at query time to rerank FAISS candidates locally,
+# so most normal queries do not need a Gemini rerank call.
+# bm25.json records the content signature of the metadata file it was built from ("source").
+
+import json
+import math
+import re
+from collections import Counter
+
+from services.records import content_signature, iter_records
+
+# BM25 parameters (standard defaults):
+K1 = 1.5
+B = 0.75
+
+# Very common words carry no ranking signal and only slow scoring down:
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "i", "if", "in", "is", "it", "of", "on", "or", "should", "the", "this", "to",
+    "what", "when", "where", "which", "who", "why", "with",
+}
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercase alphanumeric tokens (keeps identifiers like "v1", "n1", "pd.10.2" parts).
+    """
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, postings: dict, doc_lengths: dict, avg_length: float):
+        """
+        postings:    term -> {doc id: term frequency}
+        doc_lengths: doc id -> number of tokens
+        """
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.avg_length = avg_length or 1.0
+        self.source = None    # Signature of the metadata a saved index was built from
+
+        n_docs = len(doc_lengths)
+        self.idf = {
+            term: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+
+    @classmethod
+    def build(cls, entries: list):
+        """
+        Builds the index from metadata entries ({"id", "page", "text"}); any iterable works.
+        """
+        postings = {}
+        doc_lengths = {}
+
+        for entry in entries:
+            tokens = tokenize(entry["text"])
+            doc_lengths[entry["id"]] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, {})[entry["id"]] = tf
+
+        avg_length = sum(doc_lengths.values()) / len(doc_lengths) if doc_lengths else 1.0
+        return cls(postings, doc_lengths, avg_length)
+
+    def score(self, query: str, doc_ids: list) -> dict:
+        """
+        BM25 scores of the given documents for the query (only these documents are scored).
+        """
+        scores = {doc_id: 0.0 for doc_id in doc_ids}
+
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_id in doc_ids:
+                tf = docs.get(doc_id)
+                if not tf:
+                    continue
+                norm = K1 * (1 - B + B * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * tf * (K1 + 1) / (tf + norm)
+
+        return scores
+
+    def save(self, path: str, source_path: str = None):
+        """
+        Writes the index, with the content signature of `source_path` (the metadata file
+        it was built from) so the Retriever can tell whether it is still current.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "source": content_signature(source_path) if source_path else None,
+                # JSON object keys are strings, so doc ids are converted back on load:
+                "postings": {t: {str(d): tf for d, tf in docs.items()} for t, docs in self.postings.items()},
+                "doc_lengths": {str(d): n for d, n in self.doc_lengths.items()},
+                "avg_length": self.avg_length,
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        index = cls(
+            postings={t: {int(d): tf for d, tf in docs.items()} for t, docs in data["postings"].items()},
+            doc_lengths={int(d): n for d, n in data["doc_lengths"].items()},
+            avg_length=data["avg_length"],
+        )
+        index.source = data.get("source")
+        return index
+
+
+def build_lexical_index(meta_path: str, output_path: str):
+    """
+    Offline step: builds the BM25 index from meta.json (or meta.jsonl) and saves it.
+    Returns the number of indexed pages.
+    """
+    index = BM25Index.build(iter_records(meta_path))
+    index.save(output_path, meta_path)
+    return len(index.doc_lengths)
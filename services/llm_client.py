@@ -0,0 +1,312 @@
+# Shared client layer for every Gemini call (generation and embeddings).
+# - The API key is configured once and model objects are created once per model name,
+#   so their underlying clients and connections are reused across requests.
+# - Every request gets a timeout. When a question has a deadline (start_deadline), each
+#   stage only gets its share of the time left, so one slow stage cannot use up the budget
+#   of the stages after it.
+# - 429 and 5xx errors (and timeouts) are retried with exponential backoff and full jitter.
+# - Async calls can be hedged: if the first request has not answered after LLM_HEDGE_AFTER_MS,
+#   an identical second one is sent and whichever finishes first is used.
+# - Every request first takes budget from the per-model rate limits (services/governor.py);
+#   optional stages are dropped there under load. Retries take budget like the first attempt,
+#   and a hedge is only sent if budget is free right away. The tokens-per-minute estimate is
+#   settled once, with the usage of the attempt whose response is used.
+
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+
+from services.governor import estimate_tokens, reserve, settle, throttled, try_reserve
+from services.metrics import Counter
+from services.tracing import record_tokens, record_upstream_call
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))                    # Max seconds per request
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))               # Retries after the first attempt
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))         # Seconds; doubles per retry
+LLM_BACKOFF_MAX = 8.0
+LLM_HEDGE_AFTER_MS = float(os.getenv("LLM_HEDGE_AFTER_MS", "0"))       # 0 disables hedged requests
+REQUEST_DEADLINE = float(os.getenv("LLM_REQUEST_DEADLINE", "30"))      # Seconds for one whole question
+
+# Share of the remaining deadline a stage may use (the last stage, generation, gets all of it):
+STAGE_SHARES = {
+    "embed": 0.2,
+    "llm_rerank": 0.4,
+    "numeric_selector": 0.4,
+    "numeric_extractor": 0.6,
+    "format": 0.5,
+    "generate": 1.0,
+}
+
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+LLM_EVENTS = Counter("rag_llm_events_total", "Gemini retries, hedged requests and timeouts.", ("stage", "event"))
+
+_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+_lock = threading.Lock()
+_configured = False
+_models = {}
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a question's deadline has passed before a Gemini request could be sent.
+    """
+
+
+def start_deadline(seconds: float = None):
+    """
+    Sets the deadline for the current question (its context and the tasks/threads it starts).
+    """
+    _deadline.set(time.monotonic() + (REQUEST_DEADLINE if seconds is None else seconds))
+
+
+def remaining_time():
+    """
+    Seconds left until the current question's deadline, or None without a deadline.
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _stage_timeout(stage: str) -> float:
+    """
+    Timeout for one request of a stage: LLM_TIMEOUT, capped by the stage's share of the time left.
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return LLM_TIMEOUT
+    if remaining <= 0:
+        LLM_EVENTS.inc(stage=stage, event="deadline")
+        raise DeadlineExceeded(f"Deadline exceeded before the {stage} request.")
+    return min(LLM_TIMEOUT, remaining * STAGE_SHARES.get(stage, 1.0))
+
+
+def _configure():
+    global _configured
+
+    with _lock:
+        if not _configured:
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+            _configured = True
+
+
+def get_model(model_name: str):
+    """
+    Returns the shared GenerativeModel for a model name (created on first use).
+    """
+    _configure()
+
+    with _lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = _models[model_name] = genai.GenerativeModel(model_name)
+        return model
+
+
+def reset_models():
+    """
+    Drops the shared model objects (e.g. after genai.GenerativeModel has been replaced).
+    """
+    with _lock:
+        _models.clear()
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, api_exceptions.DeadlineExceeded)):
+        return not isinstance(error, DeadlineExceeded)
+    return getattr(error, "code", None) in RETRYABLE_CODES
+
+
+def _backoff(attempt: int) -> float:
+    """
+    Full-jitter exponential backoff, never longer than the time left before the deadline.
+    """
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    remaining = remaining_time()
+    return delay if remaining is None else max(0.0, min(delay, remaining))
+
+
+def _on_error(model_name: str, stage: str, error: Exception, attempt: int):
+    """
+    Counts a failed attempt and re-raises the error unless it should be retried.
+    """
+    if getattr(error, "code", None) == 429:
+        throttled(model_name)
+    if isinstance(error, (TimeoutError, api_exceptions.DeadlineExceeded)) and not isinstance(error, DeadlineExceeded):
+        LLM_EVENTS.inc(stage=stage, event="timeout")
+    if attempt == LLM_MAX_RETRIES or not _is_retryable(error):
+        raise error
+    LLM_EVENTS.inc(stage=stage, event="retry")
+    print(f"[WARN] Gemini {stage} request failed ({str(error) or type(error).__name__}); retrying.")
+
+
+def _retry_budget(model_name: str, stage: str, tokens: int, attempt: int) -> float:
+    """
+    Seconds to wait before an attempt: the first one has taken its budget already (before
+    the call is counted); each retry takes its own, and may be shed or rejected like it.
+    """
+    return 0.0 if attempt == 0 else reserve(model_name, stage, tokens, remaining_time())
+
+
+def _call_with_retries(model_name: str, stage: str, tokens: int, call):
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        time.sleep(_retry_budget(model_name, stage, tokens, attempt))
+        timeout = _stage_timeout(stage)
+        try:
+            return call(timeout)
+        except Exception as e:
+            _on_error(model_name, stage, e, attempt)
+            time.sleep(_backoff(attempt))
+
+
+async def _hedged(model_name: str, stage: str, tokens: int, call, timeout: float):
+    """
+    Runs call(timeout); if it has not finished after LLM_HEDGE_AFTER_MS, starts a second
+    identical request and returns the first one that succeeds (the other is cancelled).
+    The second request is skipped if the rate limits have no budget for it right now.
+    """
+    hedge_after = LLM_HEDGE_AFTER_MS / 1000
+    if hedge_after <= 0 or hedge_after >= timeout:
+        return await asyncio.wait_for(call(timeout), timeout)
+
+    ends = time.monotonic() + timeout
+    tasks = {asyncio.ensure_future(call(timeout))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done and try_reserve(model_name, tokens):
+            LLM_EVENTS.inc(stage=stage, event="hedge")
+            tasks.add(asyncio.ensure_future(call(timeout - hedge_after)))
+        elif not done:
+            LLM_EVENTS.inc(stage=stage, event="hedge_skipped")
+
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, timeout=max(0.0, ends - time.monotonic()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _call_with_retries_async(model_name: str, stage: str, tokens: int, call, hedge: bool = True):
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await asyncio.sleep(_retry_budget(model_name, stage, tokens, attempt))
+        timeout = _stage_timeout(stage)
+        try:
+            if hedge:
+                return await _hedged(model_name, stage, tokens, call, timeout)
+            return await asyncio.wait_for(call(timeout), timeout)
+        except Exception as e:
+            _on_error(model_name, stage, e, attempt)
+            await asyncio.sleep(_backoff(attempt))
+
+
+def _take_budget(model_name: str, stage: str, content):
+    """
+    Rate budget for one request: returns (estimated tokens, seconds to wait before sending).
+    Raises governor.Shed / governor.Overloaded when the request should not be sent.
+    """
+    tokens = estimate_tokens(content)
+    return tokens, reserve(model_name, stage, tokens, remaining_time())
+
+
+def _used_tokens(response) -> int:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0
+    return (getattr(usage, "prompt_token_count", 0) or 0) + (getattr(usage, "candidates_token_count", 0) or 0)
+
+
+def generate(model_name: str, prompt: str, stage: str = "generate"):
+    """
+    generate_content() with the shared model, rate limits, timeout and retries.
+    Token usage is counted under `stage`.
+    """
+    model = get_model(model_name)
+    tokens, wait = _take_budget(model_name, stage, prompt)
+    time.sleep(wait)
+    record_upstream_call(stage)
+    response = _call_with_retries(
+        model_name, stage, tokens, lambda timeout: model.generate_content(prompt, request_options={"timeout": timeout})
+    )
+    record_tokens(stage, response)
+    settle(model_name, tokens, _used_tokens(response))
+    return response
+
+
+async def generate_async(model_name: str, prompt: str, stage: str = "generate"):
+    """
+    Async generate_content() with the shared model, rate limits, timeout, retries and optional hedging.
+    """
+    model = get_model(model_name)
+    tokens, wait = _take_budget(model_name, stage, prompt)
+    await asyncio.sleep(wait)
+    record_upstream_call(stage)
+    response = await _call_with_retries_async(
+        model_name, stage, tokens,
+        lambda timeout: model.generate_content_async(prompt, request_options={"timeout": timeout})
+    )
+    record_tokens(stage, response)
+    settle(model_name, tokens, _used_tokens(response))
+    return response
+
+
+async def stream_async(model_name: str, prompt: str, stage: str = "generate"):
+    """
+    Opens a streamed generate_content_async() response (retried until the stream has started).
+    Streams are not hedged: a duplicate would only be useful before the first chunk.
+    """
+    model = get_model(model_name)
+    tokens, wait = _take_budget(model_name, stage, prompt)
+    await asyncio.sleep(wait)
+    record_upstream_call(stage)
+    return await _call_with_retries_async(
+        model_name, stage, tokens,
+        lambda timeout: model.generate_content_async(prompt, stream=True, request_options={"timeout": timeout}),
+        hedge=False
+    )
+
+
+def embed(model_name: str, content):
+    """
+    embed_content() with rate limits, timeout and retries (one text or a list of texts).
+    """
+    _configure()
+    tokens, wait = _take_budget(model_name, "embed", content)
+    time.sleep(wait)
+    record_upstream_call("embed")
+    return _call_with_retries(
+        model_name, "embed", tokens,
+        lambda timeout: genai.embed_content(model=model_name, content=content, request_options={"timeout": timeout})
+    )
+
+
+async def embed_async(model_name: str, content):
+    """
+    Async embed_content() with rate limits, timeout, retries and optional hedging.
+    """
+    _configure()
+    tokens, wait = _take_budget(model_name, "embed", content)
+    await asyncio.sleep(wait)
+    record_upstream_call("embed")
+    return await _call_with_retries_async(
+        model_name, "embed", tokens,
+        lambda timeout: genai.embed_content_async(model=model_name, content=content, request_options={"timeout": timeout})
+    )
@@ -0,0 +1,118 @@
+# Minimal in-process Prometheus metrics (counters and histograms) rendered in the
+# Prometheus text exposition format for the /metrics endpoint.
+# Kept in-house so the API has no extra dependency; the output can be scraped by any
+# Prometheus-compatible collector.
+
+import bisect
+import threading
+
+# Latency buckets in seconds (FAISS searches take well under 1 ms, Gemini calls seconds):
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        """
+        Monotonic counter with optional labels, e.g. fallbacks by path.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        """
+        Cumulative-bucket histogram with optional labels, e.g. stage latency by stage.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}    # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _register(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = f'le="{_format_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                inf = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_number(series[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+
+
+def render_metrics() -> str:
+    """
+    All registered metrics in the Prometheus text format (version 0.0.4).
+    """
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+# Metrics of the answering pipeline:
+STAGE_SECONDS = Histogram("rag_stage_duration_seconds", "Wall time of each pipeline stage.", ("stage",))
+REQUEST_SECONDS = Histogram("rag_request_duration_seconds", "Wall time of a whole question.", ("query_type",))
+QUERIES = Counter("rag_queries_total", "Questions by query-type branch.", ("query_type",))
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Gemini tokens by stage and direction.", ("stage", "direction"))
+FALLBACKS = Counter("rag_fallbacks_total", "Fallback paths taken.", ("path",))
+CACHE_EVENTS = Counter("rag_cache_events_total", "Cache lookups by cache and result.", ("cache", "result"))
+STREAM_ERRORS = Counter("rag_stream_errors_total", "Streamed answers that ended with an error event.", ("stage",))
@@ -0,0 +1,355 @@
+# Deterministic local lookup for numeric/table-based questions.
+# The pdfplumber tables in tables.json are parsed into typed grids with labeled axes
+# (OAT, pressure altitude, field length, ...). The query parameters are pulled out of the
+# question and the matching cell is read directly, with no LLM call.
+# Whenever the cell cannot be resolved with confidence, None is returned so the caller
+# can fall back to the Gemini extractor.
+
+import re
+import threading
+
+from services.table_loader import get_tables_for_page
+
+# Axis kinds recognised in table headers (checked in order, first match wins):
+AXIS_KEYWORDS = [
+    ("field_length", ["FIELD LENGTH"]),
+    ("oat", ["OAT", "°C"]),
+    ("altitude", ["PRESSURE ALTITUDE", "ALT (FT)"]),
+    ("wind", ["WIND"]),
+    ("slope", ["SLOPE"]),
+    ("weight", ["WEIGHT"]),
+]
+
+NUMBER_RE = re.compile(r"^-?\d+(?:\.\d+)?$")
+
+_grid_lock = threading.Lock()
+_grid_cache = {}    # (shard, page) -> list of parsed TableGrid objects
+
+
+class TableGrid:
+    def __init__(self, quantity: str, unit: str, row_axis: str, col_axis: str):
+        """
+        One performance table: a quantity (e.g. FIELD LIMIT WEIGHT, unit 1000 KG)
+        read off a grid of row-axis × column-axis values.
+        `context` holds axes fixed for the whole table (e.g. the pressure altitude
+        printed above it on the page), and `labeled_rows` holds single-value rows such
+        as "CLIMB LIMIT WT (1000 KG)" that share the column axis.
+        """
+        self.quantity = quantity
+        self.unit = unit
+        self.row_axis = row_axis
+        self.col_axis = col_axis
+        self.row_values = []
+        self.col_values = []
+        self.cells = {}           # (row value, col value) -> cell string
+        self.labeled_rows = {}    # label -> {col value: cell string}
+        self.context = {}         # axis kind -> fixed value
+
+
+def _clean(cell) -> str:
+    return (cell or "").strip()
+
+
+def _numbers(cell: str):
+    """
+    Splits a (possibly multi-value, newline separated) cell into numbers.
+    Returns None if any part is not a plain number.
+    """
+    parts = [p.strip().replace(",", "") for p in cell.split("\n") if p.strip()]
+    if not parts or not all(NUMBER_RE.match(p) for p in parts):
+        return None
+    return [float(p) for p in parts]
+
+
+def _parts(cell: str) -> list:
+    return [p.strip() for p in cell.split("\n") if p.strip()]
+
+
+def _axis_kind(label: str):
+    label = label.upper()
+    for kind, keywords in AXIS_KEYWORDS:
+        if any(k in label for k in keywords):
+            return kind
+    return None
+
+
+def _unit(label: str) -> str:
+    match = re.search(r"\(([^()]*)\)\s*$", label)
+    return match.group(1).strip() if match else ""
+
+
+def _quantity_words(label: str) -> set:
+    label = re.sub(r"\([^()]*\)", " ", label.upper()).replace("WT", "WEIGHT")
+    return set(re.findall(r"[A-Z]+", label))
+
+
+def _align(row: list, positions: list, row_count: int):
+    """
+    Lines a data row up with the column-axis values.
+    Tries the header's column positions first; if merged cells shifted the row,
+    falls back to the order of non-empty cells. Every aligned cell must hold exactly
+    `row_count` numbers, otherwise the row is rejected.
+    """
+    candidates = [
+        [_clean(row[p]) if p < len(row) else "" for p in positions],
+        [c for c in (_clean(x) for x in row[1:]) if c],
+    ]
+
+    for cells in candidates:
+        if len(cells) != len(positions):
+            continue
+        if all(_numbers(c) is not None and len(_numbers(c)) == row_count for c in cells):
+            return cells
+
+    return None
+
+
+def parse_table(table: list):
+    """
+    Parses one pdfplumber table (list-of-lists) into a TableGrid.
+    Returns None for tables that are not clean numeric grids.
+    """
+    rows = [[_clean(c) for c in row] for row in table]
+
+    # The column-axis header is the first row whose first cell is not numeric
+    # but which carries at least two numeric column values:
+    header_idx = None
+    for i, row in enumerate(rows):
+        numeric_cells = [c for c in row[1:] if _numbers(c) is not None and len(_numbers(c)) == 1]
+        if _numbers(row[0]) is None and len(numeric_cells) >= 2:
+            header_idx = i
+            break
+
+    if header_idx is None or header_idx == 0:
+        return None
+
+    header = rows[header_idx]
+    positions = [p for p in range(1, len(header)) if _numbers(header[p]) is not None and len(_numbers(header[p])) == 1]
+    col_values = [_numbers(header[p])[0] for p in positions]
+
+    if len(set(col_values)) != len(col_values):
+        return None
+
+    # Garbled headers (e.g. "52 5" where two labels were merged) cannot be aligned reliably:
+    if any(header[p] and p not in positions for p in range(positions[0], len(header))):
+        return None
+
+    # Quantity title and row-axis label come from the first header row,
+    # the column-axis label from the row right above the values:
+    title_row = rows[0]
+    row_label = " ".join(title_row[0].split())
+    above = rows[header_idx - 1]
+    col_label = " ".join(" ".join(c for c in above[1:] if c).split())
+    quantity_cells = [c for c in title_row[1:] if c and c not in above[1:]] if header_idx > 1 else []
+    quantity = " ".join(" ".join(quantity_cells or [c for c in title_row[1:] if c]).split())
+
+    # A °C marker in the first column labels the row axis; after it, the column axis:
+    if header[0] == "°C":
+        row_kind, col_kind = "oat", _axis_kind(col_label)
+    elif "°C" in header[1:positions[0]]:
+        row_kind, col_kind = _axis_kind(row_label), "oat"
+    else:
+        row_kind, col_kind = _axis_kind(row_label), _axis_kind(col_label)
+
+    # The quantity must be distinct from the axis labels, otherwise the layout was misread:
+    if not quantity or quantity == col_label or col_kind is None or row_kind is None or col_kind == row_kind:
+        return None
+
+    grid = TableGrid(quantity=quantity, unit=_unit(quantity), row_axis=row_kind, col_axis=col_kind)
+    grid.col_values = col_values
+
+    for row in rows[header_idx + 1:]:
+        if not any(row):
+            continue
+
+        # Alternate-unit rows (e.g. the °F line under °C) repeat the header and are skipped:
+        if any(c in ("°F", "°C") for c in row):
+            continue
+
+        row_numbers = _numbers(row[0])
+
+        # Single-value rows with a text label, e.g. "CLIMB LIMIT WT (1000 KG)":
+        if row_numbers is None:
+            cells = _align(row, positions, 1)
+            if cells is not None and row[0]:
+                label = " ".join(row[0].split())
+                grid.labeled_rows[label] = dict(zip(col_values, cells))
+            continue
+
+        cells = _align(row, positions, len(row_numbers))
+        if cells is None:
+            continue    # Misaligned or partially extracted row: never guess from it
+
+        for r, row_value in enumerate(row_numbers):
+            grid.row_values.append(row_value)
+            for col_value, cell in zip(col_values, cells):
+                grid.cells[(row_value, col_value)] = _parts(cell)[r]
+
+    if not grid.cells and not grid.labeled_rows:
+        return None
+
+    return grid
+
+
+def _page_altitudes(page_text: str) -> list:
+    """
+    Pressure altitudes printed above the tables on a page, in page order
+    (e.g. "Sea Level Pressure Altitude", "1000 FT Pressure Altitude").
+    """
+    altitudes = []
+    for match in re.finditer(r"(Sea Level|(\d[\d,]*)\s*FT)\s+Pressure Altitude", page_text, re.IGNORECASE):
+        altitudes.append(0.0 if match.group(2) is None else float(match.group(2).replace(",", "")))
+    return altitudes
+
+
+def parse_page_grids(tables: list, page_text: str = "") -> list:
+    """
+    Parses the raw tables of one page into grids (tables that are not grids are left out).
+    """
+    grids = [g for g in (parse_table(t) for t in tables) if g is not None]
+
+    altitudes = _page_altitudes(page_text)
+    if altitudes and len(altitudes) == len(grids) and all(g.col_axis != "altitude" and g.row_axis != "altitude" for g in grids):
+        for grid, altitude in zip(grids, altitudes):
+            grid.context["altitude"] = altitude
+
+    return grids
+
+
+def get_grids_for_page(page_num: int, page_text: str = "", shard: str = None) -> list:
+    """
+    Returns the parsed grids for a page (of a shard, if given; parsed once and cached).
+    When the page prints one pressure altitude per table, each grid gets it as context.
+    """
+    key = (shard, page_num)
+    with _grid_lock:
+        if key in _grid_cache:
+            return _grid_cache[key]
+
+    grids = parse_page_grids(get_tables_for_page(page_num, shard), page_text)
+
+    with _grid_lock:
+        _grid_cache[key] = grids
+
+    return grids
+
+
+def reset_grid_cache(shard: str = None):
+    """
+    Forgets the parsed grids of data/ or of one shard (used after the tables have been re-extracted).
+    """
+    with _grid_lock:
+        for key in [k for k in _grid_cache if k[0] == shard]:
+            del _grid_cache[key]
+
+
+def extract_query_params(query: str):
+    """
+    Pulls typed parameters out of a question, e.g.
+    "field limit weight at 2000 ft, 30°C, 1800 m" → {"altitude": 2000, "oat": 30, "field_length": 1800}.
+    Returns None if the same parameter is given two different values.
+    """
+    q = query.lower().replace("º", "°")
+    found = {}
+
+    def add(kind, value):
+        found.setdefault(kind, set()).add(float(value))
+
+    def num(text):
+        return float(text.replace(",", ""))
+
+    for m in re.finditer(r"(-?\d+(?:\.\d+)?)\s*(?:°\s*c\b|degrees?\s*(?:c\b|celsius)|deg\s*c\b|c\b)", q):
+        add("oat", num(m.group(1)))
+    for m in re.finditer(r"\b(?:oat|temperature)\s*(?:of|is|=|:)?\s*(-?\d+(?:\.\d+)?)(?!\s*(?:ft|feet|m\b|kts?|knots|%))", q):
+        add("oat", num(m.group(1)))
+
+    if "sea level" in q:
+        add("altitude", 0)
+    for m in re.finditer(r"(\d[\d,]*)\s*(?:ft|feet|foot)\b", q):
+        add("altitude", num(m.group(1)))
+    for m in re.finditer(r"altitude\s*(?:of|is|=|:)?\s*(\d[\d,]*)(?!\s*(?:°|c\b|m\b|kts?|knots|%))", q):
+        add("altitude", num(m.group(1)))
+
+    for m in re.finditer(r"(\d[\d,]*)\s*(?:m|meters?|metres?)\b", q):
+        add("field_length", num(m.group(1)))
+
+    for m in re.finditer(r"(\d+(?:\.\d+)?)\s*(?:kts?|knots?)\b", q):
+        sign = -1 if "tailwind" in q or "tail wind" in q else 1
+        add("wind", sign * num(m.group(1)))
+
+    for m in re.finditer(r"(-?\d+(?:\.\d+)?)\s*%", q):
+        add("slope", num(m.group(1)))
+
+    for m in re.finditer(r"(\d[\d,]*(?:\.\d+)?)\s*(?:kg|kgs)\b", q):
+        weight = num(m.group(1))
+        add("weight", weight / 1000 if weight >= 1000 else weight)   # Tables list weights in 1000 KG
+
+    if any(len(values) > 1 for values in found.values()):
+        return None
+
+    return {kind: values.pop() for kind, values in found.items()}
+
+
+def _lookup(grid: TableGrid, query_words: set, params: dict):
+    """
+    Resolves the cell of one grid for the query parameters.
+    Returns (quantity label, value) or None.
+    """
+    # Table-wide context (e.g. the pressure altitude of this table) must match the query:
+    for kind, value in grid.context.items():
+        if params.get(kind) != value:
+            return None
+
+    col_value = params.get(grid.col_axis)
+    if col_value is None or col_value not in grid.col_values:
+        return None
+
+    # A labeled single-value row is the answer when the query names it (e.g. climb limit weight):
+    for label, cells in grid.labeled_rows.items():
+        words = _quantity_words(label)
+        used = {grid.col_axis} | set(grid.context)
+        if words and words <= query_words and set(params) <= used:
+            return label, cells.get(col_value)
+
+    if not _quantity_words(grid.quantity) <= query_words:
+        return None
+
+    used = {grid.row_axis, grid.col_axis} | set(grid.context)
+    if set(params) - used:
+        return None     # The query mentions a condition this table does not account for
+
+    row_value = params.get(grid.row_axis)
+    if row_value is None:
+        return None
+
+    value = grid.cells.get((row_value, col_value))
+    if value is None:
+        return None
+    return grid.quantity, value
+
+
+def resolve_numeric_answer(query: str, page_num: int, page_text: str = "", shard: str = None):
+    """
+    Tries to answer a numeric question directly from the parsed tables of a page.
+    Returns {"value", "unit", "quantity"} when exactly one cell matches the query,
+    or None when the lookup is not confident (the caller then uses the LLM extractor).
+    """
+    params = extract_query_params(query)
+    if not params:
+        return None
+
+    query_words = set(re.findall(r"[a-z]+", query.lower().replace("wt", "weight")))
+    query_words = {w.upper() for w in query_words}
+
+    matches = set()
+    for grid in get_grids_for_page(page_num, page_text, shard):
+        result = _lookup(grid, query_words, params)
+        if result is not None and result[1]:
+            matches.add(result)
+
+    # Exactly one distinct answer, or nothing:
+    if len({value for _, value in matches}) != 1:
+        return None
+
+    quantity, value = sorted(matches)[0]
+    return {"value": value, "unit": _unit(quantity), "quantity": re.sub(r"\s*\([^()]*\)\s*$", "", quantity)}
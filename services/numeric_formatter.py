@@ -0,0 +1,127 @@
+# Local, template-based phrasing for numeric answers.
+# Rewording a number we already have does not need an LLM round trip: the quantity
+# is detected from the table (or the query), the unit comes from the table header,
+# and a fixed aviation-style template produces the final sentence.
+
+import re
+from decimal import Decimal, InvalidOperation
+
+# Quantities we have templates for, keyed by the phrase that identifies them.
+# Longer phrases are checked first, so "landing climb limit weight" wins over "climb limit weight".
+QUANTITY_TEMPLATES = {
+    "landing climb limit weight": "Based on the given conditions, the landing climb limit weight is {value} (page {page}).",
+    "quick turnaround limit weight": "Based on the given conditions, the quick turnaround limit weight is {value} (page {page}).",
+    "obstacle limit weight": "Based on the given conditions, the obstacle limit weight is {value} (page {page}).",
+    "field limit weight": "Based on the given conditions, the field limit weight is {value} (page {page}).",
+    "climb limit weight": "Based on the given conditions, the climb limit weight is {value} (page {page}).",
+    "level off weight": "Based on the given conditions, the net level off weight is {value} (page {page}).",
+    "corrected field length": "Based on the given conditions, the corrected field length is {value} (page {page}).",
+    "field length": "Based on the given conditions, the field length is {value} (page {page}).",
+    "runway length": "Based on the given conditions, the required runway length is {value} (page {page}).",
+    "fuel flow": "Based on the given conditions, the fuel flow is {value} (page {page}).",
+    "v1": "Based on the given conditions, V1 is {value} (page {page}).",
+    "vr": "Based on the given conditions, VR is {value} (page {page}).",
+    "v2": "Based on the given conditions, V2 is {value} (page {page}).",
+    "vref": "Based on the given conditions, VREF is {value} (page {page}).",
+}
+
+DEFAULT_TEMPLATE = "Based on the given conditions, the value from the table is {value} (page {page})."
+
+# Spelling used in the answer for units printed in table headers:
+UNIT_NAMES = {
+    "M": "m",
+    "FT": "ft",
+    "KG": "kg",
+    "KTS": "kts",
+    "KIAS": "kts",
+    "KG/HR": "kg/hr",
+    "%": "%",
+}
+
+
+def detect_quantity(query: str, quantity_label: str = None):
+    """
+    Returns the template key for the quantity being asked about.
+    The table's own quantity label is preferred; the query text is the fallback.
+    """
+    for text in (quantity_label, query):
+        if not text:
+            continue
+        text = " ".join(text.lower().replace(" wt", " weight").replace("-", " ").split())
+        for key in sorted(QUANTITY_TEMPLATES, key=len, reverse=True):
+            if re.search(rf"\b{re.escape(key)}\b", text):
+                return key
+    return None
+
+
+def find_unit_in_tables(tables: list, quantity: str):
+    """
+    Looks up the unit printed next to a quantity in the page's table headers,
+    e.g. "FIELD LIMIT WEIGHT (1000 KG)" → "1000 KG".
+    Headers often shorten the name ("LIMIT WEIGHT" for the quick turnaround limit weight),
+    so leading words are dropped one at a time until a header matches.
+    """
+    if not quantity:
+        return None
+
+    labels = []
+    for table in tables:
+        for row in table:
+            for cell in row:
+                if cell:
+                    labels.append(re.sub(r"\bWT\b", "WEIGHT", " ".join(cell.split()).upper()))
+
+    words = quantity.upper().split()
+    for start in range(len(words)):
+        for label in labels:
+            match = re.search(r"\(([^()]*)\)\s*$", label)
+            if match and all(re.search(rf"\b{re.escape(w)}\b", label) for w in words[start:]):
+                return match.group(1).strip()
+    return None
+
+
+def _group(number: Decimal) -> str:
+    """
+    Formats a number with thousands separators, keeping its decimals if it has any.
+    """
+    if number == number.to_integral_value():
+        return f"{int(number):,}"
+    return f"{number:,}"
+
+
+def format_value(value: str, unit: str = None) -> str:
+    """
+    Formats a table value with its unit, following the manual's conventions:
+    "52.2" in (1000 KG) → "52.2 (1000 kg), i.e. 52,200 kg"; "1840" in (M) → "1,840 m".
+    """
+    value = value.strip()
+    try:
+        number = Decimal(value.replace(",", ""))
+    except InvalidOperation:
+        return f"{value} ({unit})" if unit else value
+
+    if not unit:
+        return _group(number)
+
+    unit = " ".join(unit.upper().split())
+
+    # Scaled units such as "1000 KG" are shown both as printed and in full:
+    scaled = re.match(r"^(\d+)\s+(.+)$", unit)
+    if scaled:
+        base = UNIT_NAMES.get(scaled.group(2), scaled.group(2).lower())
+        full = number * Decimal(scaled.group(1))
+        return f"{value} ({scaled.group(1)} {base}), i.e. {_group(full)} {base}"
+
+    name = UNIT_NAMES.get(unit, unit.lower())
+    if name == "%":
+        return f"{value}%"
+    return f"{_group(number)} {name}"
+
+
+def format_numeric_answer(query: str, value: str, page: int, unit: str = None, quantity_label: str = None) -> str:
+    """
+    Builds the final answer sentence for a numeric result without calling an LLM.
+    """
+    quantity = detect_quantity(query, quantity_label)
+    template = QUANTITY_TEMPLATES.get(quantity, DEFAULT_TEMPLATE)
+    return template.format(value=format_value(value, unit), page=page)
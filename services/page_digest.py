@@ -0,0 +1,187 @@
+# Compact page digests and query-relevant passages, to keep Gemini prompts small.
+# At index time every page gets a digest (data/digests.json): its title/headings, the
+# headers of its tables with their printed conditions, and its most informative sentences.
+# The reranker and the numeric page selector compare candidates by their digests instead of
+# the full page text. For generation, only the passages of a page that match the question
+# are sent. With a sharded index every shard has its own digests.json.
+# digests.json is {"source": <signature of the tables file>, "pages": {page: digest}}; the
+# digests are only used while that signature matches the current tables.
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from services.lexical_index import tokenize
+from services.records import built_from, content_signature, iter_records
+from services.shards import shard_file, shard_tables_path
+from services.table_router import BOILERPLATE_SHARE, PAGE_CODE_RE, _conditions, _labels, _title
+
+DIGESTS_PATH = "data/digests.json"
+
+DIGEST_CHARS = 700         # Max length of a page digest
+TITLE_CHARS = 160          # Max length of the title part (text pages start with running text)
+KEY_SENTENCES = 3          # Most informative sentences kept per page
+MAX_SENTENCE_CHARS = 300   # Longer "sentences" are usually run-together table text
+PASSAGE_LINES = 6          # Lines per passage when a page is cut up for generation
+PASSAGE_CHARS = 1500       # Max page text per page in the generation prompt
+
+_lock = threading.Lock()
+_digests = {}    # shard -> {page: digest}
+
+
+def _clean(line: str) -> str:
+    # Checklist lines use dot leaders ("GROUND POWER switch ........ ON"):
+    return " ".join(re.sub(r"\.{3,}", " - ", line).split())
+
+
+def _sentences(text: str, boilerplate: set) -> list:
+    lines = [
+        _clean(l) for l in (l.strip() for l in text.split("\n"))
+        if l and l not in boilerplate and not PAGE_CODE_RE.match(l) and re.search(r"[A-Za-z]", l)
+    ]
+    return [s for s in re.split(r"(?<=[.!?])\s+", " ".join(lines)) if 20 <= len(s) <= MAX_SENTENCE_CHARS]
+
+
+def page_digest(text: str, tables: list, boilerplate: set, idf: dict) -> str:
+    """
+    Digest of one page: title, table headers with conditions, and the KEY_SENTENCES
+    sentences with the rarest words (in page order), cut to DIGEST_CHARS.
+    """
+    parts = []
+
+    title = _clean(_title(text, boilerplate))
+    if len(title) > TITLE_CHARS:
+        title = title[:TITLE_CHARS].rsplit(" ", 1)[0]
+    if title:
+        parts.append(f"Title: {title}")
+
+    labels = _labels(tables)
+    if labels:
+        conditions = _conditions(title)
+        printed = ", ".join(f"{k} {v}" for k, v in conditions.items())
+        parts.append(f"Tables: {'; '.join(labels)}" + (f" ({printed})" if printed else ""))
+
+    sentences = [s for s in _sentences(text, boilerplate) if s[:40] not in title]
+    scored = sorted(
+        range(len(sentences)),
+        key=lambda i: sum(idf.get(w, 0.0) for w in set(tokenize(sentences[i]))),
+        reverse=True
+    )
+    key = [sentences[i] for i in sorted(scored[:KEY_SENTENCES])]
+    if key:
+        parts.append("Key points: " + " ".join(key))
+
+    return "\n".join(parts)[:DIGEST_CHARS]
+
+
+def build_digest_data(page_records, table_entries) -> dict:
+    """
+    Digests for all pages, keyed by page number (as a string, like the table router).
+    """
+    texts = {record["page"]: record["text"] for record in page_records}
+
+    tables_by_page = {}
+    for entry in table_entries:
+        tables_by_page.setdefault(entry["page"], []).append(entry["table"])
+
+    # Headers/footers repeated across the manual are left out, as in the table router:
+    line_counts = Counter(line for text in texts.values() for line in {l.strip() for l in text.split("\n")} if line)
+    boilerplate = {line for line, n in line_counts.items() if n > BOILERPLATE_SHARE * max(len(texts), 1)}
+
+    df = Counter(word for text in texts.values() for word in set(tokenize(text)))
+    idf = {word: math.log(1 + len(texts) / count) for word, count in df.items()}
+
+    return {
+        str(page): page_digest(text, tables_by_page.get(page, []), boilerplate, idf)
+        for page, text in sorted(texts.items())
+    }
+
+
+def build_digests(pages_path: str, tables_path: str, output_path: str = DIGESTS_PATH) -> int:
+    """
+    Offline step: builds data/digests.json from the page text (pages.json, meta.json or
+    meta.jsonl) and tables.json(l). Returns the number of pages.
+    """
+    data = build_digest_data(iter_records(pages_path), iter_records(tables_path))
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"source": content_signature(tables_path), "pages": data}, f, indent=2, ensure_ascii=False)
+
+    return len(data)
+
+
+def _load_digests(shard: str = None) -> dict:
+    """
+    Loads data/digests.json (or the shard's) on first use; an empty dict if it has not been
+    built (or was built from other tables), in which case callers fall back to the page text.
+    """
+    digests_path = DIGESTS_PATH if shard is None else shard_file(shard, "digests.json")
+    tables_path = shard_tables_path(shard)
+
+    with _lock:
+        if shard not in _digests:
+            data = {}
+            if os.path.exists(digests_path):
+                with open(digests_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+
+            if "pages" in data and built_from(data.get("source"), tables_path):
+                _digests[shard] = data["pages"]
+            else:
+                print(f"[WARN] Page digests missing or stale ({digests_path}); prompts use the page text.")
+                _digests[shard] = {}
+
+        return _digests[shard]
+
+
+def get_digest(page: int, shard: str = None):
+    """
+    The digest of a page (of a shard, if given), or None if there is none.
+    """
+    return _load_digests(shard).get(str(page)) or None
+
+
+def reset_digests(shard: str = None):
+    """
+    Forgets the loaded digests (used after the index has been updated).
+    """
+    with _lock:
+        _digests.pop(shard, None)
+
+
+def relevant_passages(query: str, text: str, max_chars: int = PASSAGE_CHARS) -> str:
+    """
+    The parts of a page that matter for the question: the page is cut into passages of
+    PASSAGE_LINES lines, and the passages sharing the most words with the question are kept,
+    in page order, up to `max_chars`. Short pages are returned whole, and pages without any
+    matching passage are cut to `max_chars`.
+    """
+    if len(text) <= max_chars:
+        return text
+
+    lines = [l for l in text.split("\n") if l.strip()]
+    passages = ["\n".join(lines[i:i + PASSAGE_LINES]) for i in range(0, len(lines), PASSAGE_LINES)]
+
+    query_words = set(tokenize(query))
+
+    def score(i):
+        counts = Counter(w for w in tokenize(passages[i]) if w in query_words)
+        return sum(1 + math.log(n) for n in counts.values())
+
+    chosen = set()
+    used = 0
+    for i in sorted(range(len(passages)), key=score, reverse=True):
+        if score(i) <= 0:
+            break
+        if used + len(passages[i]) > max_chars:
+            continue
+        chosen.add(i)
+        used += len(passages[i])
+
+    if not chosen:
+        return text[:max_chars]
+
+    return "\n...\n".join(passages[i] for i in sorted(chosen))
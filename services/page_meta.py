@@ -0,0 +1,68 @@
+# Per-page metadata for search filters: the chapter of each page and whether it has data tables
+# (tables with labeled headers, the pages the table router and numeric engine work on; the
+# ruled checklists on most pages do not count).
+# Written at index time (page_meta.json next to the index) as {"source", "pages"}, where
+# "source" is the content signature of the tables file. When it is missing or was built from
+# other tables, the Retriever rebuilds it in memory.
+
+import json
+import os
+
+from services.records import built_from, content_signature, iter_records
+from services.table_router import PAGE_CODE_RE, _labels
+
+
+def chapter_of(text: str):
+    """
+    Chapter of a page from the page code printed on it ("NP.20.5" -> "NP.20"), or None.
+    """
+    for line in text.split("\n"):
+        line = line.strip()
+        if PAGE_CODE_RE.match(line):
+            return line.rsplit(".", 1)[0]
+    return None
+
+
+def build_page_meta_data(page_records, table_entries) -> dict:
+    """
+    {page: {"chapter", "has_tables"}} for all pages, keyed by page number (as a string).
+    """
+    tables_by_page = {}
+    for entry in table_entries:
+        tables_by_page.setdefault(entry["page"], []).append(entry["table"])
+    table_pages = {page for page, tables in tables_by_page.items() if _labels(tables)}
+
+    data = {}
+    chapter = None
+    for record in sorted(page_records, key=lambda r: r["page"]):
+        # Pages without a code (tabs, full-page diagrams) belong to the chapter before them:
+        chapter = chapter_of(record["text"]) or chapter
+        data[str(record["page"])] = {"chapter": chapter, "has_tables": record["page"] in table_pages}
+
+    return data
+
+
+def build_page_meta(pages_path: str, tables_path: str, output_path: str) -> int:
+    """
+    Offline step: writes page_meta.json from the page text and the tables. Returns the number of pages.
+    """
+    data = build_page_meta_data(iter_records(pages_path), iter_records(tables_path))
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"source": content_signature(tables_path), "pages": data}, f, indent=2, ensure_ascii=False)
+
+    return len(data)
+
+
+def load_page_meta(path: str, tables_path: str):
+    """
+    {page: entry} from page_meta.json, or None if it is missing or was built from other tables.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if "pages" not in data or not built_from(data.get("source"), tables_path):
+        return None
+    return {int(page): entry for page, entry in data["pages"].items()}
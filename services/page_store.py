@@ -0,0 +1,129 @@
+# Offset-indexed, memory-mapped page text store.
+# The page text lives in one binary file (UTF-8, pages back to back) plus a small
+# fixed-width index of (vector id, page, offset, length). Both are memory-mapped,
+# so a page's text is only read when that page is actually returned, and all
+# uvicorn workers share the same physical pages through the OS page cache.
+# A small config file next to the text (page_text.bin.json) records the content signature of
+# the metadata the store was built from. The store is a build output and is not kept in git.
+
+import json
+import mmap
+import os
+
+import numpy as np
+
+from services.records import built_from, content_signature, iter_records
+
+INDEX_DTYPE = np.dtype([("id", "<i8"), ("page", "<i8"), ("offset", "<i8"), ("length", "<i8")])
+
+
+def store_config_path(text_path: str) -> str:
+    return text_path + ".json"
+
+
+def is_current(text_path: str, index_path: str, meta_path: str) -> bool:
+    """
+    True if the page store exists and was built from the current contents of `meta_path`.
+    """
+    config_path = store_config_path(text_path)
+    if not all(os.path.exists(p) for p in (text_path, index_path, config_path)):
+        return False
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        return built_from(json.load(f).get("source"), meta_path)
+
+
+def build_page_store(meta_path: str, text_path: str, index_path: str):
+    """
+    Offline step: converts meta.json (or meta.jsonl) into the binary page store.
+    Pages are streamed through, so only the small fixed-width index is kept in memory.
+    Returns the number of stored pages.
+    """
+    rows = []
+    offset = 0
+
+    with open(text_path, "wb") as out:
+        for entry in iter_records(meta_path):
+            data = entry["text"].encode("utf-8")
+            out.write(data)
+            rows.append((entry["id"], entry["page"], offset, len(data)))
+            offset += len(data)
+
+    index = np.array(rows, dtype=INDEX_DTYPE)
+
+    # np.save adds the .npy header, so the index can be memory-mapped with np.load(mmap_mode="r"):
+    with open(index_path, "wb") as f:
+        np.save(f, index)
+
+    # Written last: the store only counts as built once this exists.
+    with open(store_config_path(text_path), "w", encoding="utf-8") as f:
+        json.dump({"source": content_signature(meta_path), "pages": len(index)}, f, indent=2)
+
+    return len(index)
+
+
+class PageStore:
+    def __init__(self, text_path: str, index_path: str):
+        """
+        Opens the page store without reading any page text.
+        """
+        self._index = np.load(index_path, mmap_mode="r")
+        self._file = open(text_path, "rb")
+
+        # mmap cannot map an empty file (a store with only blank pages):
+        if self._index.size and int(self._index["length"].sum()) > 0:
+            self._text = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._text = b""
+
+        # Vector id -> row in the index (ids normally equal rows, but are not required to):
+        ids = np.asarray(self._index["id"])
+        self._rows = None if np.array_equal(ids, np.arange(len(ids))) else {int(v): r for r, v in enumerate(ids)}
+
+    def __len__(self):
+        return len(self._index)
+
+    def _row(self, vector_id: int):
+        return vector_id if self._rows is None else self._rows[vector_id]
+
+    def get(self, vector_id: int) -> dict:
+        """
+        Returns the chunk for a FAISS vector id ({"id", "page", "text"}), reading its text on demand.
+        """
+        rec = self._index[self._row(vector_id)]
+        start, length = int(rec["offset"]), int(rec["length"])
+        return {
+            "id": int(rec["id"]),
+            "page": int(rec["page"]),
+            "text": self._text[start:start + length].decode("utf-8"),
+        }
+
+    def __iter__(self):
+        for rec in self._index:
+            yield self.get(int(rec["id"]))
+
+    def ids_and_pages(self):
+        """
+        (vector id, page) of every page, without reading any text.
+        """
+        return zip(self._index["id"].tolist(), self._index["page"].tolist())
+
+
+class InMemoryPages:
+    def __init__(self, meta_path: str):
+        """
+        Fallback when no binary page store has been built: loads meta.json fully.
+        """
+        self._entries = {e["id"]: e for e in iter_records(meta_path)}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, vector_id: int) -> dict:
+        return self._entries[vector_id]
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def ids_and_pages(self):
+        return [(e["id"], e["page"]) for e in self._entries.values()]
@@ -0,0 +1,290 @@
+# Runs one question through the full answering pipeline:
+# single-flight coalescing → query embedding → semantic answer cache → admission → retrieval → answer generation.
+# (An uncached query embedding is a Gemini call too, so it takes the admission slot early.)
+
+import asyncio
+import contextlib
+import os
+import time
+
+from services.answer_cache import answer_cache_from_env
+from services.generator import generate_answer_async, stream_answer_async
+from services.governor import Overloaded, admission
+from services.llm_client import start_deadline
+from services.metrics import REQUEST_SECONDS
+from services.query_type import is_numeric_query
+from services.shards import filter_scope
+from services.singleflight import SingleFlight
+from services.tracing import record_stream_error, span
+
+# Max number of batch items whose LLM stages (selection/rerank, generation) run at the same time:
+DEFAULT_BATCH_CONCURRENCY = 8
+
+
+def _sources(retrieved: list, pages: list):
+    """
+    The cited pages as {"shard", "page"} pairs when they come from a sharded index
+    (page numbers alone are ambiguous across manuals), else None.
+    """
+    if not any("shard" in c for c in retrieved):
+        return None
+    sources = []
+    for c in retrieved:
+        source = {"shard": c["shard"], "page": c["page"]}
+        if c["page"] in pages and source not in sources:
+            sources.append(source)
+    return sources
+
+
+def _with_sources(result: dict, sources) -> dict:
+    if sources is not None:
+        result["sources"] = sources
+    return result
+
+
+class _Slot:
+    """
+    An admission slot that is taken on first use (an uncached query embedding, or the
+    LLM stages) and held until the `async with` block ends. Questions answered from the
+    caches never take one.
+    """
+
+    def __init__(self):
+        self._stack = contextlib.AsyncExitStack()
+        self.held = False
+
+    async def take(self):
+        if not self.held:
+            await self._stack.enter_async_context(admission.admit())
+            self.held = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._stack.__aexit__(*exc_info)
+
+
+class QueryPipeline:
+    def __init__(self, retriever, answer_cache=None):
+        """
+        Wraps a Retriever with a semantic answer cache.
+        The cache watches the retriever's FAISS index and the table data (of every shard),
+        so it is cleared automatically when either is rebuilt.
+        Identical questions that arrive while one of them is being answered share its
+        computation (single-flight), so a burst costs one set of Gemini calls.
+        """
+        self.retriever = retriever
+        self.answer_cache = answer_cache if answer_cache is not None else answer_cache_from_env(
+            watch_paths=retriever.watch_paths
+        )
+        self.flights = SingleFlight()
+
+    async def _refresh_index(self):
+        """
+        Picks up an index swapped in by update_index.py. Checking is a single stat() call;
+        the reload itself runs in a worker thread.
+        """
+        if self.retriever.is_stale():
+            with span("index_reload"):
+                await asyncio.to_thread(self.retriever.reload)
+
+    async def answer_async(self, query: str, filters: dict = None) -> dict:
+        """
+        Answers a question. A cache hit skips retrieval, reranking/selection and
+        generation, i.e. every LLM call after the (cached) query embedding.
+        If the same question is already being answered, waits for that answer instead
+        ("coalesced": true).
+        `filters` restricts the search to matching manuals and pages (see services/shards.py);
+        an invalid filter raises ValueError.
+        """
+        filters = self.retriever.check_filters(filters)
+        scope = filter_scope(filters)
+
+        started = time.perf_counter()
+        try:
+            result, coalesced = await self.flights.do(query, lambda: self._answer(query, filters, scope), scope)
+            return {**result, "coalesced": coalesced}
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                    query_type="numeric" if is_numeric_query(query) else "text")
+
+    async def _answer(self, query: str, filters: dict, scope: str) -> dict:
+        # Every Gemini call of this question shares one deadline (LLM_REQUEST_DEADLINE):
+        start_deadline()
+        await self._refresh_index()
+
+        # Gemini is only called once the governor admits the question
+        # (raises Overloaded when the line is full):
+        async with _Slot() as slot:
+            with span("embed"):
+                query_vec = await self.retriever.embed_query_async(query, on_miss=slot.take)
+            if query_vec is None:
+                answer, pages = await generate_answer_async(query, [])
+                return {"answer": answer, "pages": pages, "cached": False}
+
+            cached = self.answer_cache.lookup(query, query_vec, scope)
+            if cached is not None:
+                answer, pages, sources = cached
+                return _with_sources({"answer": answer, "pages": pages, "cached": True}, sources)
+
+            await slot.take()
+            # Let retriever internally decide:
+            # - numeric mode → Gemini page selector
+            # - normal mode → reranker
+            # (either is skipped when FAISS is confident; `decision` records which path was taken)
+            decision = {}
+            retrieved = await self.retriever.search_async(query, query_vec=query_vec, decision=decision,
+                                                          filters=filters)
+
+            # Generate grounded answer
+            answer, pages = await generate_answer_async(query, retrieved)
+
+        sources = _sources(retrieved, pages)
+        self.answer_cache.store(query, query_vec, answer, pages, scope, sources)
+
+        return _with_sources({"answer": answer, "pages": pages, "cached": False, "retrieval": decision}, sources)
+
+    async def answer_batch_async(self, queries: list, concurrency: int = None, filters: dict = None) -> list:
+        """
+        Answers many questions at once. The cheap stages are vectorized over the whole
+        batch: embeddings are requested in batches and FAISS runs one matrix search.
+        The per-question LLM stages then fan out with bounded parallelism.
+        Returns one result per question, in the original order; a failing question gets
+        {"error": ...} without affecting the others (plus "retry_after" if it was not admitted).
+        The batched embedding requests hold one admission slot; if it is refused, every
+        question gets the Overloaded error.
+        `filters` applies to every question of the batch.
+        """
+        filters = self.retriever.check_filters(filters)
+        scope = filter_scope(filters)
+
+        if concurrency is None:
+            concurrency = int(os.getenv("BATCH_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY))
+
+        await self._refresh_index()
+
+        results = [None] * len(queries)
+        try:
+            async with _Slot() as slot:
+                with span("embed", rows=len(queries)):
+                    vecs = await self.retriever.embed_queries_async(queries, on_miss=slot.take)
+        except Overloaded as e:
+            return [{"error": str(e), "retry_after": e.retry_after} for _ in queries]
+
+        # Answer cache first; everything else goes into the shared FAISS search:
+        pending = []
+        for i, (query, vec) in enumerate(zip(queries, vecs)):
+            if vec is None:
+                results[i] = {"error": "Embedding failed."}
+                continue
+            cached = self.answer_cache.lookup(query, vec, scope)
+            if cached is not None:
+                answer, pages, sources = cached
+                results[i] = _with_sources({"answer": answer, "pages": pages, "cached": True}, sources)
+            else:
+                pending.append(i)
+
+        searched = await self.retriever.search_candidates_batch_async([vecs[i] for i in pending], filters=filters)
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def select_and_generate(i, candidates, distances):
+            query = queries[i]
+            async with admission.admit():
+                # Numeric questions get the table page selector, normal ones the reranker:
+                decision = {}
+                retrieved = await self.retriever.select_async(query, candidates, distances, decision=decision)
+                answer, pages = await generate_answer_async(query, retrieved)
+            sources = _sources(retrieved, pages)
+            self.answer_cache.store(query, vecs[i], answer, pages, scope, sources)
+            return _with_sources({"answer": answer, "pages": pages, "cached": False, "retrieval": decision}, sources)
+
+        async def answer_one(i, candidates, distances):
+            async with semaphore:
+                start_deadline()    # Each question's deadline starts when its LLM stages do
+                try:
+                    # Repeated questions (in this batch or in concurrent requests) are answered once:
+                    result, coalesced = await self.flights.do(
+                        queries[i], lambda: select_and_generate(i, candidates, distances), scope
+                    )
+                except Overloaded as e:
+                    results[i] = {"error": str(e), "retry_after": e.retry_after}
+                    return
+                except Exception as e:
+                    print(f"[ERROR] Batch item {i} failed:", e)
+                    results[i] = {"error": str(e) or type(e).__name__}
+                    return
+
+            results[i] = {**result, "coalesced": coalesced}
+
+        await asyncio.gather(*(
+            answer_one(i, candidates, distances)
+            for i, (candidates, distances) in zip(pending, searched)
+        ))
+
+        return results
+
+    async def stream_async(self, query: str, filters: dict = None):
+        """
+        Streaming version of answer_async(). Yields (event, data) pairs:
+        - ("retrieval", {"pages": [...], "retrieval": {...}})  as soon as the chosen pages are known
+        - ("token", {"text": "..."})       for each piece of the generated answer
+        - ("done", {"pages": [...], "cached": bool}) with the cited pages
+        - ("error", {"error": "..."}) instead of "done" if generation fails once streaming has
+          begun; the partial answer is not cached
+        With a sharded index, "retrieval" and "done" also carry "sources" ({"shard", "page"}).
+        An invalid `filters` raises ValueError before the first event.
+        """
+        filters = self.retriever.check_filters(filters)
+        scope = filter_scope(filters)
+
+        start_deadline()
+        await self._refresh_index()
+
+        # The slot is held until the answer has been streamed (or the client has gone):
+        async with _Slot() as slot:
+            with span("embed"):
+                query_vec = await self.retriever.embed_query_async(query, on_miss=slot.take)
+
+            cached = self.answer_cache.lookup(query, query_vec, scope) if query_vec is not None else None
+            if cached is not None:
+                answer, pages, sources = cached
+                yield "retrieval", _with_sources({"pages": pages}, sources)
+                yield "token", {"text": answer}
+                yield "done", _with_sources({"pages": pages, "cached": True}, sources)
+                return
+
+            await slot.take()
+            retrieved = []
+            decision = {}
+            if query_vec is not None:
+                retrieved = await self.retriever.search_async(query, query_vec=query_vec, decision=decision,
+                                                              filters=filters)
+
+            retrieved_pages = [c["page"] for c in retrieved]
+            yield "retrieval", _with_sources({"pages": retrieved_pages, "retrieval": decision},
+                                             _sources(retrieved, retrieved_pages))
+
+            parts = []
+            pages = []
+            try:
+                async for piece in stream_answer_async(query, retrieved):
+                    if "text" in piece:
+                        parts.append(piece["text"])
+                        yield "token", {"text": piece["text"]}
+                    else:
+                        pages = piece["pages"]
+            except Exception as e:
+                # The response has already started, so the client is told in-band:
+                print("[ERROR] Streaming answer failed:", e)
+                record_stream_error("generation")
+                yield "error", {"error": str(e) or type(e).__name__}
+                return
+
+        answer = "".join(parts).strip()
+        sources = _sources(retrieved, pages)
+        if query_vec is not None:
+            self.answer_cache.store(query, query_vec, answer, pages, scope, sources)
+
+        yield "done", _with_sources({"pages": pages, "cached": False}, sources)
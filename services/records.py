@@ -0,0 +1,138 @@
+# Reading and writing of the pipeline's record files (pages, chunks, metadata, tables).
+# A record file is either a JSON array (.json, written by the step-by-step scripts) or
+# JSON Lines (.jsonl, one record per line, appended by the streaming ingestion).
+# Readers accept both, and iterate JSONL line by line so memory stays flat.
+
+import hashlib
+import json
+import os
+
+SIGNATURE_SUFFIX = ".sig"
+
+_signatures = {}    # path -> ((mtime, size), content hash)
+
+
+def is_jsonl(path: str) -> bool:
+    return path.endswith(".jsonl")
+
+
+def iter_records(path: str):
+    """
+    Yields the records of a .json or .jsonl file one at a time.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if not is_jsonl(path):
+            yield from json.load(f)
+            return
+
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_records(path: str) -> list:
+    return list(iter_records(path))
+
+
+def write_records(path: str, records, indent: int = 2):
+    """
+    Writes records in the format given by the file extension.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        if is_jsonl(path):
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            json.dump(list(records), f, indent=indent, ensure_ascii=False)
+
+
+def newest_existing(*paths: str) -> str:
+    """
+    Returns the most recently written of the paths that exist (e.g. meta.jsonl from the
+    streaming ingestion or meta.json from build_indexer.py, whichever ran last), or the
+    last one if none exists yet. Call it when the file is needed, not at import time,
+    so a later build is picked up.
+    """
+    existing = [p for p in paths if os.path.exists(p)]
+    if not existing:
+        return paths[-1]
+    return max(existing, key=os.path.getmtime)
+
+
+def signature_path(path: str) -> str:
+    """
+    Sidecar holding the content hash of a record file: data/tables.json -> data/tables.json.sig
+    """
+    return path + SIGNATURE_SUFFIX
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_sidecar(path: str, stamp: tuple):
+    """
+    The hash stored next to a file, if it was taken of the file as it is now (same mtime and size).
+    """
+    try:
+        with open(signature_path(path), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (sidecar.get("mtime_ns"), sidecar.get("size")) != stamp:
+        return None
+    return sidecar.get("sha1")
+
+
+def _write_sidecar(path: str, stamp: tuple, signature: str):
+    """
+    Stores the hash next to the file (best effort: a read-only data/ just means hashing again).
+    """
+    tmp_path = f"{signature_path(path)}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"mtime_ns": stamp[0], "size": stamp[1], "sha1": signature}, f)
+        os.replace(tmp_path, signature_path(path))
+    except OSError:
+        pass
+
+
+def content_signature(path: str) -> str:
+    """
+    SHA-1 of a file's contents ("" if it does not exist). A derived artifact records the
+    signature of the file it was built from, so its freshness does not depend on mtimes,
+    which a git clone or a copy does not preserve.
+    Hashing is paid once per version of the file: the hash is kept in a sidecar
+    (<file>.sig, written when a builder first signs the file) together with the file's mtime
+    and size, so a starting worker only stats the file and reads the sidecar. After a clone or
+    copy, the first load hashes the file once and refreshes the sidecar.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _signatures.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    signature = _read_sidecar(path, stamp)
+    if signature is None:
+        signature = _hash_file(path)
+        _write_sidecar(path, stamp, signature)
+    _signatures[path] = (stamp, signature)
+    return signature
+
+
+def built_from(signature: str, source_path: str) -> bool:
+    """
+    True if an artifact that recorded `signature` was built from the current contents of
+    `source_path` (or the source is gone, so there is nothing newer to rebuild it from).
+    """
+    return not os.path.exists(source_path) or signature == content_signature(source_path)
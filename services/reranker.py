@@ -1,60 +1,125 @@
-# This code reranks the top FAISS-retrieved chunks for normal queries using Gemini.
-# Normal text questions often benefit from reordering because FAISS matches
-# only by vector similarity, while Gemini can judge by true semantic relevance.
-
-
-import os
-from dotenv import load_dotenv
-load_dotenv()
-
-import google.generativeai as genai
-
-# Loading the Gemini API key for reranking:
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-MODEL_NAME = "models/gemini-1.5-flash"
-
-def rerank(query: str, candidates: list, top_k: int = 2):
-    """
-    Uses Gemini to rerank FAISS candidate chunks for non-numeric queries.
-    Returns top_k most relevant candidates using reranking.
-    """
-    # Prepare text in a readable format so that Gemini can evaluate them:
-    # Truncating to avoid heavy token cost:
-    formatted = "\n\n".join(
-        f"[CHUNK {i} | Page {c['page']}]\n{c['text'][:1800]}"
-        for i, c in enumerate(candidates)
-    )
-    
-    # Instructing Gemini to output only JSON with scores for each chunk:
-    prompt = f"""
-You are a retrieval reranker for a Boeing 737 technical manual.
-
-User query:
-{query}
-
-Below are candidate chunks. Score each from 1 to 5 based on relevance.
-Return ONLY JSON: [{{"index": int, "score": int}}, ...]
-
-Candidates:
-{formatted}
-"""
-
-    model = genai.GenerativeModel(MODEL_NAME)
-    response = model.generate_content(prompt)
-
-    import json
-    try:
-        scores = json.loads(response.text)
-    except:
-        # # If Gemini fails, fall back to FAISS order.
-        return candidates[:top_k]
-
-    # Sort the chunks by score (highest first)
-    ranked = sorted(
-        [(s["score"], candidates[s["index"]]) for s in scores],
-        key=lambda x: x[0],
-        reverse=True
-    )
-
-    return [c for _, c in ranked[:top_k]]
+# This code reranks the top FAISS-retrieved chunks for normal queries using Gemini.
+# Normal text questions often benefit from reordering because FAISS matches
+# only by vector similarity, while Gemini can judge by true semantic relevance.
+
+
+import json
+
+from services.llm_client import generate, generate_async
+from services.page_digest import get_digest
+from services.shards import page_label
+from services.tracing import record_fallback
+
+MODEL_NAME = "models/gemini-1.5-flash"
+
+# Local hybrid reranking (BM25 fused with FAISS distances):
+VECTOR_WEIGHT = 0.5     # Share of the fused score that comes from vector similarity (rest is BM25)
+RERANK_MARGIN = 0.05    # Minimum fused-score gap at the top_k cut-off for the local order to be trusted
+
+
+def _normalize(values: list) -> list:
+    """
+    Min-max scales scores to [0, 1] (all zeros if they are identical).
+    """
+    lo, hi = min(values), max(values)
+    if hi - lo <= 1e-12:
+        return [0.0 for _ in values]
+    return [(v - lo) / (hi - lo) for v in values]
+
+
+def hybrid_rerank(query: str, candidates: list, distances: list, lexical_index, top_k: int = 2):
+    """
+    Reranks FAISS candidates in-process by fusing BM25 scores with vector similarity.
+    Returns (candidates sorted by fused score, decisive), where `decisive` is False when
+    the scores around the top_k cut-off are too close to trust the local order.
+    """
+    if len(candidates) <= top_k:
+        return list(candidates), True
+
+    # Smaller L2 distance means more similar, so the distances are flipped before fusing:
+    vector_scores = _normalize([-d for d in distances])
+    # Pages of a sharded index are identified by (shard, id):
+    keys = [(c["shard"], c["id"]) if "shard" in c else c["id"] for c in candidates]
+    lexical = lexical_index.score(query, keys)
+    lexical_scores = _normalize([lexical[key] for key in keys])
+
+    fused = [
+        VECTOR_WEIGHT * v + (1 - VECTOR_WEIGHT) * l
+        for v, l in zip(vector_scores, lexical_scores)
+    ]
+
+    order = sorted(range(len(candidates)), key=lambda i: fused[i], reverse=True)
+    ranked = [candidates[i] for i in order]
+
+    gap = fused[order[top_k - 1]] - fused[order[top_k]]
+    return ranked, gap >= RERANK_MARGIN
+
+
+def _build_rerank_prompt(query: str, candidates: list) -> str:
+    """
+    Builds the reranking prompt shared by the sync and async rerankers.
+    """
+    # Prepare text in a readable format so that Gemini can evaluate them:
+    # Each page is represented by its index-time digest (truncated text if there is none):
+    formatted = "\n\n".join(
+        f"[CHUNK {i} | {page_label(c)}]\n{get_digest(c['page'], c.get('shard')) or c['text'][:1800]}"
+        for i, c in enumerate(candidates)
+    )
+    
+    # Instructing Gemini to output only JSON with scores for each chunk:
+    return f"""
+You are a retrieval reranker for a Boeing 737 technical manual.
+
+User query:
+{query}
+
+Below are candidate chunks. Score each from 1 to 5 based on relevance.
+Return ONLY JSON: [{{"index": int, "score": int}}, ...]
+
+Candidates:
+{formatted}
+"""
+
+
+def _apply_scores(response_text: str, candidates: list, top_k: int):
+    """
+    Parses Gemini's JSON scores and returns the top_k candidates in score order.
+    """
+    try:
+        scores = json.loads(response_text)
+    except:
+        # # If Gemini fails, fall back to FAISS order.
+        record_fallback("rerank_json_parse")
+        return candidates[:top_k]
+
+    # Sort the chunks by score (highest first)
+    ranked = sorted(
+        [(s["score"], candidates[s["index"]]) for s in scores],
+        key=lambda x: x[0],
+        reverse=True
+    )
+
+    return [c for _, c in ranked[:top_k]]
+
+
+def rerank(query: str, candidates: list, top_k: int = 2):
+    """
+    Uses Gemini to rerank FAISS candidate chunks for non-numeric queries.
+    Returns top_k most relevant candidates using reranking.
+    """
+    prompt = _build_rerank_prompt(query, candidates)
+
+    response = generate(MODEL_NAME, prompt, stage="llm_rerank")
+
+    return _apply_scores(response.text, candidates, top_k)
+
+
+async def rerank_async(query: str, candidates: list, top_k: int = 2):
+    """
+    Async counterpart of rerank(); the Gemini call does not block the event loop.
+    """
+    prompt = _build_rerank_prompt(query, candidates)
+
+    response = await generate_async(MODEL_NAME, prompt, stage="llm_rerank")
+
+    return _apply_scores(response.text, candidates, top_k)
@@ -1,62 +1,515 @@
-import faiss
-import json
-import numpy as np
-
-from services.embedder import embed_text
-from services.reranker import rerank
-from services.query_type import is_numeric_query
-from services.numeric_selector import choose_best_numeric_chunk
-
-
-
-class Retriever:
-    def __init__(self, index_path="data/faiss.index", meta_path="data/meta.json"):
-        """
-        Loads the FAISS index and the metadata that maps each vector ID
-        back to its corresponding page and text.
-        """
-        self.index = faiss.read_index(index_path)
-
-        with open(meta_path, "r", encoding="utf-8") as f:
-            self.meta = json.load(f)
-
-    def search(self, query: str, top_k: int = 4, expand_k: int = 8):
-        """
-        Retrieves relevant chunks for the user query.
-        - For normal questions: use Reranking.
-        - For numeric/table-based questions: let Gemini choose the single correct page.
-        """
-
-        numeric = is_numeric_query(query)
-
-        # Create an embedding for the user query:
-        vec = embed_text(query)
-        if vec is None:
-            return []
-
-        query_vec = np.array([vec]).astype("float32")
-
-         # Retrieve top-K similar chunks from FAISS:
-        distances, indices = self.index.search(query_vec, expand_k)
-        candidates = [self.meta[idx] for idx in indices[0] if idx != -1]
-
-        if not candidates:
-            return []
-
-        # if Numeric based queries: Choose 1 best chunk.
-        if numeric:
-
-            # Gemini looks at the retrieved chunks and selects the page/chunk with the correct table:
-            best_chunk = choose_best_numeric_chunk(query, candidates)
-
-            if best_chunk is None:
-                return [candidates[0]]  # If Gemini fails, fall back to the most similar FAISS page.
-            
-            return [best_chunk]
-
-        # Normal queries use the reranker to sort out the best chunks: 
-        try:
-            reranked = rerank(query, candidates, top_k=top_k)
-            return reranked[:top_k]
-        except Exception:
-            return candidates[:top_k]
+import asyncio
+import faiss
+import json
+import os
+import threading
+import time
+import numpy as np
+
+from services.confidence import MAX_EXPAND_K, gate, record_path, reset_calibration
+from services.embedding_backends import backend_for_index
+from services.embedding_cache import cache_from_env
+from services.governor import Shed
+from services.index_factory import apply_search_params, load_index_config, search_parameters
+from services.lexical_index import BM25Index
+from services.numeric_engine import reset_grid_cache
+from services.page_digest import reset_digests
+from services.page_meta import build_page_meta_data, load_page_meta
+from services.page_store import InMemoryPages, PageStore, is_current
+from services.records import built_from, iter_records
+from services.reranker import hybrid_rerank, rerank, rerank_async
+from services.query_type import is_numeric_query
+from services.shards import (PAGE_FIELDS, PAGE_META_NAME, SHARD_FIELDS, matches, normalize_filters,
+                             shard_file, shard_meta_path, shard_tables_path)
+from services.numeric_selector import choose_best_numeric_chunk, choose_best_numeric_chunk_async
+from services.table_loader import reset_table_cache
+from services.table_router import reset_table_router, route_numeric_query
+from services.tracing import record_branch, record_fallback, span
+
+
+
+def _read_index(index_path: str):
+    """
+    Memory-maps the FAISS index where supported, so vectors are paged in on demand and
+    shared between workers; falls back to a regular read for index types that cannot be mapped.
+    """
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
+        return faiss.read_index(index_path, mmap_flag)
+    except RuntimeError:
+        return faiss.read_index(index_path)
+
+
+def _file_signature(path: str):
+    """
+    (mtime, size) of a file, used to notice when an artifact has been swapped on disk.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _top_hit_first(ranked: list, top_hit: dict) -> list:
+    """
+    The locally ranked candidates with the FAISS top hit moved to the front.
+    """
+    return [top_hit] + [c for c in ranked if c is not top_hit]
+
+
+def _gate(query: str, candidates: list, candidate_distances: list, decision: dict):
+    """
+    Query-type branch and confidence gate for one question's FAISS candidates.
+    Fills `decision` and returns (numeric, candidates, distances) cut to the gate's size.
+    """
+    numeric = is_numeric_query(query)
+    record_branch("numeric" if numeric else "text")
+
+    decision.update(gate("numeric" if numeric else "text", candidate_distances))
+    keep = decision["candidates"]
+    return numeric, candidates[:keep], candidate_distances[:keep]
+
+
+def _selection_plan(query: str, candidates: list, candidate_distances: list, lexical, top_k: int,
+                    decision: dict) -> dict:
+    """
+    The local part of select_pages(), shared by the sync and async versions.
+    Returns {"pages": [...]} when the pages are decided without Gemini, else the Gemini stage
+    to run: {"stage": "numeric_selector" | "llm_rerank", "candidates": [...], "fallback": [...]},
+    where "fallback" is the answer if that stage fails.
+    """
+    numeric, candidates, candidate_distances = _gate(query, candidates, candidate_distances, decision)
+
+    # if Numeric based queries: Choose 1 best chunk.
+    if numeric:
+
+        # The table router matches the question against the pages' tables locally:
+        with span("table_router"):
+            routed = route_numeric_query(query, candidates)
+        if routed is not None:
+            record_path(decision, "table_router")
+            return {"pages": [routed]}
+        record_fallback("router_undecided")
+
+        # FAISS is sure enough about its top page:
+        if decision["confident"]:
+            record_path(decision, "faiss_confident")
+            return {"pages": [candidates[0]]}
+
+        # Only if it cannot decide, Gemini looks at the retrieved chunks and selects the page/chunk with
+        # the correct table (if Gemini fails, the most similar FAISS page is used):
+        return {"stage": "numeric_selector", "candidates": candidates, "fallback": [candidates[0]]}
+
+    # Normal queries are reranked locally (BM25 + vector similarity).
+    # Gemini reranking is only used when the local scores are too close to decide:
+    with span("hybrid_rerank"):
+        ranked, decisive = hybrid_rerank(query, candidates, candidate_distances, lexical, top_k=top_k)
+    if decisive:
+        record_path(decision, "hybrid_rerank")
+        return {"pages": ranked[:top_k]}
+    record_fallback("hybrid_undecided")
+
+    # ... or when FAISS has an obvious top hit, which then stays first:
+    if decision["confident"]:
+        record_path(decision, "faiss_confident")
+        return {"pages": _top_hit_first(ranked, candidates[0])[:top_k]}
+
+    return {"stage": "llm_rerank", "candidates": ranked, "fallback": ranked[:top_k]}
+
+
+def _selection_result(plan: dict, picked, top_k: int, decision: dict) -> list:
+    """
+    The pages for the Gemini stage's answer (the chosen chunk or the reranked list).
+    """
+    if plan["stage"] == "numeric_selector":
+        if picked is None:
+            record_fallback("selector_failed")
+            record_path(decision, "selector_failed")
+            return plan["fallback"]
+        record_path(decision, "numeric_selector")
+        return [picked]
+
+    record_path(decision, "llm_rerank")
+    return picked[:top_k]
+
+
+def _selection_error(plan: dict, error: Exception, decision: dict) -> list:
+    """
+    The pages when the Gemini stage raised. The numeric selector handles its own errors and
+    only raises Overloaded, which goes to the caller; a failed rerank keeps the local order.
+    """
+    if plan["stage"] == "numeric_selector":
+        raise error
+
+    # Shed: dropped by the governor under load:
+    path = "rerank_shed" if isinstance(error, Shed) else "rerank_error"
+    record_fallback(path)
+    record_path(decision, path)
+    return plan["fallback"]
+
+
+def select_pages(query: str, candidates: list, candidate_distances: list, lexical, top_k: int = 4,
+                 decision: dict = None):
+    """
+    Second retrieval stage for one question, after the FAISS search (shared by the
+    Retriever and the ShardedRetriever; `lexical` scores the candidates with BM25):
+    - For normal questions: use Reranking.
+    - For numeric/table-based questions: choose the single correct page with the table router
+      (Gemini selector only when the router cannot decide).
+    When FAISS has an obvious top hit (confidence gate), the Gemini stage is skipped.
+    """
+    if not candidates:
+        return []
+
+    decision = {} if decision is None else decision
+    plan = _selection_plan(query, candidates, candidate_distances, lexical, top_k, decision)
+    if "pages" in plan:
+        return plan["pages"]
+
+    try:
+        with span(plan["stage"]):
+            if plan["stage"] == "numeric_selector":
+                picked = choose_best_numeric_chunk(query, plan["candidates"])
+            else:
+                picked = rerank(query, plan["candidates"], top_k=top_k)
+    except Exception as e:
+        return _selection_error(plan, e, decision)
+    return _selection_result(plan, picked, top_k, decision)
+
+
+async def select_pages_async(query: str, candidates: list, candidate_distances: list, lexical,
+                             top_k: int = 4, decision: dict = None):
+    """
+    Async counterpart of select_pages(): Gemini calls are awaited.
+    """
+    if not candidates:
+        return []
+
+    decision = {} if decision is None else decision
+    plan = _selection_plan(query, candidates, candidate_distances, lexical, top_k, decision)
+    if "pages" in plan:
+        return plan["pages"]
+
+    try:
+        with span(plan["stage"]):
+            if plan["stage"] == "numeric_selector":
+                picked = await choose_best_numeric_chunk_async(query, plan["candidates"])
+            else:
+                picked = await rerank_async(query, plan["candidates"], top_k=top_k)
+    except Exception as e:
+        return _selection_error(plan, e, decision)
+    return _selection_result(plan, picked, top_k, decision)
+
+
+class Retriever:
+    def __init__(self, index_path="data/faiss.index", meta_path=None,
+                 lexical_path="data/bm25.json", text_store_path="data/page_text.bin",
+                 page_index_path="data/page_text.idx.npy", embed_cache=None, shard=None):
+        """
+        Loads the FAISS index and the metadata that maps each vector ID
+        back to its corresponding page and text.
+        The index and the binary page store are memory-mapped, so page text is only
+        read when a page is returned; without a page store, meta.json is loaded instead.
+        Query embeddings go through an LRU cache, so repeated questions skip the embedding call.
+        Queries are always embedded with the backend that built the index (its config says which).
+        The BM25 index (built at index time) is used for local hybrid reranking; if it is
+        missing or was built from other metadata, it is rebuilt in memory.
+        Searches can be limited to pages of some chapters, or to pages with/without tables
+        (page_meta.json; built in memory on first use if it is missing or stale).
+        `shard` is set for one shard of a ShardedRetriever; its pages are tagged with it.
+        """
+        started = time.perf_counter()
+
+        self.index_path = index_path
+        self._meta_path = meta_path
+        self.lexical_path = lexical_path
+        self.text_store_path = text_store_path
+        self.page_index_path = page_index_path
+        self.shard = shard
+        self.page_meta_path = shard_file(shard, PAGE_META_NAME)
+
+        # (index, pages, lexical, embedding backend, filter cache, index config) are swapped
+        # together as one tuple, so a search running during reload() always sees a matching
+        # index and page store:
+        self._reload_lock = threading.Lock()
+        self._signature = _file_signature(index_path)
+        self._state = self._load()
+
+        self.embed_cache = embed_cache if embed_cache is not None else cache_from_env()
+        self.embed_cache.backend = self.embedder
+
+        wanted = os.getenv("EMBEDDING_BACKEND")
+        if wanted and wanted != self.embedder.name:
+            print(f"[WARN] EMBEDDING_BACKEND={wanted}, but the index was built with the "
+                  f"'{self.embedder.name}' embedder; queries use '{self.embedder.name}'.")
+
+        # Cold-start time, logged so regressions show up as the corpus grows:
+        self.startup_seconds = time.perf_counter() - started
+        print(f"[INFO] Retriever loaded {len(self.pages)} pages in {self.startup_seconds * 1000:.1f} ms "
+              f"({type(self.pages).__name__}, {self.index_config['type']} index"
+              f"{', shard ' + shard if shard else ''})")
+
+    @classmethod
+    def for_shard(cls, shard: str, embed_cache=None):
+        """
+        The Retriever of one shard of a sharded index (data/shards/<shard>/).
+        """
+        return cls(
+            index_path=shard_file(shard, "faiss.index"),
+            lexical_path=shard_file(shard, "bm25.json"),
+            text_store_path=shard_file(shard, "page_text.bin"),
+            page_index_path=shard_file(shard, "page_text.idx.npy"),
+            embed_cache=embed_cache,
+            shard=shard,
+        )
+
+    def _load(self):
+        # meta.jsonl/tables.jsonl come from the streaming ingestion, meta.json/tables.json from
+        # build_indexer.py/build_tables.py; whichever was written last is used, re-checked on reload:
+        self.meta_path = self._meta_path or shard_meta_path(self.shard)
+        self.tables_path = shard_tables_path(self.shard)
+        # The answer cache is cleared when any of these is replaced (both table files, since
+        # a newer one of either takes over):
+        self.watch_paths = (self.index_path, shard_file(self.shard, "tables.jsonl"),
+                            shard_file(self.shard, "tables.json"))
+
+        # The index type comes from the saved index; its search parameters (efSearch, nprobe)
+        # are not stored in the FAISS file, so they are restored from the index config:
+        index = _read_index(self.index_path)
+        self.index_config = load_index_config(self.index_path)
+        apply_search_params(index, self.index_config.get("params", {}))
+
+        embedder = backend_for_index(self.index_path, self.index_config)
+        dimension = self.index_config.get("embedding", {}).get("dimension")
+        if dimension is not None and dimension != index.d:
+            raise RuntimeError(f"{self.index_path} has {index.d}-dimensional vectors, "
+                               f"but its embedder produces {dimension}.")
+
+        if is_current(self.text_store_path, self.page_index_path, self.meta_path):
+            pages = PageStore(self.text_store_path, self.page_index_path)
+        else:
+            pages = InMemoryPages(self.meta_path)
+
+        lexical = BM25Index.load(self.lexical_path) if os.path.exists(self.lexical_path) else None
+        if lexical is None or not built_from(lexical.source, self.meta_path):
+            lexical = BM25Index.build(list(pages))
+
+        # Page metadata and the vector ids allowed by each page filter, filled on first use:
+        filter_cache = {}
+
+        return index, pages, lexical, embedder, filter_cache, self.index_config
+
+    @property
+    def index(self):
+        return self._state[0]
+
+    @property
+    def pages(self):
+        return self._state[1]
+
+    @property
+    def lexical(self):
+        return self._state[2]
+
+    @property
+    def embedder(self):
+        return self._state[3]
+
+    def is_stale(self) -> bool:
+        """
+        True if the FAISS index on disk was replaced since it was loaded (e.g. by update_index.py).
+        """
+        return _file_signature(self.index_path) != self._signature
+
+    def reload(self):
+        """
+        Re-reads the index, page store and BM25 index after an incremental update and swaps
+        them in atomically. Requests already running finish on the previous version.
+        """
+        with self._reload_lock:
+            if not self.is_stale():
+                return    # Another request already reloaded this version
+
+            started = time.perf_counter()
+            signature = _file_signature(self.index_path)
+            self._state = self._load()
+            self._signature = signature
+            self.embed_cache.backend = self.embedder
+
+            # The tables may have been re-extracted for the changed pages as well:
+            reset_table_cache(self.shard)
+            reset_grid_cache(self.shard)
+            reset_table_router(self.shard)
+            reset_digests(self.shard)
+            reset_calibration()
+
+            print(f"[INFO] Retriever reloaded {len(self.pages)} pages in "
+                  f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def check_filters(self, filters: dict) -> dict:
+        """
+        Normalizes a request's metadata filter (see services/shards.py). A single-manual
+        index only knows page filters; shard filters need the sharded layout.
+        """
+        filters = normalize_filters(filters)
+        shard_filters = [f for f in SHARD_FIELDS if f in filters]
+        if shard_filters:
+            raise ValueError(f"Filter '{shard_filters[0]}' needs a sharded index (data/shards/).")
+        return filters
+
+    def _page_meta(self, state) -> dict:
+        cache = state[4]
+        if "page_meta" not in cache:
+            cache["page_meta"] = load_page_meta(self.page_meta_path, self.tables_path)
+            if cache["page_meta"] is None:
+                data = build_page_meta_data(list(state[1]), iter_records(self.tables_path))
+                cache["page_meta"] = {int(page): entry for page, entry in data.items()}
+        return cache["page_meta"]
+
+    def allowed_ids(self, filters: dict, state=None):
+        """
+        Vector ids of the pages that pass the page filters (chapter, has_tables), or None if
+        the filter does not restrict pages. Computed once per filter and index version.
+        """
+        if not any(f in filters for f in PAGE_FIELDS):
+            return None
+
+        state = state or self._state
+        key = tuple((f, str(filters[f])) for f in PAGE_FIELDS if f in filters)
+        cache = state[4]
+        if key not in cache:
+            page_meta = self._page_meta(state)
+            cache[key] = np.array(
+                [vid for vid, page in state[1].ids_and_pages() if matches(page_meta.get(page, {}), filters, PAGE_FIELDS)],
+                dtype="int64"
+            )
+        return cache[key]
+
+    def _search_rows(self, matrix, expand_k: int, filters: dict = None) -> list:
+        """
+        One FAISS search for a matrix of query vectors (one row per question).
+        Returns (candidates, their FAISS distances) per row, mapped back to their page entries.
+        With page filters, FAISS only considers the allowed vector ids (an ID selector).
+        """
+        state = self._state
+        index, pages, config = state[0], state[1], state[5]
+        if matrix.shape[1] != index.d:
+            # A question embedded just before a reload that switched embedders:
+            raise RuntimeError(f"Query vectors have {matrix.shape[1]} dimensions, the index {index.d}.")
+
+        allowed = self.allowed_ids(filters or {}, state)
+        if allowed is not None and not len(allowed):
+            return [([], []) for _ in range(len(matrix))]
+
+        with span("faiss_search", rows=len(matrix)):
+            if allowed is None:
+                distances, indices = index.search(matrix, expand_k)
+            else:
+                params = search_parameters(config, faiss.IDSelectorBatch(allowed))
+                distances, indices = index.search(matrix, expand_k, params=params)
+
+        results = []
+        for row_distances, row_indices in zip(distances, indices):
+            pairs = [(pages.get(int(idx)), float(d)) for d, idx in zip(row_distances, row_indices) if idx != -1]
+            if self.shard is not None:
+                pairs = [({**c, "shard": self.shard}, d) for c, d in pairs]
+            results.append(([c for c, _ in pairs], [d for _, d in pairs]))
+        return results
+
+    def embed_query(self, query: str):
+        """
+        Returns the embedding for a user query (cached for repeated questions).
+        """
+        return self.embed_cache.get_or_embed(query)
+
+    async def embed_query_async(self, query: str, on_miss=None):
+        return await self.embed_cache.get_or_embed_async(query, on_miss=on_miss)
+
+    def search(self, query: str, top_k: int = 4, expand_k: int = None, query_vec=None, decision: dict = None,
+               filters: dict = None):
+        """
+        Retrieves relevant chunks for the user query.
+        - For normal questions: use Reranking.
+        - For numeric/table-based questions: choose the single correct page with the table router
+          (Gemini selector only when the router cannot decide).
+        When FAISS has an obvious top hit (confidence gate), the Gemini stage is skipped.
+        An already computed `query_vec` can be passed in to skip the embedding step.
+        If a `decision` dict is given, it is filled with how the pages were chosen.
+        `filters` (normalized by check_filters()) limit the search to some pages.
+        """
+        decision = {} if decision is None else decision
+
+        # Create an embedding for the user query:
+        if query_vec is not None:
+            vec = query_vec
+        else:
+            with span("embed"):
+                vec = self.embed_query(query)
+        if vec is None:
+            return []
+
+        query_vec = np.array([vec]).astype("float32")
+
+         # Retrieve the top similar chunks from FAISS (the gate decides how many are kept):
+        candidates, candidate_distances = self._search_rows(query_vec, expand_k or MAX_EXPAND_K, filters)[0]
+
+        return self.select(query, candidates, candidate_distances, top_k=top_k, decision=decision)
+
+    async def search_async(self, query: str, top_k: int = 4, expand_k: int = None, query_vec=None,
+                           decision: dict = None, filters: dict = None):
+        """
+        Async counterpart of search().
+        Gemini calls are awaited and the FAISS search runs in a worker thread,
+        so the event loop stays free while a query is in flight.
+        """
+
+        if query_vec is not None:
+            vec = query_vec
+        else:
+            with span("embed"):
+                vec = await self.embed_query_async(query)
+        if vec is None:
+            return []
+
+        query_vec = np.array([vec]).astype("float32")
+
+        # FAISS search is CPU-bound, so keep it off the event loop:
+        rows = await asyncio.to_thread(self._search_rows, query_vec, expand_k or MAX_EXPAND_K, filters)
+        candidates, candidate_distances = rows[0]
+
+        return await self.select_async(query, candidates, candidate_distances, top_k=top_k, decision=decision)
+
+    async def embed_queries_async(self, queries: list, on_miss=None) -> list:
+        """
+        Embeds many questions at once (cache first, then batched Gemini requests).
+        """
+        return await self.embed_cache.get_or_embed_many_async(queries, on_miss=on_miss)
+
+    async def search_candidates_batch_async(self, query_vecs: list, expand_k: int = MAX_EXPAND_K,
+                                            filters: dict = None) -> list:
+        """
+        Runs ONE FAISS search for a whole batch of query vectors (one matrix row per question).
+        Returns (candidates, distances) per vector, in the same order.
+        """
+        if not query_vecs:
+            return []
+
+        matrix = np.array(query_vecs).astype("float32")
+        return await asyncio.to_thread(self._search_rows, matrix, expand_k, filters)
+
+    def select(self, query: str, candidates: list, candidate_distances: list, top_k: int = 4,
+               decision: dict = None):
+        """
+        Second retrieval stage for one question, after the FAISS search (see select_pages()).
+        """
+        return select_pages(query, candidates, candidate_distances, self.lexical, top_k, decision)
+
+    async def select_async(self, query: str, candidates: list, candidate_distances: list, top_k: int = 4,
+                           decision: dict = None):
+        """
+        Second retrieval stage for one question, after the FAISS search:
+        numeric questions pick their single table page, normal questions are reranked.
+        The Gemini stage is skipped when the confidence gate trusts the FAISS top hit.
+        """
+        return await select_pages_async(query, candidates, candidate_distances, self.lexical, top_k, decision)
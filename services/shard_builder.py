@@ -0,0 +1,102 @@
+# Builds and updates one shard of the sharded index (see services/shards.py).
+# A shard is built with the same streaming ingestion as data/ (services/ingest.py), into
+# data/shards/<shard id>/, and its manifest is written last. Adding a manual therefore only
+# embeds that manual; the running API picks the new shard up on its next request.
+# All shards must share one embedder, so their FAISS distances can be merged: Gemini's is the
+# same everywhere, and the local embedder is fitted once, on the first local shard, and reused
+# (data/shards/library.embedder.npz).
+
+import os
+
+from services.embedding_backends import LocalBackend, create_backend, model_path_for
+from services.incremental import update_index
+from services.ingest import ingest_pdf, read_page_texts
+from services.shards import (MANIFEST_NAME, PAGE_META_NAME, SHARDS_DIR, check_shard_id, shard_dir, shard_file,
+                             write_manifest)
+
+LIBRARY_EMBEDDER = os.path.join(SHARDS_DIR, "library")    # -> data/shards/library.embedder.npz
+
+
+def _library_backend(pdf_path: str, embedding_backend: str = None):
+    """
+    The embedder for a new shard: Gemini, or the library's fitted local model (fitted on
+    this manual and saved if it is the first local shard).
+    """
+    backend = create_backend(embedding_backend)
+    if backend.name != "local":
+        return backend
+
+    path = model_path_for(LIBRARY_EMBEDDER)
+    if os.path.exists(path):
+        return LocalBackend.load(path)
+
+    backend.fit(read_page_texts(pdf_path))
+    backend.save(LIBRARY_EMBEDDER)
+    print(f"[INFO] Fitted the library's local embedder on {pdf_path} ({backend.key}).")
+    return backend
+
+
+def build_shard(shard: str, pdf_path: str, fields: dict, batch_size: int = 32, max_workers: int = 4,
+                index_type: str = "flat", index_params: dict = None, embedding_backend: str = None) -> int:
+    """
+    Ingests one manual into data/shards/<shard>/ and writes its manifest with `fields`
+    (aircraft, document, variant). Rebuilding an existing shard replaces it.
+    Returns the number of indexed pages.
+    """
+    check_shard_id(shard)
+    os.makedirs(shard_dir(shard), exist_ok=True)
+
+    # Hidden from the API while its artifacts are being rewritten:
+    if os.path.exists(shard_file(shard, MANIFEST_NAME)):
+        os.remove(shard_file(shard, MANIFEST_NAME))
+
+    count = ingest_pdf(
+        pdf_path,
+        meta_path=shard_file(shard, "meta.jsonl"),
+        tables_path=shard_file(shard, "tables.jsonl"),
+        index_path=shard_file(shard, "faiss.index"),
+        hashes_path=shard_file(shard, "page_hashes.json"),
+        lexical_path=shard_file(shard, "bm25.json"),
+        text_store_path=shard_file(shard, "page_text.bin"),
+        page_index_path=shard_file(shard, "page_text.idx.npy"),
+        table_store_path=shard_file(shard, "table_store.json"),
+        router_path=shard_file(shard, "table_router.json"),
+        digests_path=shard_file(shard, "digests.json"),
+        page_meta_path=shard_file(shard, PAGE_META_NAME),
+        batch_size=batch_size,
+        max_workers=max_workers,
+        index_type=index_type,
+        index_params=index_params,
+        embedding_backend=_library_backend(pdf_path, embedding_backend),
+    )
+
+    write_manifest(shard, fields)
+    return count
+
+
+def update_shard(shard: str, pdf_path: str, batch_size: int = 32, max_workers: int = 4) -> dict:
+    """
+    Applies a new revision of a shard's manual incrementally (see services/incremental.py).
+    """
+    check_shard_id(shard)
+    if not os.path.exists(shard_file(shard, MANIFEST_NAME)):
+        raise ValueError(f"Shard '{shard}' does not exist; build it first.")
+
+    return update_index(
+        pdf_path,
+        pages_path=shard_file(shard, "pages.json"),
+        chunks_path=shard_file(shard, "chunks.json"),
+        index_path=shard_file(shard, "faiss.index"),
+        meta_path=shard_file(shard, "meta.jsonl"),
+        hashes_path=shard_file(shard, "page_hashes.json"),
+        lexical_path=shard_file(shard, "bm25.json"),
+        text_store_path=shard_file(shard, "page_text.bin"),
+        page_index_path=shard_file(shard, "page_text.idx.npy"),
+        tables_path=shard_file(shard, "tables.jsonl"),
+        table_store_path=shard_file(shard, "table_store.json"),
+        router_path=shard_file(shard, "table_router.json"),
+        digests_path=shard_file(shard, "digests.json"),
+        page_meta_path=shard_file(shard, PAGE_META_NAME),
+        batch_size=batch_size,
+        max_workers=max_workers,
+    )
@@ -0,0 +1,264 @@
+# Retrieval over the sharded index: one Retriever per shard (see services/shards.py).
+# A question's filter first picks the shards (shard id, aircraft, document, variant), then the
+# pages inside them (chapter, data tables). Only the chosen shards are searched, in parallel
+# (FAISS releases the GIL), and their candidates are merged by FAISS distance. The merged list
+# goes through the same second stage as a single index (table router / page selector, hybrid /
+# LLM rerank), so search cost follows the filtered subset rather than the whole library.
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from services.confidence import MAX_EXPAND_K
+from services.embedding_cache import cache_from_env
+from services.retriever import Retriever, _file_signature, select_pages, select_pages_async
+from services.shards import (MANIFEST_NAME, SHARD_FIELDS, SHARDS_DIR, list_shards, matches, normalize_filters,
+                             shard_file)
+from services.tracing import span
+
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", "8"))    # Shards searched at once (sync path)
+
+
+class ShardedLexical:
+    def __init__(self, retrievers: dict):
+        """
+        BM25 over candidates from several shards; documents are (shard, id) pairs and each
+        is scored by its own shard's BM25 index.
+        """
+        self.retrievers = retrievers
+
+    def score(self, query: str, doc_ids: list) -> dict:
+        by_shard = {}
+        for shard, doc_id in doc_ids:
+            by_shard.setdefault(shard, []).append(doc_id)
+
+        scores = {}
+        for shard, ids in by_shard.items():
+            for doc_id, score in self.retrievers[shard].lexical.score(query, ids).items():
+                scores[(shard, doc_id)] = score
+        return scores
+
+
+def _merge(rows: list, expand_k: int):
+    """
+    Merges the (candidates, distances) of several shards into one list, nearest first.
+    """
+    pairs = [(d, c) for candidates, distances in rows for c, d in zip(candidates, distances)]
+    pairs.sort(key=lambda pair: pair[0])
+    pairs = pairs[:expand_k]
+    return [c for _, c in pairs], [d for d, _ in pairs]
+
+
+class ShardedRetriever:
+    def __init__(self, embed_cache=None):
+        """
+        Loads every complete shard in data/shards/ (one with a shard.json manifest).
+        All shards share one embedding cache and must share one embedder, since their
+        FAISS distances are compared when the candidates are merged.
+        """
+        started = time.perf_counter()
+
+        self.embed_cache = embed_cache if embed_cache is not None else cache_from_env()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, SHARD_SEARCH_WORKERS), thread_name_prefix="shard-search")
+
+        # (manifests, retrievers, manifest signatures) are swapped together when shards are
+        # added or removed:
+        self._reload_lock = threading.Lock()
+        self._signature = self._shards_signature()
+        self._state = self._load(None)
+
+        self.startup_seconds = time.perf_counter() - started
+        print(f"[INFO] Sharded retriever loaded {len(self.manifests)} shards "
+              f"({sum(len(r.pages) for r in self.retrievers.values())} pages) in {self.startup_seconds * 1000:.1f} ms")
+
+    def _shards_signature(self):
+        # A shard's manifest is written last when it is built, so it marks a complete shard:
+        return tuple(
+            (m["id"], _file_signature(shard_file(m["id"], MANIFEST_NAME))) for m in list_shards()
+        )
+
+    def _load(self, previous):
+        """
+        Opens the shards, reusing the Retrievers of shards whose manifest has not changed
+        since the `previous` state.
+        """
+        manifests = {m["id"]: m for m in list_shards()}
+        if not manifests:
+            raise RuntimeError(f"No shards found in {SHARDS_DIR} (build one with build_shard.py).")
+
+        signatures = dict(self._signature)
+        old_retrievers, old_signatures = (previous[1], previous[2]) if previous else ({}, {})
+
+        retrievers = {}
+        for shard in manifests:
+            if shard in old_retrievers and old_signatures.get(shard) == signatures.get(shard):
+                retrievers[shard] = old_retrievers[shard]
+            else:
+                retrievers[shard] = Retriever.for_shard(shard, embed_cache=self.embed_cache)
+
+        embedders = {r.embedder.key for r in retrievers.values()}
+        if len(embedders) > 1:
+            raise RuntimeError(f"Shards were embedded with different embedders ({', '.join(sorted(embedders))}); "
+                               f"rebuild them with the same EMBEDDING_BACKEND.")
+        self.embed_cache.backend = next(iter(retrievers.values())).embedder
+
+        return manifests, retrievers, signatures
+
+    @property
+    def manifests(self) -> dict:
+        return self._state[0]
+
+    @property
+    def retrievers(self) -> dict:
+        return self._state[1]
+
+    @property
+    def watch_paths(self) -> tuple:
+        # The answer cache is cleared when a shard is added (directory) or re-indexed:
+        return (SHARDS_DIR,) + tuple(p for r in self.retrievers.values() for p in r.watch_paths)
+
+    def is_stale(self) -> bool:
+        """
+        True if a shard was added, removed or rebuilt, or one shard's index was updated.
+        """
+        return (self._shards_signature() != self._signature
+                or any(r.is_stale() for r in self.retrievers.values()))
+
+    def reload(self):
+        """
+        Opens new shards, drops removed ones and reloads updated ones. Requests already
+        running finish on the previous set of shards.
+        """
+        with self._reload_lock:
+            if not self.is_stale():
+                return
+
+            started = time.perf_counter()
+            for retriever in self.retrievers.values():
+                if retriever.is_stale():
+                    retriever.reload()
+
+            self._signature = self._shards_signature()
+            self._state = self._load(self._state)
+
+            print(f"[INFO] Sharded retriever reloaded {len(self.manifests)} shards in "
+                  f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def check_filters(self, filters: dict) -> dict:
+        """
+        Normalizes a request's metadata filter (see services/shards.py).
+        """
+        return normalize_filters(filters)
+
+    def _select_shards(self, filters: dict, state) -> list:
+        manifests, retrievers = state[0], state[1]
+        return [retrievers[shard] for shard, manifest in manifests.items()
+                if matches(manifest, filters or {}, SHARD_FIELDS)]
+
+    def embed_query(self, query: str):
+        return self.embed_cache.get_or_embed(query)
+
+    async def embed_query_async(self, query: str, on_miss=None):
+        return await self.embed_cache.get_or_embed_async(query, on_miss=on_miss)
+
+    async def embed_queries_async(self, queries: list, on_miss=None) -> list:
+        return await self.embed_cache.get_or_embed_many_async(queries, on_miss=on_miss)
+
+    def _search_shards(self, matrix, expand_k: int, filters: dict, state) -> list:
+        """
+        Searches the shards that pass the filter in parallel and merges their candidates.
+        Returns (candidates, distances) per row of `matrix`.
+        """
+        shards = self._select_shards(filters, state)
+        if not shards:
+            return [([], []) for _ in range(len(matrix))]
+
+        with span("shard_search", shards=len(shards)):
+            per_shard = list(self._pool.map(lambda r: r._search_rows(matrix, expand_k, filters), shards))
+
+        return [_merge([rows[i] for rows in per_shard], expand_k) for i in range(len(matrix))]
+
+    async def _search_shards_async(self, matrix, expand_k: int, filters: dict, state) -> list:
+        """
+        Async counterpart of _search_shards(): one worker thread per shard.
+        """
+        shards = self._select_shards(filters, state)
+        if not shards:
+            return [([], []) for _ in range(len(matrix))]
+
+        with span("shard_search", shards=len(shards)):
+            per_shard = await asyncio.gather(*(
+                asyncio.to_thread(r._search_rows, matrix, expand_k, filters) for r in shards
+            ))
+
+        return [_merge([rows[i] for rows in per_shard], expand_k) for i in range(len(matrix))]
+
+    def search(self, query: str, top_k: int = 4, expand_k: int = None, query_vec=None, decision: dict = None,
+               filters: dict = None):
+        """
+        Retriever.search() over the shards that pass `filters`.
+        """
+        decision = {} if decision is None else decision
+        state = self._state
+
+        if query_vec is not None:
+            vec = query_vec
+        else:
+            with span("embed"):
+                vec = self.embed_query(query)
+        if vec is None:
+            return []
+
+        matrix = np.array([vec]).astype("float32")
+        candidates, distances = self._search_shards(matrix, expand_k or MAX_EXPAND_K, filters, state)[0]
+        decision["shards"] = sorted({c["shard"] for c in candidates})
+
+        return select_pages(query, candidates, distances, ShardedLexical(state[1]), top_k, decision)
+
+    async def search_async(self, query: str, top_k: int = 4, expand_k: int = None, query_vec=None,
+                           decision: dict = None, filters: dict = None):
+        """
+        Async counterpart of search().
+        """
+        decision = {} if decision is None else decision
+        state = self._state
+
+        if query_vec is not None:
+            vec = query_vec
+        else:
+            with span("embed"):
+                vec = await self.embed_query_async(query)
+        if vec is None:
+            return []
+
+        matrix = np.array([vec]).astype("float32")
+        rows = await self._search_shards_async(matrix, expand_k or MAX_EXPAND_K, filters, state)
+        candidates, distances = rows[0]
+        decision["shards"] = sorted({c["shard"] for c in candidates})
+
+        return await select_pages_async(query, candidates, distances, ShardedLexical(state[1]), top_k, decision)
+
+    async def search_candidates_batch_async(self, query_vecs: list, expand_k: int = MAX_EXPAND_K,
+                                            filters: dict = None) -> list:
+        """
+        One FAISS search per shard for a whole batch of query vectors; (candidates, distances)
+        per vector, in the same order.
+        """
+        if not query_vecs:
+            return []
+
+        matrix = np.array(query_vecs).astype("float32")
+        return await self._search_shards_async(matrix, expand_k, filters, self._state)
+
+    def select(self, query: str, candidates: list, candidate_distances: list, top_k: int = 4,
+               decision: dict = None):
+        return select_pages(query, candidates, candidate_distances, ShardedLexical(self.retrievers), top_k, decision)
+
+    async def select_async(self, query: str, candidates: list, candidate_distances: list, top_k: int = 4,
+                           decision: dict = None):
+        return await select_pages_async(query, candidates, candidate_distances, ShardedLexical(self.retrievers),
+                                        top_k, decision)
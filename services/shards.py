@@ -0,0 +1,137 @@
+# Sharded corpus layout for a fleet library with several manuals.
+# Each manual (or variant of one) is a shard: data/shards/<shard id>/ holds the same artifacts
+# that data/ holds for the single-manual layout (faiss.index, meta.jsonl, bm25.json,
+# page_text.bin, tables.jsonl, table_store.json, table_router.json, digests.json, ...), plus
+# - shard.json:      what the shard is ({"id", "aircraft", "document", "variant"})
+# - page_meta.json:  per page, its chapter and whether it has tables
+# Adding a manual builds one new shard (build_shard.py); the other shards are not touched.
+# Throughout the services a shard id of None stands for the single-manual layout in data/.
+
+import json
+import os
+import re
+
+from services.records import newest_existing
+
+SHARDS_DIR = "data/shards"
+MANIFEST_NAME = "shard.json"
+PAGE_META_NAME = "page_meta.json"
+
+SHARD_FIELDS = ("shard", "aircraft", "document", "variant")    # Filter on which shards are searched
+PAGE_FIELDS = ("chapter", "has_tables")                        # Filter on which pages of a shard are searched
+FILTER_FIELDS = SHARD_FIELDS + PAGE_FIELDS
+
+_SHARD_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+def shard_dir(shard: str = None) -> str:
+    return "data" if shard is None else os.path.join(SHARDS_DIR, shard)
+
+
+def shard_file(shard: str, name: str) -> str:
+    """
+    Path of one artifact of a shard, e.g. shard_file("b737-800-fcom", "faiss.index").
+    """
+    return os.path.join(shard_dir(shard), name)
+
+
+def shard_tables_path(shard: str = None) -> str:
+    # tables.jsonl comes from the streaming ingestion, tables.json from build_tables.py:
+    return newest_existing(shard_file(shard, "tables.jsonl"), shard_file(shard, "tables.json"))
+
+
+def shard_meta_path(shard: str = None) -> str:
+    return newest_existing(shard_file(shard, "meta.jsonl"), shard_file(shard, "meta.json"))
+
+
+def page_label(chunk: dict) -> str:
+    """
+    How a page is referred to in prompts: "Page 12", or "b737-800-fcom, Page 12" for a shard.
+    """
+    shard = chunk.get("shard")
+    return f"{shard}, Page {chunk['page']}" if shard else f"Page {chunk['page']}"
+
+
+def check_shard_id(shard: str) -> str:
+    if not _SHARD_ID_RE.match(shard or ""):
+        raise ValueError(f"Invalid shard id '{shard}' (letters, digits, '.', '_' and '-' only).")
+    return shard
+
+
+def write_manifest(shard: str, fields: dict):
+    """
+    Writes data/shards/<shard>/shard.json. It is written last by build_shard.py, so a shard
+    only becomes visible to the API once all its artifacts are in place.
+    """
+    manifest = {"id": shard, **{k: fields.get(k) for k in SHARD_FIELDS if k != "shard"}}
+    with open(shard_file(shard, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+
+def list_shards(shards_dir: str = SHARDS_DIR) -> list:
+    """
+    Manifests of all complete shards, sorted by id (empty without a sharded layout).
+    """
+    if not os.path.isdir(shards_dir):
+        return []
+
+    manifests = []
+    for name in sorted(os.listdir(shards_dir)):
+        path = os.path.join(shards_dir, name, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def normalize_filters(filters: dict) -> dict:
+    """
+    Checks a metadata filter from a request and brings it into one form:
+    {field: [allowed values]} for text fields, {"has_tables": bool}. Empty fields are dropped.
+    Example: {"aircraft": "B737", "document": ["FCOM", "QRH"], "has_tables": true}
+    """
+    normalized = {}
+    for field, value in (filters or {}).items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Unknown filter '{field}'. Filters: {', '.join(FILTER_FIELDS)}")
+        if value is None or value == [] or value == "":
+            continue
+        if field == "has_tables":
+            if not isinstance(value, bool):
+                raise ValueError("Filter 'has_tables' must be true or false.")
+            normalized[field] = value
+        else:
+            values = value if isinstance(value, list) else [value]
+            normalized[field] = sorted({str(v) for v in values})
+    return normalized
+
+
+def filter_scope(filters: dict) -> str:
+    """
+    Canonical text of a normalized filter, so caches and in-flight coalescing keep answers
+    for differently filtered questions apart ("" without a filter).
+    """
+    return json.dumps(filters, sort_keys=True) if filters else ""
+
+
+def matches(record: dict, filters: dict, fields: tuple) -> bool:
+    """
+    True if a manifest or page metadata entry passes the filter's `fields`.
+    Text values are compared case-insensitively.
+    """
+    for field in fields:
+        if field not in filters:
+            continue
+        wanted = filters[field]
+        value = record.get("id" if field == "shard" else field)
+        if field == "has_tables":
+            if bool(value) != wanted:
+                return False
+        elif field == "chapter":
+            # A chapter filter also matches its sections: "NP" matches "NP.20"
+            chapter = (value or "").lower()
+            if not any(chapter == w.lower() or chapter.startswith(w.lower() + ".") for w in wanted):
+                return False
+        elif value is None or str(value).lower() not in {w.lower() for w in wanted}:
+            return False
+    return True
@@ -0,0 +1,69 @@
+# Single-flight coalescing of identical in-flight questions.
+# When a briefing starts, many tablets send the same question within a second. The first
+# request (the leader) runs the pipeline; every identical request that arrives while it is
+# still running waits for that same computation and gets its result, instead of spending
+# its own embedding, rerank/selector and generation calls.
+# Questions are matched by normalize_query() (case, spacing, trailing punctuation) and by
+# their search filter (scope), since the same question about another manual is a different one.
+
+import asyncio
+
+from services.embedding_cache import normalize_query
+from services.metrics import Counter
+from services.tracing import count_upstream_calls
+
+COALESCED = Counter("rag_coalesced_requests_total", "Requests by single-flight role (leader or follower).", ("role",))
+SAVED_CALLS = Counter("rag_coalesced_saved_calls_total", "Gemini calls saved by coalescing identical questions.", ("stage",))
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        In-flight computations by normalized question. Only used from the event loop thread.
+        """
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def _lead(self, flight: dict, compute):
+        flight["calls"] = count_upstream_calls()
+        return await compute()
+
+    async def do(self, query: str, compute, scope: str = ""):
+        """
+        Returns (result, coalesced). `compute` is an async callable without arguments; it
+        runs once for all concurrent callers with the same normalized question. Its errors
+        are raised to every caller. A caller that is cancelled (e.g. the client hung up)
+        does not cancel the shared computation for the others.
+        """
+        key = f"{scope}::{normalize_query(query)}" if scope else normalize_query(query)
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.followers += 1
+            COALESCED.inc(role="follower")
+            flight["followers"] += 1
+            return await asyncio.shield(flight["task"]), True
+
+        flight = {"followers": 0, "calls": []}
+        # The task copies the leader's context (trace, deadline), like asyncio.to_thread:
+        flight["task"] = asyncio.ensure_future(self._lead(flight, compute))
+        self._flights[key] = flight
+        self.leaders += 1
+        COALESCED.inc(role="leader")
+
+        def finished(task):
+            # Later identical questions start a new computation (or hit the answer cache):
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if flight["followers"]:
+                for stage in flight["calls"]:
+                    SAVED_CALLS.inc(flight["followers"], stage=stage)
+            if not task.cancelled():
+                task.exception()    # Marks an error as retrieved even if every caller has gone
+
+        flight["task"].add_done_callback(finished)
+        return await asyncio.shield(flight["task"]), False
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self._flights)}
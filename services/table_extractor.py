@@ -1,42 +1,157 @@
 import pdfplumber
 import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def extract_tables_pdf(pdf_path: str, output_json: str):
+PAGES_PER_TASK = 8    # Pages handed to a worker at a time (small enough to balance uneven pages)
+TASKS_PER_WORKER = 2  # Tasks queued per worker when streaming (bounds the pages held in memory)
+
+
+def _page_tables(page, page_num: int):
+    """
+    Extracts the tables of one pdfplumber page.
+    pdfplumber's default strategy builds tables from ruling lines and rectangle borders,
+    so a page without any such edges cannot contain a table and is skipped without
+    running the (slow) full table finder.
+    Returns (tables, skipped).
+    """
+    if not page.edges:
+        return [], True
+
+    try:
+        return page.extract_tables() or [], False
+    except Exception as e:
+        print(f"[WARN] Failed table extraction on page {page_num}: {e}")
+        return [], False
+
+
+def _extract_page_range(pdf_path: str, page_numbers: list):
+    """
+    Worker task: opens the PDF itself (open documents cannot be shared between processes)
+    and extracts the tables of the given 1-based pages.
+    Returns [(page, tables, seconds, skipped), ...].
+    """
+    results = []
+
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num in page_numbers:
+            started = time.perf_counter()
+            tables, skipped = _page_tables(pdf.pages[page_num - 1], page_num)
+            results.append((page_num, tables, time.perf_counter() - started, skipped))
+
+            # pdfplumber caches every parsed page object; free them as we go:
+            pdf.pages[page_num - 1].close()
+
+    return results
+
+
+def extract_tables_pdf(pdf_path: str, output_json: str, workers: int = None):
     """
     Extract all tables from the PDF using pdfplumber.
-    The output JSON maps each detected table to its page number
+    Page ranges are split across a pool of `workers` processes (default: one per CPU core),
+    each opening the PDF on its own; `workers=1` runs everything in this process.
+    The output JSON maps each detected table to its page number, in page order
     Saves JSON:
       [
          { "page": int, "table": [ [...], [...], ... ] },
          ...
       ]
     """
-    final_tables = []
+    started = time.perf_counter()
 
     with pdfplumber.open(pdf_path) as pdf:
-        for page_no, page in enumerate(pdf.pages):
-            print(f"[INFO] Scanning page {page_no + 1}...")
-
-            # Try to extract tables from the current page
-            try:
-                tables = page.extract_tables()
-            except Exception as e:
-                print(f"[WARN] Failed table extraction on page {page_no + 1}: {e}")
-                continue
-
-            if not tables:
-                continue
-            
-             # Storing each table separately with its page reference:
-            for t in tables:
-                final_tables.append({
-                    "page": page_no + 1,
-                    "table": t
-                })
+        page_count = len(pdf.pages)
+
+    page_numbers = list(range(1, page_count + 1))
+    tasks = [page_numbers[i:i + PAGES_PER_TASK] for i in range(0, page_count, PAGES_PER_TASK)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+
+    tables_by_page = {}
+    skipped_pages = 0
+
+    def report(results):
+        nonlocal skipped_pages
+        for page_num, tables, seconds, skipped in results:
+            tables_by_page[page_num] = tables
+            skipped_pages += skipped
+            status = "no table structure, skipped" if skipped else f"{len(tables)} tables"
+            print(f"[INFO] Page {page_num}/{page_count}: {status} ({seconds * 1000:.0f} ms) "
+                  f"[{len(tables_by_page)}/{page_count} done]")
+
+    if workers == 1:
+        for task in tasks:
+            report(_extract_page_range(pdf_path, task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_extract_page_range, pdf_path, task) for task in tasks]
+            for future in as_completed(futures):
+                report(future.result())
+
+    # Workers finish out of order, so merge the results back in page order:
+    final_tables = []
+    for page_num in sorted(tables_by_page):
+        # Storing each table separately with its page reference:
+        for t in tables_by_page[page_num]:
+            final_tables.append({
+                "page": page_num,
+                "table": t
+            })
 
     # Save all extracted tables to a JSON file for retrieval:
     with open(output_json, "w", encoding="utf-8") as f:
         json.dump(final_tables, f, indent=2, ensure_ascii=False)
 
-    print(f"[INFO] Extracted {len(final_tables)} tables.")
+    print(f"[INFO] Extracted {len(final_tables)} tables from {page_count} pages "
+          f"({skipped_pages} skipped) in {time.perf_counter() - started:.1f} s using {workers} processes.")
     return final_tables
+
+
+def iter_page_tables(pdf_path: str, page_numbers: list, workers: int = None):
+    """
+    Yields (page, tables) for the given (1-based) pages in page order, extracted by a pool
+    of `workers` processes (default: one per CPU core; 1 = in this process).
+    Only TASKS_PER_WORKER tasks per worker are queued ahead of the caller, so a streaming
+    caller holds a bounded window of pages however long the document is.
+    """
+    page_numbers = sorted(page_numbers)
+    tasks = [page_numbers[i:i + PAGES_PER_TASK] for i in range(0, len(page_numbers), PAGES_PER_TASK)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+
+    if workers == 1:
+        for task in tasks:
+            for page_num, tables, _, _ in _extract_page_range(pdf_path, task):
+                yield page_num, tables
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for task in tasks:
+            in_flight.append(pool.submit(_extract_page_range, pdf_path, task))
+            if len(in_flight) >= workers * TASKS_PER_WORKER:
+                for page_num, tables, _, _ in in_flight.popleft().result():
+                    yield page_num, tables
+
+        while in_flight:
+            for page_num, tables, _, _ in in_flight.popleft().result():
+                yield page_num, tables
+
+
+def extract_tables_for_pages(pdf_path: str, page_numbers: list, workers: int = None):
+    """
+    Extracts tables only from the given (1-based) pages, e.g. the pages changed in a
+    manual revision, with the same process pool as extract_tables_pdf().
+    Returns entries in the tables.json format, in page order.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+    pages = [p for p in page_numbers if 1 <= p <= page_count]
+
+    entries = []
+    for page_num, tables in iter_page_tables(pdf_path, pages, workers):
+        print(f"[INFO] Scanned page {page_num}: {len(tables)} tables")
+        for t in tables:
+            entries.append({"page": page_num, "table": t})
+
+    return entries
@@ -1,16 +1,78 @@
-# Loads pre-extracted tables into memory so numeric queries can access them instantly.
-# (This does not extract tables from the PDF— it only reads tables.json at runtime.)
-
-import json
-
-TABLE_JSON_PATH = "data/tables.json"
-
-# Load once on import:
-with open(TABLE_JSON_PATH, "r", encoding="utf-8") as f:
-    TABLE_DATA = json.load(f)
-
-def get_tables_for_page(page_num: int):
-    """
-    Returns a list of tables for the given page number.
-    """
-    return [t["table"] for t in TABLE_DATA if t["page"] == page_num]
+# Loads pre-extracted tables so numeric queries can access them instantly.
+# (This does not extract tables from the PDF— it only reads tables.json / table_store.json at runtime.)
+# Nothing is read at import time; each file is loaded on first use and indexed by page.
+# With a sharded index every shard has its own tables (see services/shards.py); shard=None is data/.
+
+import json
+import os
+import threading
+
+from services.records import built_from, iter_records
+from services.shards import shard_file, shard_tables_path
+from services.table_store import build_table_store_data
+
+TABLE_STORE_PATH = "data/table_store.json"
+
+_lock = threading.Lock()
+_tables_by_page = {}      # shard -> {page -> raw tables (list-of-lists)}, from tables.json
+_table_store = {}         # shard -> compact store built offline by build_table_store()
+
+
+def _tables_path(shard: str = None) -> str:
+    # tables.jsonl (streaming ingestion) or tables.json (build_tables.py), whichever is newer:
+    return shard_tables_path(shard)
+
+
+def _load_tables_by_page(shard: str = None) -> dict:
+    with _lock:
+        if shard not in _tables_by_page:
+            by_page = {}
+            for t in iter_records(_tables_path(shard)):
+                by_page.setdefault(t["page"], []).append(t["table"])
+            _tables_by_page[shard] = by_page
+
+        return _tables_by_page[shard]
+
+
+def _load_table_store(shard: str = None) -> dict:
+    tables_path = _tables_path(shard)
+    store_path = TABLE_STORE_PATH if shard is None else shard_file(shard, "table_store.json")
+
+    with _lock:
+        if shard not in _table_store:
+            # Use the offline-built store unless it is missing or was built from other tables:
+            store = None
+            if os.path.exists(store_path):
+                with open(store_path, "r", encoding="utf-8") as f:
+                    store = json.load(f)
+            if store is None or not built_from(store.get("source"), tables_path):
+                store = build_table_store_data(iter_records(tables_path))
+            _table_store[shard] = store
+
+        return _table_store[shard]
+
+
+def get_tables_for_page(page_num: int, shard: str = None):
+    """
+    Returns a list of tables for the given page number (of a shard, if given).
+    """
+    return _load_tables_by_page(shard).get(page_num, [])
+
+
+def get_table_text_for_page(page_num: int, shard: str = None):
+    """
+    Returns the tables for the given page as compact pipe-delimited text,
+    ready to be placed in a prompt.
+    """
+    store = _load_table_store(shard)
+    return [store["tables"][i] for i in store["pages"].get(str(page_num), [])]
+
+
+def reset_table_cache(shard: str = None):
+    """
+    Forgets the loaded tables so the next lookup re-reads them from disk
+    (used after tables.json or the table store has been rebuilt).
+    """
+    with _lock:
+        _tables_by_page.pop(shard, None)
+        _table_store.pop(shard, None)
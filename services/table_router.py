@@ -0,0 +1,275 @@
+# Offline-built router over the table pages, used to pick the page for a numeric question
+# without sending every candidate page to Gemini.
+# For each page with data tables it stores the page title, the labeled headers and their
+# units (e.g. "FIELD LIMIT WEIGHT (1000 KG)"), the ranges of the table axes (OAT, pressure
+# altitude, field length, ...) and the printed conditions (runway dry/wet, flaps setting).
+# At query time the question's keywords and parameters are matched against these entries;
+# when no page clearly wins, the caller falls back to the LLM selector.
+# With a sharded index each shard has its own router; candidates are scored by their shard's.
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from services.lexical_index import tokenize
+from services.numeric_engine import extract_query_params, parse_page_grids
+from services.records import built_from, content_signature, iter_records
+from services.shards import shard_file, shard_tables_path
+
+TABLE_ROUTER_PATH = "data/table_router.json"
+
+TITLE_LINES = 6          # Non-boilerplate text lines at the top of a page used as its title
+BOILERPLATE_SHARE = 0.1  # Lines printed on more than this share of pages are headers/footers
+PARAM_BONUS = 1.0        # Score for each query parameter the page's tables cover
+PARAM_PENALTY = 1.0      # Score lost for each query parameter the page's tables do not have
+ROUTER_MARGIN = 1.0      # Lead the best page needs over the runner-up to be chosen without the LLM
+
+LABEL_RE = re.compile(r"^(?P<name>[A-Z][A-Z0-9 &'./-]*?)\s*\((?P<unit>[^()]+)\)$")
+PAGE_CODE_RE = re.compile(r"^[A-Z]+\.\d+(?:\.\d+)*$")    # e.g. "PD.10.2"
+
+_lock = threading.Lock()
+_routers = {}    # shard -> TableRouter, or False if that shard has no usable router
+
+
+def _conditions(text: str) -> dict:
+    """
+    Operating conditions a table is printed for, e.g. {"runway": "wet", "flaps": [5]}.
+    """
+    text = text.lower()
+    conditions = {}
+
+    runway = re.search(r"\b(dry|wet)\s+runway", text)
+    if runway:
+        conditions["runway"] = runway.group(1)
+
+    # "Flaps 5", "flaps 30 or 40":
+    flaps = sorted({
+        int(f)
+        for group in re.findall(r"\bflaps?\s+(\d+(?:\s*(?:,|or|and|/)\s*\d+)*)", text)
+        for f in re.findall(r"\d+", group)
+    })
+    if flaps:
+        conditions["flaps"] = flaps
+
+    return conditions
+
+
+def _title(text: str, boilerplate: set) -> str:
+    """
+    First text lines of a page that are not headers/footers, page codes or numbers.
+    Headings run into each other in the text layer ("TakeoffTakeoff Field ..."), so glued
+    words are split apart.
+    """
+    lines = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line or line in boilerplate or PAGE_CODE_RE.match(line) or not re.search(r"[A-Za-z]", line):
+            continue
+        lines.append(re.sub(r"([a-z])([A-Z])", r"\1 \2", line))
+        if len(lines) == TITLE_LINES:
+            break
+    return " ".join(lines)
+
+
+def _labels(tables: list) -> list:
+    """
+    Header cells of the form "NAME (UNIT)", e.g. "CLIMB LIMIT WT (1000 KG)".
+    """
+    labels = []
+    for table in tables:
+        for row in table:
+            for cell in row:
+                text = " ".join((cell or "").split())
+                if LABEL_RE.match(text) and text not in labels:
+                    labels.append(text)
+    return labels
+
+
+def build_router_data(table_entries, page_records) -> dict:
+    """
+    Builds the router entries from tables.json entries and page records ({"page", "text"}).
+    Only pages whose tables have labeled headers are routed.
+    """
+    tables_by_page = {}
+    for entry in table_entries:
+        tables_by_page.setdefault(entry["page"], []).append(entry["table"])
+
+    texts = {record["page"]: record["text"] for record in page_records}
+
+    # Lines repeated on many pages (manual name, chapter, copyright) say nothing about a page:
+    line_counts = Counter(line for text in texts.values() for line in {l.strip() for l in text.split("\n")} if line)
+    boilerplate = {line for line, n in line_counts.items() if n > BOILERPLATE_SHARE * max(len(texts), 1)}
+
+    pages = {}
+    for page, tables in sorted(tables_by_page.items()):
+        labels = _labels(tables)
+        if not labels:
+            continue
+
+        text = texts.get(page, "")
+        title = _title(text, boilerplate)
+
+        axes = {}
+        fixed = {}
+        for grid in parse_page_grids(tables, text):
+            for kind, values in ((grid.row_axis, grid.row_values), (grid.col_axis, grid.col_values)):
+                low, high = axes.get(kind, (min(values), max(values)))
+                axes[kind] = (min(low, min(values)), max(high, max(values)))
+            for kind, value in grid.context.items():
+                fixed.setdefault(kind, [])
+                if value not in fixed[kind]:
+                    fixed[kind].append(value)
+
+        pages[str(page)] = {
+            "title": title,
+            "labels": labels,
+            "units": sorted({LABEL_RE.match(l).group("unit") for l in labels}),
+            "axes": {kind: list(bounds) for kind, bounds in axes.items()},
+            "fixed": fixed,
+            "conditions": _conditions(title),
+            "keywords": sorted(set(tokenize(title + " " + " ".join(labels)))),
+        }
+
+    return {"pages": pages}
+
+
+def build_table_router(tables_path: str, pages_path: str, output_path: str = TABLE_ROUTER_PATH) -> int:
+    """
+    Offline step: builds the router from tables.json(l) and the page text
+    (pages.json, meta.json or meta.jsonl). Returns the number of routed pages.
+    """
+    data = build_router_data(iter_records(tables_path), iter_records(pages_path))
+
+    # The signature of the tables it was built from tells the loader whether it is current:
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"source": content_signature(tables_path), **data}, f, indent=2, ensure_ascii=False)
+
+    return len(data["pages"])
+
+
+class TableRouter:
+    def __init__(self, data: dict):
+        """
+        Router entries keyed by page, with keyword IDF weights so rare words
+        ("turnaround", "obstacle") count more than common ones ("weight").
+        """
+        self.pages = {int(page): entry for page, entry in data["pages"].items()}
+
+        df = Counter(word for entry in self.pages.values() for word in entry["keywords"])
+        n = max(len(self.pages), 1)
+        self.idf = {word: math.log(1 + n / count) for word, count in df.items()}
+
+    def score(self, page: int, query_words: set, params: dict, conditions: dict):
+        """
+        Match score of one page for the question, or None if the page cannot be the answer
+        (a condition contradicts the question, or a parameter is outside the table's range).
+        """
+        entry = self.pages.get(page)
+        if entry is None:
+            return None
+
+        for key, value in conditions.items():
+            printed = entry["conditions"].get(key)
+            if printed is None:
+                continue
+            if key == "flaps" and not set(value) & set(printed):
+                return None
+            if key == "runway" and value != printed:
+                return None
+
+        score = sum(self.idf.get(word, 0.0) for word in query_words & set(entry["keywords"]))
+
+        for kind, value in params.items():
+            if kind in entry["fixed"]:
+                if value not in entry["fixed"][kind]:
+                    return None
+                score += PARAM_BONUS
+            elif kind in entry["axes"]:
+                low, high = entry["axes"][kind]
+                if not low <= value <= high:
+                    return None
+                score += PARAM_BONUS
+            else:
+                score -= PARAM_PENALTY
+
+        return score
+
+    def route(self, query: str, candidates: list):
+        """
+        Picks the candidate chunk whose tables match the question, or None when
+        no candidate is routed or the best two are too close to call.
+        """
+        return _route(query, candidates, lambda chunk: self)
+
+
+def _route(query: str, candidates: list, router_for):
+    """
+    TableRouter.route() over candidates that may come from several shards; `router_for`
+    returns the router of a candidate's shard (or None).
+    """
+    params = extract_query_params(query) or {}
+    conditions = _conditions(query)
+    query_words = set(tokenize(query))
+
+    scored = []
+    for chunk in candidates:
+        router = router_for(chunk)
+        score = router.score(chunk["page"], query_words, params, conditions) if router else None
+        if score is not None:
+            scored.append((score, chunk))
+
+    if not scored:
+        return None
+
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    best_score, best = scored[0]
+    if best_score <= 0:
+        return None
+    if len(scored) > 1 and best_score - scored[1][0] < ROUTER_MARGIN:
+        return None
+
+    return best
+
+
+def _load_router(shard: str = None):
+    """
+    Loads data/table_router.json (or the shard's) on first use; returns None if it has not
+    been built (or was built from other tables), so the LLM selector is used instead.
+    """
+    router_path = TABLE_ROUTER_PATH if shard is None else shard_file(shard, "table_router.json")
+    tables_path = shard_tables_path(shard)
+
+    with _lock:
+        if shard not in _routers:
+            data = {}
+            if os.path.exists(router_path):
+                with open(router_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+
+            if "pages" in data and built_from(data.get("source"), tables_path):
+                _routers[shard] = TableRouter(data)
+            else:
+                print(f"[WARN] Table router missing or stale ({router_path}); numeric questions use the LLM selector.")
+                _routers[shard] = False
+
+        return _routers[shard] or None
+
+
+def route_numeric_query(query: str, candidates: list):
+    """
+    Chooses the table page for a numeric question locally.
+    Returns the chosen chunk, or None when the router cannot decide.
+    Candidates of a sharded index are scored by the router of their own shard.
+    """
+    return _route(query, candidates, lambda chunk: _load_router(chunk.get("shard")))
+
+
+def reset_table_router(shard: str = None):
+    """
+    Forgets the loaded router (used after the tables have been re-extracted).
+    """
+    with _lock:
+        _routers.pop(shard, None)
@@ -0,0 +1,78 @@
+# Builds a compact, page-indexed table store from tables.json.
+# Each table is serialized once as pipe-delimited text, so it can go straight into a
+# prompt without spending tokens on JSON brackets, quotes and null cells.
+
+import json
+
+from services.records import content_signature, iter_records
+
+CELL_SEPARATOR = " | "
+MULTI_VALUE_SEPARATOR = " / "   # Replaces the newlines pdfplumber leaves inside multi-value cells
+
+
+def _serialize_cell(cell) -> str:
+    if cell is None:
+        return ""   # pdfplumber uses None for the continuation of merged cells
+    return MULTI_VALUE_SEPARATOR.join(part.strip() for part in cell.split("\n") if part.strip())
+
+
+def serialize_table(table: list) -> str:
+    """
+    Converts a pdfplumber table (list-of-lists) into pipe-delimited text.
+    Empty rows and columns that are empty in every row are dropped.
+    Multi-value cells keep their order, e.g. "1220 / 1400 / 1600".
+    """
+    rows = [[_serialize_cell(cell) for cell in row] for row in table]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ""
+
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+
+    keep = [c for c in range(width) if any(row[c] for row in rows)]
+
+    return "\n".join(CELL_SEPARATOR.join(row[c] for c in keep) for row in rows)
+
+
+def build_table_store_data(table_entries: list) -> dict:
+    """
+    Builds the store structure from tables.json entries:
+      {
+        "pages":  { "<page>": [table_id, ...], ... },
+        "tables": [ "<serialized table>", ... ]
+      }
+    Identical tables are stored only once and shared between pages.
+    """
+    tables = []
+    table_ids = {}
+    pages = {}
+
+    for entry in table_entries:
+        text = serialize_table(entry["table"])
+        if not text:
+            continue
+
+        if text not in table_ids:
+            table_ids[text] = len(tables)
+            tables.append(text)
+
+        ids = pages.setdefault(str(entry["page"]), [])
+        if table_ids[text] not in ids:
+            ids.append(table_ids[text])
+
+    return {"pages": pages, "tables": tables}
+
+
+def build_table_store(tables_json_path: str, output_path: str):
+    """
+    Offline step: reads tables.json (or tables.jsonl) and writes the compact page-indexed table store.
+    Returns the number of unique tables stored.
+    """
+    store = build_table_store_data(iter_records(tables_json_path))
+
+    # The signature of the tables it was built from tells the loader whether it is current:
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"source": content_signature(tables_json_path), **store}, f, ensure_ascii=False)
+
+    return len(store["tables"])
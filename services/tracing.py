@@ -0,0 +1,140 @@
+# Per-request tracing of the answering pipeline.
+# Every stage runs inside span("<stage>"): its wall time goes into the stage latency
+# histogram, and if a trace is active for the current request (contextvars, so it follows
+# the request across awaits and asyncio.to_thread), the span is also recorded there for the
+# optional per-request timing breakdown (X-Debug-Timing header).
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+from services.metrics import CACHE_EVENTS, FALLBACKS, LLM_TOKENS, QUERIES, STAGE_SECONDS, STREAM_ERRORS
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+_current_span = contextvars.ContextVar("rag_span", default=None)
+_upstream_calls = contextvars.ContextVar("rag_upstream_calls", default=None)
+
+
+class Trace:
+    def __init__(self):
+        """
+        Spans and events of one request, in the order they finished.
+        """
+        self.started = time.perf_counter()
+        self.spans = []
+        self.events = []
+
+    def breakdown(self) -> dict:
+        """
+        The per-request timing breakdown returned with X-Debug-Timing.
+        """
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": self.spans,
+            "events": self.events,
+        }
+
+
+def start_trace() -> Trace:
+    """
+    Starts a trace for the current request (its context and every task/thread spawned from it).
+    """
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Times one pipeline stage. Extra attributes (and token counts recorded inside the span)
+    appear in the debug breakdown.
+    """
+    record = {"stage": stage, **attributes}
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - started
+        _current_span.reset(token)
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+        trace = _current_trace.get()
+        if trace is not None:
+            record["ms"] = round(seconds * 1000, 3)
+            trace.spans.append(record)
+
+
+def _event(kind: str, name: str):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.events.append({kind: name})
+
+
+def record_tokens(stage: str, response):
+    """
+    Counts prompt/response tokens from a Gemini response's usage metadata (if present).
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    response_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    LLM_TOKENS.inc(prompt_tokens, stage=stage, direction="prompt")
+    LLM_TOKENS.inc(response_tokens, stage=stage, direction="response")
+
+    record = _current_span.get()
+    if record is not None:
+        record["prompt_tokens"] = record.get("prompt_tokens", 0) + prompt_tokens
+        record["response_tokens"] = record.get("response_tokens", 0) + response_tokens
+
+
+def count_upstream_calls() -> list:
+    """
+    Starts counting the Gemini calls of the current context (one entry per call, by stage)
+    and returns the list they are appended to.
+    """
+    calls = []
+    _upstream_calls.set(calls)
+    return calls
+
+
+def record_upstream_call(stage: str):
+    """
+    Notes one Gemini request (called by llm_client before each logical call).
+    """
+    calls = _upstream_calls.get()
+    if calls is not None:
+        calls.append(stage)     # list.append is atomic, so worker threads can share the list
+
+
+def record_fallback(path: str):
+    """
+    Counts a fallback path, e.g. "rerank_json_parse" or "selector_none".
+    """
+    FALLBACKS.inc(path=path)
+    _event("fallback", path)
+
+
+def record_stream_error(stage: str):
+    """
+    Counts a /query/stream response that ended with an "error" event: "generation" when the
+    answer stream failed, "pipeline" for anything else after the response had started.
+    """
+    STREAM_ERRORS.inc(stage=stage)
+    _event("stream_error", stage)
+
+
+def record_branch(query_type: str):
+    """
+    Counts the query-type branch taken ("numeric" or "text").
+    """
+    QUERIES.inc(query_type=query_type)
+    _event("branch", query_type)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_EVENTS.inc(cache=cache, result="hit" if hit else "miss")
+    _event("cache", f"{cache}_{'hit' if hit else 'miss'}")
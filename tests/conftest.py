@@ -0,0 +1,16 @@
+# The services resolve their artifacts relative to the repository root (data/...),
+# so every test runs from there.
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    return ROOT
@@ -0,0 +1,39 @@
+from services.answer_cache import AnswerCache, extract_query_numbers
+
+VEC = [0.3, 0.4, 0.5]
+
+
+def cache():
+    return AnswerCache(watch_paths=())
+
+
+def test_extract_query_numbers_ignores_units_and_separators():
+    assert extract_query_numbers("2,000 ft, 30°C") == extract_query_numbers("30 C at 2000ft") == (30.0, 2000.0)
+    assert extract_query_numbers("engine start") == ()
+
+
+def test_text_questions_differing_only_in_a_number_do_not_share_answers():
+    answers = cache()
+    answers.store("What is the flaps 5 takeoff procedure?", VEC, "Flaps 5 ...", [40])
+
+    assert answers.lookup("What is the flaps 15 takeoff procedure?", VEC) is None
+    assert answers.lookup("What is the takeoff procedure?", VEC) is None
+    assert answers.lookup("what is the flaps 5 takeoff procedure", VEC) == ("Flaps 5 ...", [40], None)
+
+
+def test_numeric_questions_need_the_same_values():
+    answers = cache()
+    answers.store("Field limit weight at 30 C and 2000 m?", VEC, "63,000 kg", [82])
+
+    assert answers.lookup("Field limit weight at 2000 m and 30 C?", VEC)[0] == "63,000 kg"
+    assert answers.lookup("Field limit weight at 35 C and 2000 m?", VEC) is None
+
+
+def test_answers_are_kept_per_filter_scope_and_failures_are_not_cached():
+    answers = cache()
+    answers.store("Engine start?", VEC, "Start ...", [33], scope='{"aircraft": ["B737"]}')
+    answers.store("APU start?", VEC, "NOT FOUND", [12])
+
+    assert answers.lookup("Engine start?", VEC) is None
+    assert answers.lookup("Engine start?", VEC, scope='{"aircraft": ["B737"]}')[0] == "Start ..."
+    assert answers.lookup("APU start?", VEC) is None
@@ -0,0 +1,16 @@
+import pytest
+
+from benchmarks.run import _exact_match
+
+
+@pytest.mark.parametrize("answer, value, expected", [
+    ("The landing distance is 1,840 m (page 12).", "1840", True),
+    ("The landing distance is 1840 m.", "1840", True),
+    ("Field limit weight is 55.8 (1000 kg).", "55.8", True),
+    ("The landing distance is 11840 m.", "1840", False),      # Inside a longer number
+    ("Field limit weight is 55.85 (1000 kg).", "55.8", False),
+    ("Field limit weight is 155.8 (1000 kg).", "55.8", False),
+    ("Page 1840.5 says otherwise.", "1840", False),
+])
+def test_exact_match_needs_the_whole_number(answer, value, expected):
+    assert _exact_match(answer, value) is expected
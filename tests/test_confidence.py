@@ -0,0 +1,37 @@
+import json
+
+import calibrate_confidence
+from services import confidence
+
+DISTANCES = [0.1 * i for i in range(16)]
+
+
+def test_gate_is_off_without_calibration(tmp_path, monkeypatch):
+    monkeypatch.setattr(confidence, "CONFIDENCE_PATH", str(tmp_path / "confidence.json"))
+    confidence.reset_calibration()
+
+    decision = confidence.gate("text", [0.1, 0.9] + DISTANCES[10:])
+    assert not decision["confident"]
+    assert decision["candidates"] == confidence.DEFAULT_EXPAND_K
+    confidence.reset_calibration()
+
+
+def test_calibration_needs_enough_samples_to_skip():
+    clear = {"type": "numeric", "distances": [0.1, 0.9], "rank": 0}
+    few = confidence.calibrate([clear] * (confidence.MIN_SAMPLES - 1))
+    enough = confidence.calibrate([clear] * confidence.MIN_SAMPLES)
+
+    assert few["numeric"]["skip_gap"] is None
+    assert enough["numeric"]["skip_gap"] == confidence.top_gap(clear["distances"])
+    assert enough["numeric"]["samples"] == confidence.MIN_SAMPLES
+
+
+def test_calibration_set_is_held_out_from_the_golden_set():
+    with open(calibrate_confidence.CALIBRATION_SET_PATH, "r", encoding="utf-8") as f:
+        labelled = json.load(f)
+    with open(calibrate_confidence.GOLDEN_PATH, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+
+    assert calibrate_confidence.overlap(labelled, golden) == []
+    assert calibrate_confidence.overlap(golden[:1], golden) == [golden[0]["question"]]
+    assert sum(item["type"] == "text" for item in labelled) >= confidence.MIN_SAMPLES
@@ -0,0 +1,95 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.run import build_temp_index
+from services.embedding_backends import (GeminiBackend, LocalBackend, backend_for_index, create_backend,
+                                         model_path_for)
+from services.index_factory import config_path_for, load_index_config
+from services.retriever import Retriever
+from services.shards import shard_meta_path
+
+TEXTS = [
+    "Engine start procedure: announce the start sequence and check N2 rotation.",
+    "Taxi light is mounted on the nose wheel strut.",
+    "Wing anti-ice must be ON during ground operations in icing conditions.",
+    "Halon fire extinguisher: remove the ringed safety pin and aim at the base of the fire.",
+    "Flight crew oxygen system uses quick-donning diluter-demand masks.",
+    "Go-around: push the TO/GA switch and call flaps 15.",
+]
+
+
+def _fitted(texts=TEXTS):
+    backend = LocalBackend()
+    backend.fit(texts)
+    return backend
+
+
+def _index_path(tmp_path, backend):
+    index_path = str(tmp_path / "faiss.index")
+    backend.save(index_path)
+    return index_path, {"embedding": backend.config()}
+
+
+def test_local_backend_round_trips_through_save_and_load(tmp_path):
+    backend = _fitted()
+    index_path, config = _index_path(tmp_path, backend)
+
+    loaded = backend_for_index(index_path, config)
+
+    assert isinstance(loaded, LocalBackend)
+    assert loaded.key == backend.key
+    assert config["embedding"]["dimension"] == len(TEXTS)     # At most one dimension per page
+    query = "Where is the taxi light mounted?"
+    assert np.allclose(loaded.embed_text(query), backend.embed_text(query))
+
+
+def test_local_backend_ranks_the_matching_page_first():
+    backend = _fitted()
+    pages = np.array(backend.embed_texts(TEXTS))
+    query = np.array(backend.embed_text("How do I use the Halon fire extinguisher?"))
+
+    assert int(np.argmax(pages @ query)) == 3
+
+
+def test_model_of_another_index_is_refused(tmp_path):
+    index_path, config = _index_path(tmp_path, _fitted())
+    _fitted(TEXTS[:4]).save(index_path)     # Overwritten by a model fitted on other pages
+
+    with pytest.raises(RuntimeError, match="does not belong to this index"):
+        backend_for_index(index_path, config)
+
+
+def test_missing_local_model_is_refused(tmp_path):
+    index_path, config = _index_path(tmp_path, _fitted())
+    os.remove(model_path_for(index_path))
+
+    with pytest.raises(RuntimeError, match="missing"):
+        backend_for_index(index_path, config)
+
+
+def test_indexes_without_a_recorded_backend_use_gemini():
+    backend = backend_for_index("data/faiss.index", {"type": "flat", "params": {}})
+    assert isinstance(backend, GeminiBackend)
+    assert isinstance(create_backend("local"), LocalBackend)
+    with pytest.raises(ValueError):
+        create_backend("word2vec")
+
+
+def test_retriever_refuses_an_embedder_of_another_dimension(tmp_path):
+    paths = build_temp_index(shard_meta_path(), str(tmp_path), embedding_backend="local")
+    index_path = paths["index_path"]
+    assert Retriever(**paths).embedder.key.startswith("local:")
+
+    # Swap in a (self-consistent) model with fewer dimensions than the index vectors:
+    other = _fitted()
+    other.save(index_path)
+    config = load_index_config(index_path)
+    config["embedding"] = other.config()
+    with open(config_path_for(index_path), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+    with pytest.raises(RuntimeError, match="dimensional vectors"):
+        Retriever(**paths)
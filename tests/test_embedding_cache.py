@@ -0,0 +1,101 @@
+import asyncio
+
+from services.embedding_backends import GeminiBackend
+from services.embedding_cache import EmbeddingCache
+
+
+class StubBackend(GeminiBackend):
+    """
+    A stand-in for Gemini that derives a vector from the question's length and records
+    every request, so tests can tell cache hits from embedding calls.
+    """
+
+    def __init__(self, key="stub", scale=1.0):
+        super().__init__()
+        self.key = key
+        self.scale = scale
+        self.calls = []
+
+    def _vector(self, text):
+        return [self.scale * len(text), 1.0, 0.0]
+
+    def embed_text(self, text):
+        self.calls.append([text])
+        return self._vector(text)
+
+    async def embed_text_async(self, text):
+        return self.embed_text(text)
+
+    async def embed_texts_async(self, texts):
+        self.calls.append(list(texts))
+        return [self._vector(t) for t in texts]
+
+
+def test_least_recently_used_entry_is_evicted_at_max_size():
+    backend = StubBackend()
+    cache = EmbeddingCache(max_size=2, backend=backend)
+
+    cache.get_or_embed("first question")
+    cache.get_or_embed("second question")
+    cache.get_or_embed("first question")     # Now the most recently used
+    cache.get_or_embed("third question")     # Evicts "second question"
+
+    assert cache.stats()["size"] == 2
+    assert cache.get("first question") is not None
+    assert cache.get("third question") is not None
+    assert cache.get("second question") is None
+    assert len(backend.calls) == 3
+
+
+def test_vectors_survive_a_restart_through_sqlite(tmp_path):
+    db_path = str(tmp_path / "embed_cache.sqlite")
+    first = EmbeddingCache(db_path=db_path, backend=StubBackend())
+    vec = first.get_or_embed("What is V2?")
+
+    backend = StubBackend()
+    second = EmbeddingCache(db_path=db_path, backend=backend)
+    assert second.get_or_embed("what is v2") == vec
+    assert backend.calls == []
+    assert second.stats()["hits"] == 1
+
+
+def test_keys_include_the_backend(tmp_path):
+    db_path = str(tmp_path / "embed_cache.sqlite")
+    gemini = EmbeddingCache(db_path=db_path, backend=StubBackend(key="models/embedding-001"))
+    local = EmbeddingCache(db_path=db_path, backend=StubBackend(key="local:abc123", scale=2.0))
+
+    gemini_vec = gemini.get_or_embed("Where is the taxi light?")
+    local_vec = local.get_or_embed("Where is the taxi light?")
+
+    assert local_vec != gemini_vec
+    assert local.backend.calls == [["Where is the taxi light?"]]
+    assert gemini.get_or_embed("Where is the taxi light?") == gemini_vec
+
+
+def test_batch_embeds_each_missing_question_once():
+    backend = StubBackend()
+    cache = EmbeddingCache(backend=backend)
+    cache.get_or_embed("cached question")
+    backend.calls.clear()
+
+    queries = ["new question", "cached question", "New question?", "other question", "new question"]
+    vecs = asyncio.run(cache.get_or_embed_many_async(queries))
+
+    assert backend.calls == [["new question", "other question"]]
+    assert vecs[0] == vecs[2] == vecs[4]
+    assert vecs[1] == cache.get("cached question")
+    assert all(vec is not None for vec in vecs)
+
+
+def test_on_miss_is_awaited_only_when_gemini_is_called():
+    cache = EmbeddingCache(backend=StubBackend())
+    misses = []
+
+    async def on_miss():
+        misses.append(1)
+
+    asyncio.run(cache.get_or_embed_async("What is V1?", on_miss=on_miss))
+    asyncio.run(cache.get_or_embed_async("What is V1?", on_miss=on_miss))
+    asyncio.run(cache.get_or_embed_many_async(["What is V1?"], on_miss=on_miss))
+
+    assert misses == [1]
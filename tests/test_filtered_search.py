@@ -0,0 +1,46 @@
+import faiss
+import numpy as np
+import pytest
+
+from benchmarks.run import build_temp_index
+from services.embedding_cache import EmbeddingCache
+from services.index_factory import INDEX_TYPES, search_parameters
+from services.retriever import Retriever
+
+
+@pytest.fixture(scope="module", params=INDEX_TYPES)
+def retriever(request, tmp_path_factory):
+    workdir = tmp_path_factory.mktemp(request.param)
+    paths = build_temp_index("data/meta.json", str(workdir), index_type=request.param, embedding_backend="local")
+    return Retriever(embed_cache=EmbeddingCache(max_size=0), **paths)
+
+
+@pytest.mark.parametrize("filters", [{"has_tables": True}, {"chapter": ["NP"]}, {"chapter": ["PD.10"]}])
+def test_filtered_search_only_returns_allowed_pages(retriever, filters):
+    allowed = set(retriever.allowed_ids(filters).tolist())
+    assert allowed
+
+    matrix = np.array([retriever.embed_query("takeoff field limit weight")], dtype="float32")
+    candidates, distances = retriever._search_rows(matrix, 8, filters)[0]
+
+    assert candidates
+    assert len(candidates) == len(distances)
+    assert {c["id"] for c in candidates} <= allowed
+
+
+def test_filter_without_matching_pages_searches_nothing(retriever):
+    matrix = np.array([retriever.embed_query("engine start")], dtype="float32")
+    assert retriever._search_rows(matrix, 8, {"chapter": ["NO-SUCH-CHAPTER"]}) == [([], [])]
+
+
+def test_search_parameters_keep_configured_search_settings():
+    selector = faiss.IDSelectorBatch(np.arange(4, dtype="int64"))
+
+    hnsw = search_parameters({"type": "hnsw", "params": {"ef_search": 96}}, selector)
+    assert isinstance(hnsw, faiss.SearchParametersHNSW) and hnsw.efSearch == 96
+
+    for index_type in ("ivf_flat", "ivf_pq"):
+        ivf = search_parameters({"type": index_type, "params": {"nprobe": 5}}, selector)
+        assert isinstance(ivf, faiss.SearchParametersIVF) and ivf.nprobe == 5
+
+    assert type(search_parameters({"type": "flat", "params": {}}, selector)) is faiss.SearchParameters
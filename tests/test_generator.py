@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services import generator
+from services.governor import Shed
+
+NUMERIC = "Landing distance at 60000 kg and 2000 ft?"
+TEXT = "What is the APU used for?"
+CHUNK = {"page": 12, "text": "LANDING DISTANCE ..."}
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    """
+    Replaces every Gemini call of the generator; `stages` lists the calls in order.
+    Both the sync and the async version of each call answer the same.
+    """
+    calls = []
+    answers = {"extract": "1,840 (M)", "format": "Landing distance is 1,840 m.", "generate": "The APU ..."}
+
+    def call(stage, *args, **kwargs):
+        calls.append(stage)
+        if isinstance(answers[stage], Exception):
+            raise answers[stage]
+        return answers[stage]
+
+    async def call_async(stage, *args, **kwargs):
+        return call(stage)
+
+    monkeypatch.setattr(generator, "get_table_text_for_page", lambda page, shard=None: "WEIGHT | DISTANCE")
+    monkeypatch.setattr(generator, "_numeric_result", lambda *args: (None, None, None))
+    monkeypatch.setattr(generator, "generate_numeric_answer", lambda *a: call("extract"))
+    monkeypatch.setattr(generator, "generate_numeric_answer_async", lambda *a: call_async("extract"))
+    monkeypatch.setattr(generator, "format_numeric_natural_answer", lambda **k: call("format"))
+    monkeypatch.setattr(generator, "format_numeric_natural_answer_async", lambda **k: call_async("format"))
+    monkeypatch.setattr(generator, "generate", lambda *a, **k: SimpleNamespace(text=call("generate")))
+
+    async def generate_async(*args, **kwargs):
+        return SimpleNamespace(text=call("generate"))
+
+    monkeypatch.setattr(generator, "generate_async", generate_async)
+    return SimpleNamespace(calls=calls, answers=answers, monkeypatch=monkeypatch)
+
+
+def _both(query, chunks, llm_phrasing=None):
+    """
+    (sync result, async result) of the same question.
+    """
+    sync = generator.generate_answer(query, chunks, llm_phrasing=llm_phrasing)
+    async_ = asyncio.run(generator.generate_answer_async(query, chunks, llm_phrasing=llm_phrasing))
+    return sync, async_
+
+
+def test_sync_and_async_answers_agree(stages):
+    sync, async_ = _both(NUMERIC, [CHUNK])
+    assert sync == async_ == ("Based on the given conditions, the value from the table is 1,840 m (page 12).", [12])
+    assert stages.calls == ["extract", "extract"]
+
+    sync, async_ = _both(NUMERIC, [CHUNK], llm_phrasing=True)
+    assert sync == async_ == ("Landing distance is 1,840 m.", [12])
+
+    sync, async_ = _both(TEXT, [CHUNK])
+    assert sync == async_ == ("The APU ...", [12])
+    assert _both(TEXT, []) == ((generator.NO_RESULTS_ANSWER, []),) * 2
+
+
+def test_numeric_early_answers_skip_the_later_stages(stages):
+    stages.answers["extract"] = "NOT FOUND"
+    assert _both(NUMERIC, [CHUNK], llm_phrasing=True) == (("NOT FOUND", [12]),) * 2
+    assert "format" not in stages.calls
+
+    stages.monkeypatch.setattr(generator, "get_table_text_for_page", lambda page, shard=None: "")
+    stages.calls.clear()
+    assert _both(NUMERIC, [CHUNK]) == ((generator.NO_TABLES_ANSWER, [12]),) * 2
+    assert stages.calls == []
+
+
+def test_shed_phrasing_falls_back_to_the_template(stages):
+    stages.answers["format"] = Shed("format")
+    sync, async_ = _both(NUMERIC, [CHUNK], llm_phrasing=True)
+    assert sync == async_
+    assert sync[0].startswith("Based on the given conditions")
+
+
+@pytest.mark.parametrize("raw, parsed", [
+    ("55.8 (1000 KG)", ("55.8", "1000 KG")),
+    ("1,840 m", ("1840", "m")),
+    ("-5", ("-5", None)),
+    (" 63.4 ", ("63.4", None)),
+    ("NOT FOUND", (None, None)),
+    ("55.8 or 56.1", (None, None)),
+])
+def test_parse_numeric_value(raw, parsed):
+    assert generator._parse_numeric_value(raw) == parsed
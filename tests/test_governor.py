@@ -0,0 +1,38 @@
+import pytest
+
+from services.governor import TokenBucket, parse_rate_limits
+
+
+def test_bucket_starts_full_and_goes_into_debt():
+    bucket = TokenBucket(60)                 # One per second
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(2) == pytest.approx(2.0, abs=0.05)
+    bucket.give_back(2)
+    assert bucket.fill() == pytest.approx(0.0, abs=0.05)
+
+
+def test_bucket_refills_up_to_its_capacity(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("services.governor.time.monotonic", lambda: now[0])
+    bucket = TokenBucket(60)
+    bucket.reserve(60)
+
+    now[0] += 30
+    assert bucket.fill() == pytest.approx(0.5)
+    now[0] += 600
+    assert bucket.fill() == 1.0
+
+
+def test_drain_keeps_a_debt():
+    bucket = TokenBucket(60)
+    bucket.drain()
+    assert bucket.fill() == pytest.approx(0.0, abs=0.05)
+    assert bucket.reserve(1) > 0
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("models/gemini-2.0-flash=2000:4000000, models/text-embedding-004=1500") == {
+        "models/gemini-2.0-flash": (2000.0, 4000000.0),
+        "models/text-embedding-004": (1500.0, 0.0),
+    }
+    assert parse_rate_limits("") == {}
@@ -0,0 +1,65 @@
+import os
+
+import fitz
+
+from benchmarks.run import build_temp_index
+from services import incremental
+from services.chunker import create_page_chunks
+from services.document_loader import extract_pdf_pages
+from services.records import iter_records, write_records
+from services.table_extractor import extract_tables_for_pages
+
+
+def _write_pdf(path, values):
+    # One page per value; each page has a ruled 2x2 table holding its value:
+    doc = fitz.open()
+    for page_num, value in enumerate(values, start=1):
+        page = doc.new_page()
+        page.insert_text((72, 400), f"Landing distance page {page_num}", fontsize=11)
+        for x in (72, 200, 328):
+            page.draw_line((x, 72), (x, 128))
+        for y in (72, 100, 128):
+            page.draw_line((72, y), (328, y))
+        page.insert_text((76, 90), "WEIGHT (KG)", fontsize=9)
+        page.insert_text((204, 90), "DISTANCE (M)", fontsize=9)
+        page.insert_text((76, 118), "60000", fontsize=9)
+        page.insert_text((204, 118), value, fontsize=9)
+    doc.save(path)
+
+
+def _table_values(tables_path):
+    return {t["page"]: t["table"][1][1] for t in iter_records(tables_path)}
+
+
+def test_failed_pages_keep_their_old_tables(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("data")
+    _write_pdf("rev1.pdf", ["1500", "1600", "1700"])
+    extract_pdf_pages("rev1.pdf", "data/pages.json")
+    create_page_chunks("data/pages.json", "data/chunks.json")
+    write_records("data/meta.json", [{"id": c["page"], "page": c["page"], "text": c["text"]}
+                                     for c in iter_records("data/chunks.json")])
+    write_records("data/tables.json", extract_tables_for_pages("rev1.pdf", [1, 2, 3]))
+    build_temp_index("data/meta.json", "data", embedding_backend="local")
+
+    # Pages 2 and 3 change; the embedding of page 3 fails:
+    _write_pdf("rev2.pdf", ["1500", "1650", "1750"])
+    embed_pages = incremental._embed_pages
+
+    def failing_embed(texts, *args):
+        vectors = embed_pages(texts, *args)
+        return [None if "1750" in text else vec for text, vec in zip(texts, vectors)]
+
+    monkeypatch.setattr(incremental, "_embed_pages", failing_embed)
+    result = incremental.update_index("rev2.pdf")
+
+    assert result == {"changed": 1, "removed": 0, "failed": 1}
+    assert _table_values("data/tables.json") == {1: "1500", 2: "1650", 3: "1700"}
+    assert "1700" in next(e["text"] for e in iter_records("data/meta.json") if e["page"] == 3)
+
+
+def test_diff_pages_finds_changed_new_and_removed_pages():
+    old = {1: "a", 2: "b", 3: "c"}
+    new = {1: "a", 2: "B", 4: "d"}
+    assert incremental.diff_pages(old, new) == ([2, 4], [3])
+    assert incremental.diff_pages(old, dict(old)) == ([], [])
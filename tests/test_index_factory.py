@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from services.index_factory import index_report, parse_index_params, resolve_params
+
+
+def test_defaults_are_filled_in():
+    assert resolve_params("hnsw", 1000, 768) == {"M": 32, "ef_construction": 40, "ef_search": 64}
+    assert resolve_params("hnsw", 1000, 768, {"ef_search": 128})["ef_search"] == 128
+
+
+def test_ivf_lists_follow_the_corpus_size():
+    # ~39 training vectors per list, and nprobe never above nlist:
+    params = resolve_params("ivf_flat", 200, 768)
+    assert params["nlist"] == 200 // 39
+    assert params["nprobe"] == 5
+    assert resolve_params("ivf_flat", 10, 768)["nlist"] == 1
+
+
+def test_pq_sub_quantizers_divide_the_dimension():
+    params = resolve_params("ivf_pq", 100, 100, {"m": 48})
+    assert params["m"] == 25
+    assert params["nbits"] == 6     # 2^nbits training vectors at most
+
+
+def test_unknown_index_type_is_rejected():
+    with pytest.raises(ValueError, match="Unknown index type"):
+        resolve_params("annoy", 100, 768)
+
+
+def test_parse_index_params():
+    assert parse_index_params("nlist=64, nprobe=8") == {"nlist": 64, "nprobe": 8}
+    assert parse_index_params(None) == {}
+
+
+def test_index_report_uses_real_questions_when_given():
+    rng = np.random.default_rng(0)
+    pages, questions = rng.standard_normal((60, 16)), rng.standard_normal((5, 16))
+    configs = [("flat", {}), ("hnsw", {})]
+
+    rows = index_report(pages, questions, k=4, configs=configs)
+    assert [row["queries"] for row in rows] == ["questions", "questions"]
+    assert rows[0]["recall@4"] == 1.0       # flat is the reference
+
+    assert index_report(pages, None, k=4, n_queries=10, configs=configs)[0]["queries"] == "noisy_pages"
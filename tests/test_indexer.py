@@ -0,0 +1,116 @@
+import threading
+import time
+
+import faiss
+
+from services.embedding_backends import GeminiBackend
+from services.indexer import build_faiss_index
+from services.records import read_records, write_records
+
+PAGES = 10
+
+
+class StubBackend(GeminiBackend):
+    """
+    A stand-in for Gemini that records every request: batch sizes, the texts embedded and
+    the most requests in flight at once. Pages in `failing` cannot be embedded.
+    """
+
+    def __init__(self, failing=()):
+        super().__init__()
+        self.key = "stub"
+        self.failing = set(failing)
+        self.batches = []
+        self.embedded = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text):
+        page = int(text.split()[1])
+        return None if page in self.failing else [float(page), 1.0, 0.0, 0.0]
+
+    def embed_texts(self, texts):
+        with self._lock:
+            self.batches.append(len(texts))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.02)
+        with self._lock:
+            self.in_flight -= 1
+            self.embedded.extend(texts)
+        vectors = [self._vector(t) for t in texts]
+        return None if None in vectors else vectors
+
+    def embed_text(self, text):
+        return self._vector(text)
+
+
+def _build(tmp_path, backend, **kwargs):
+    return build_faiss_index(
+        chunks_path=str(tmp_path / "chunks.json"),
+        index_output_path=str(tmp_path / "faiss.index"),
+        meta_output_path=str(tmp_path / "meta.json"),
+        checkpoint_path=str(tmp_path / "checkpoint.jsonl"),
+        embedding_backend=backend,
+        **kwargs
+    )
+
+
+def _write_chunks(tmp_path, texts=None):
+    texts = texts or {}
+    write_records(str(tmp_path / "chunks.json"), [
+        {"chunk_id": page, "page": page, "text": texts.get(page, f"page {page} text")}
+        for page in range(1, PAGES + 1)
+    ])
+
+
+def _index_ids(tmp_path):
+    index = faiss.read_index(str(tmp_path / "faiss.index"))
+    return sorted(faiss.vector_to_array(index.id_map).tolist())
+
+
+def test_batches_and_requests_in_flight_are_bounded(tmp_path):
+    _write_chunks(tmp_path)
+    backend = StubBackend()
+
+    assert _build(tmp_path, backend, batch_size=3, max_workers=2) == PAGES
+    assert sorted(backend.batches) == [1, 3, 3, 3]
+    assert backend.max_in_flight <= 2
+    assert not (tmp_path / "checkpoint.jsonl").exists()    # Removed once every page is indexed
+
+
+def test_failed_page_is_left_out_and_ids_stay_page_numbers(tmp_path):
+    _write_chunks(tmp_path)
+
+    assert _build(tmp_path, StubBackend(failing={4}), batch_size=3, max_workers=2) == PAGES - 1
+    pages = [p for p in range(1, PAGES + 1) if p != 4]
+    assert _index_ids(tmp_path) == pages
+    assert [m["id"] for m in read_records(str(tmp_path / "meta.json"))] == pages
+
+    # The vector stored under each id is that page's own embedding:
+    index = faiss.read_index(str(tmp_path / "faiss.index"))
+    assert [index.reconstruct(page)[0] for page in pages] == pages
+
+
+def test_resume_only_embeds_what_the_checkpoint_lacks(tmp_path):
+    _write_chunks(tmp_path)
+    _build(tmp_path, StubBackend(failing={4}), batch_size=3, max_workers=2)
+    assert (tmp_path / "checkpoint.jsonl").exists()          # Kept, since page 4 failed
+
+    # Page 6 changed since the interrupted run, so its checkpointed vector is stale:
+    _write_chunks(tmp_path, {6: "page 6 revised text"})
+    backend = StubBackend()
+    assert _build(tmp_path, backend, batch_size=3, max_workers=2) == PAGES
+    assert sorted(backend.embedded) == ["page 4 text", "page 6 revised text"]
+    assert _index_ids(tmp_path) == list(range(1, PAGES + 1))
+
+
+def test_checkpoint_of_another_backend_is_not_reused(tmp_path):
+    _write_chunks(tmp_path)
+    _build(tmp_path, StubBackend(failing={4}), batch_size=3, max_workers=2)
+
+    backend = StubBackend()
+    backend.key = "other"
+    _build(tmp_path, backend, batch_size=3, max_workers=2)
+    assert len(backend.embedded) == PAGES
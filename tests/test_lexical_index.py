@@ -0,0 +1,37 @@
+import os
+
+from services.lexical_index import BM25Index, build_lexical_index, tokenize
+from services.records import built_from, write_records
+
+PAGES = [
+    {"id": 0, "page": 1, "text": "APU start procedure: APU switch START, then ON."},
+    {"id": 1, "page": 2, "text": "Engine start procedure with the engine start switch."},
+    {"id": 2, "page": 3, "text": "Takeoff field limit weight table, flaps 5."},
+]
+
+
+def test_tokenize_drops_stopwords_and_keeps_identifiers():
+    assert tokenize("What is the N1 of PD.10?") == ["n1", "pd", "10"]
+
+
+def test_bm25_ranks_the_page_with_the_query_terms_first():
+    index = BM25Index.build(PAGES)
+    scores = index.score("engine start", [0, 1, 2])
+    assert max(scores, key=scores.get) == 1
+    assert scores[2] == 0
+
+
+def test_saved_index_records_its_source(tmp_path):
+    meta_path = str(tmp_path / "meta.json")
+    lexical_path = str(tmp_path / "bm25.json")
+    write_records(meta_path, PAGES)
+    build_lexical_index(meta_path, lexical_path)
+
+    # Older than its source (as after a clone), but built from it:
+    os.utime(lexical_path, (1_000_000_000, 1_000_000_000))
+    loaded = BM25Index.load(lexical_path)
+    assert built_from(loaded.source, meta_path)
+    assert loaded.score("apu", [0, 1]) == BM25Index.build(PAGES).score("apu", [0, 1])
+
+    write_records(meta_path, PAGES[:2])
+    assert not built_from(loaded.source, meta_path)
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from services import governor, llm_client
+from services.governor import TokenBucket
+
+MODEL = "models/test-model"
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+@pytest.fixture
+def buckets(monkeypatch):
+    """
+    60 requests and 6000 tokens per minute for MODEL, full at the start.
+    """
+    rpm, tpm = TokenBucket(60), TokenBucket(6000)
+    monkeypatch.setattr(governor, "_buckets", {MODEL: (rpm, tpm)})
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF_BASE", 0.0)
+    return rpm, tpm
+
+
+def _failing_once():
+    attempts = []
+
+    def call(timeout):
+        attempts.append(timeout)
+        if len(attempts) == 1:
+            raise Unavailable("503")
+        return "ok"
+
+    return call, attempts
+
+
+def test_each_retry_takes_rate_budget(buckets):
+    rpm, tpm = buckets
+    call, attempts = _failing_once()
+
+    # The first attempt's budget is taken by the caller (generate/embed), the retry's here:
+    assert llm_client._call_with_retries(MODEL, "generate", 100, call) == "ok"
+    assert len(attempts) == 2
+    assert rpm.tokens == pytest.approx(59, abs=0.1)
+    assert tpm.tokens == pytest.approx(5900, abs=1)
+
+
+def test_each_async_retry_takes_rate_budget(buckets):
+    rpm, tpm = buckets
+    call, attempts = _failing_once()
+
+    async def call_async(timeout):
+        return call(timeout)
+
+    result = asyncio.run(llm_client._call_with_retries_async(MODEL, "generate", 100, call_async, hedge=False))
+    assert result == "ok"
+    assert rpm.tokens == pytest.approx(59, abs=0.1)
+
+
+def _slow_first():
+    calls = []
+
+    async def call(timeout):
+        calls.append(timeout)
+        await asyncio.sleep(0.2 if len(calls) == 1 else 0.0)
+        return f"attempt {len(calls)}"
+
+    return call, calls
+
+
+def test_hedge_takes_budget_and_wins(buckets, monkeypatch):
+    rpm, _ = buckets
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_AFTER_MS", 20)
+    call, calls = _slow_first()
+
+    assert asyncio.run(llm_client._hedged(MODEL, "generate", 100, call, 5.0)) == "attempt 2"
+    assert rpm.tokens == pytest.approx(59, abs=0.5)
+
+
+def test_hedge_is_skipped_without_free_budget(buckets, monkeypatch):
+    rpm, _ = buckets
+    rpm.tokens = 0.0
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_AFTER_MS", 20)
+    call, calls = _slow_first()
+
+    assert asyncio.run(llm_client._hedged(MODEL, "generate", 100, call, 5.0)) == "attempt 1"
+    assert len(calls) == 1
+    assert rpm.tokens < 1
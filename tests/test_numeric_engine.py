@@ -0,0 +1,65 @@
+import pytest
+
+from services import numeric_engine
+from services.numeric_engine import extract_query_params, parse_table, resolve_numeric_answer
+
+FIELD_LIMIT = [
+    ["FIELD LENGTH (M)", "FIELD LIMIT WEIGHT (1000 KG)", None, None],
+    ["", "OAT (°C)", "", ""],
+    ["", "30", "40", "50"],
+    ["1800", "60.1", "58.2", "55.0"],
+    ["2000", "63.4", "61.0", "58.3"],
+]
+
+
+@pytest.fixture
+def page_tables(monkeypatch):
+    """
+    Serves `tables` as the tables of every page.
+    """
+    tables = []
+    monkeypatch.setattr(numeric_engine, "get_tables_for_page", lambda page, shard=None: tables)
+    numeric_engine.reset_grid_cache()
+    yield tables
+    numeric_engine.reset_grid_cache()
+
+
+def test_parse_table_reads_axes_and_cells():
+    grid = parse_table(FIELD_LIMIT)
+    assert (grid.quantity, grid.unit) == ("FIELD LIMIT WEIGHT (1000 KG)", "1000 KG")
+    assert (grid.row_axis, grid.col_axis) == ("field_length", "oat")
+    assert grid.cells[(2000.0, 40.0)] == "61.0"
+
+
+def test_parse_table_rejects_tables_that_are_not_grids():
+    assert parse_table([["ENGINE START", "NOTE"], ["Check", "APU running"]]) is None
+
+
+def test_extract_query_params_types_each_number():
+    assert extract_query_params("Field limit weight at 2,000 ft, 30°C, 1800 m") == {
+        "altitude": 2000.0, "oat": 30.0, "field_length": 1800.0}
+    assert extract_query_params("Weight at 65000 kg, 5 kts tailwind") == {"weight": 65.0, "wind": -5.0}
+    assert extract_query_params("OAT 30 C or 40 C?") is None    # Two values for one axis
+
+
+def test_cell_is_read_when_the_query_pins_it(page_tables):
+    page_tables.append(FIELD_LIMIT)
+    assert resolve_numeric_answer("Field limit weight at 2000 m and 40°C?", 82) == {
+        "value": "61.0", "unit": "1000 KG", "quantity": "FIELD LIMIT WEIGHT"}
+
+
+@pytest.mark.parametrize("query", [
+    "Field limit weight at 2000 m and 45°C?",            # Not a column of the table
+    "Field limit weight at 2000 m, 40°C and 1000 ft?",   # A condition the table does not cover
+    "Climb limit weight at 2000 m and 40°C?",            # Another quantity
+])
+def test_lookup_gives_up_instead_of_guessing(page_tables, query):
+    page_tables.append(FIELD_LIMIT)
+    assert resolve_numeric_answer(query, 82) is None
+
+
+def test_conflicting_tables_give_no_answer(page_tables):
+    other = [row[:] for row in FIELD_LIMIT]
+    other[4][2] = "61.5"
+    page_tables.extend([FIELD_LIMIT, other])
+    assert resolve_numeric_answer("Field limit weight at 2000 m and 40°C?", 82) is None
@@ -0,0 +1,61 @@
+import pytest
+
+from services.numeric_formatter import detect_quantity, find_unit_in_tables, format_numeric_answer, format_value
+
+
+@pytest.mark.parametrize("value, unit, expected", [
+    ("52.2", "1000 KG", "52.2 (1000 kg), i.e. 52,200 kg"),
+    ("52", "1000 kg", "52 (1000 kg), i.e. 52,000 kg"),
+    ("1840", "M", "1,840 m"),
+    ("1,840", "M", "1,840 m"),
+    ("5500", "FT", "5,500 ft"),
+    ("142", "KIAS", "142 kts"),
+    ("2.5", "%", "2.5%"),
+    ("2400", "KG/HR", "2,400 kg/hr"),
+    ("12.75", None, "12.75"),
+    ("63000", None, "63,000"),
+    ("N/A", "M", "N/A (M)"),
+])
+def test_format_value(value, unit, expected):
+    assert format_value(value, unit) == expected
+
+
+@pytest.mark.parametrize("query, label, expected", [
+    ("What is the field limit weight at 30C?", None, "field limit weight"),
+    ("Landing climb limit weight at 2000 ft?", None, "landing climb limit weight"),   # Longest phrase wins
+    ("Climb limit wt at sea level?", None, "climb limit weight"),
+    ("What weight at 30C and 2000 ft?", "QUICK TURNAROUND LIMIT WEIGHT", "quick turnaround limit weight"),
+    ("Field length at 30C?", "CORRECTED FIELD LENGTH", "corrected field length"),      # The table's label first
+    ("What is V1 at 60000 kg?", None, "v1"),
+    ("What is the APU used for?", None, None),
+])
+def test_detect_quantity(query, label, expected):
+    assert detect_quantity(query, label) == expected
+
+
+TABLES = [[["FIELD LENGTH (M)", "FIELD LIMIT WEIGHT (1000 KG)"], ["OAT (°C)", "CLIMB LIMIT WT (1000 KG)"]],
+          [["LIMIT WEIGHT (1000 LB)", "FUEL FLOW (KG/HR)"]]]
+
+
+@pytest.mark.parametrize("quantity, unit", [
+    ("field limit weight", "1000 KG"),
+    ("climb limit weight", "1000 KG"),                 # "WT" in the header
+    ("fuel flow", "KG/HR"),
+    ("v1", None),
+    (None, None),
+])
+def test_find_unit_in_tables(quantity, unit):
+    assert find_unit_in_tables(TABLES, quantity) == unit
+
+
+def test_find_unit_drops_leading_words_of_the_quantity():
+    # The quick turnaround table only prints "LIMIT WEIGHT":
+    tables = [[["OAT (°C)", "LIMIT WEIGHT (1000 LB)"]]]
+    assert find_unit_in_tables(tables, "quick turnaround limit weight") == "1000 LB"
+
+
+def test_format_numeric_answer_uses_the_quantity_template():
+    assert format_numeric_answer("Field limit weight at 30C and 2000 m?", "52.2", 82, unit="1000 KG") == (
+        "Based on the given conditions, the field limit weight is 52.2 (1000 kg), i.e. 52,200 kg (page 82).")
+    assert format_numeric_answer("Value at 30C and 2000 m?", "1840", 12, unit="M") == (
+        "Based on the given conditions, the value from the table is 1,840 m (page 12).")
@@ -0,0 +1,29 @@
+from services.page_meta import build_page_meta, chapter_of, load_page_meta
+from services.records import write_records
+
+TABLE = [["FIELD LIMIT WEIGHT (1000 KG)", "FLAPS 5"], ["60", "2100"]]
+
+
+def test_chapter_of_reads_the_page_code():
+    assert chapter_of("Engine Start\nNP.20.5\n") == "NP.20"
+    assert chapter_of("no page code here") is None
+
+
+def test_page_meta_carries_chapters_forward_and_is_tied_to_its_tables(tmp_path):
+    pages_path, tables_path, meta_path = (str(tmp_path / n) for n in ("pages.json", "tables.json", "page_meta.json"))
+    write_records(pages_path, [
+        {"page": 1, "text": "Normal procedures\nNP.20.1"},
+        {"page": 2, "text": "full-page diagram"},
+        {"page": 3, "text": "Performance\nPD.10.2"},
+    ])
+    write_records(tables_path, [{"page": 3, "table": TABLE}])
+
+    assert build_page_meta(pages_path, tables_path, meta_path) == 3
+    assert load_page_meta(meta_path, tables_path) == {
+        1: {"chapter": "NP.20", "has_tables": False},
+        2: {"chapter": "NP.20", "has_tables": False},
+        3: {"chapter": "PD.10", "has_tables": True},
+    }
+
+    write_records(tables_path, [])
+    assert load_page_meta(meta_path, tables_path) is None
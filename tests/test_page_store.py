@@ -0,0 +1,34 @@
+import os
+
+from services.page_store import InMemoryPages, PageStore, build_page_store, is_current
+from services.records import write_records
+
+PAGES = [
+    {"id": 0, "page": 1, "text": "APU start"},
+    {"id": 1, "page": 2, "text": ""},
+    {"id": 2, "page": 3, "text": "Takeoff – flaps 5 (°C)"},
+]
+
+
+def test_page_store_matches_the_metadata(tmp_path):
+    meta_path, text_path, index_path = (str(tmp_path / n) for n in ("meta.json", "page_text.bin", "page_text.idx.npy"))
+    write_records(meta_path, PAGES)
+    assert not is_current(text_path, index_path, meta_path)
+
+    assert build_page_store(meta_path, text_path, index_path) == len(PAGES)
+    store = PageStore(text_path, index_path)
+
+    assert [store.get(p["id"]) for p in PAGES] == PAGES
+    assert list(store.ids_and_pages()) == list(InMemoryPages(meta_path).ids_and_pages())
+
+
+def test_page_store_freshness_follows_content_not_mtime(tmp_path):
+    meta_path, text_path, index_path = (str(tmp_path / n) for n in ("meta.json", "page_text.bin", "page_text.idx.npy"))
+    write_records(meta_path, PAGES)
+    build_page_store(meta_path, text_path, index_path)
+
+    os.utime(meta_path, (2_000_000_000, 2_000_000_000))
+    assert is_current(text_path, index_path, meta_path)
+
+    write_records(meta_path, PAGES[:2])
+    assert not is_current(text_path, index_path, meta_path)
@@ -0,0 +1,195 @@
+import asyncio
+import json
+
+import google.generativeai as genai
+import pytest
+
+from benchmarks.fake_gemini import FakeGemini, install
+from benchmarks.run import GOLDEN_SET_PATH, build_temp_index
+from services import confidence, pipeline
+from services.answer_cache import AnswerCache
+from services.embedding_cache import EmbeddingCache
+from services.governor import AdmissionQueue, Overloaded
+from services.llm_client import reset_models
+from services.metrics import STREAM_ERRORS, render_metrics
+from services.pipeline import QueryPipeline
+from services.retriever import Retriever
+from services.shards import shard_meta_path
+
+VEC = [0.3, 0.4, 0.5]
+QUESTION = "What is the engine start procedure?"
+
+
+class StubRetriever:
+    # Just enough of the Retriever interface for the pipeline:
+    def check_filters(self, filters):
+        return filters
+
+    def is_stale(self):
+        return False
+
+    async def embed_query_async(self, query, on_miss=None):
+        return VEC
+
+    async def search_async(self, query, query_vec=None, decision=None, filters=None):
+        return [{"page": 12, "text": "Engine start ..."}]
+
+
+def _stream(answer_pieces):
+    async def stream_answer_async(query, retrieved):
+        for piece in answer_pieces:
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+
+    return stream_answer_async
+
+
+async def _answer(query, retrieved):
+    return "Start APU.", [12]
+
+
+def _events(queries):
+    async def collect():
+        return [event async for event in queries.stream_async(QUESTION)]
+    return asyncio.run(collect())
+
+
+def test_streamed_answer_is_cached(monkeypatch):
+    monkeypatch.setattr(pipeline, "stream_answer_async", _stream([{"text": "Start "}, {"text": "APU."}, {"pages": [12]}]))
+    queries = QueryPipeline(StubRetriever(), AnswerCache(watch_paths=()))
+
+    events = _events(queries)
+    assert [e for e, _ in events] == ["retrieval", "token", "token", "done"]
+    assert queries.answer_cache.lookup(QUESTION, VEC) == ("Start APU.", [12], None)
+
+
+def test_failure_mid_stream_ends_with_an_error_event_and_caches_nothing(monkeypatch):
+    monkeypatch.setattr(pipeline, "stream_answer_async", _stream([{"text": "Start "}, RuntimeError("quota exceeded")]))
+    queries = QueryPipeline(StubRetriever(), AnswerCache(watch_paths=()))
+
+    failures = STREAM_ERRORS._values.get(("generation",), 0)
+
+    events = _events(queries)
+    assert [e for e, _ in events] == ["retrieval", "token", "error"]
+    assert events[-1][1] == {"error": "quota exceeded"}
+    assert queries.answer_cache.lookup(QUESTION, VEC) is None
+    assert STREAM_ERRORS._values[("generation",)] == failures + 1
+    assert 'rag_stream_errors_total{stage="generation"}' in render_metrics()
+
+
+class MissingEmbeddingRetriever(StubRetriever):
+    # Every question misses the embedding cache; records the slots in use at the Gemini call.
+    def __init__(self):
+        self.active_at_embed = []
+
+    async def embed_query_async(self, query, on_miss=None):
+        await on_miss()
+        self.active_at_embed.append(pipeline.admission.active)
+        return VEC
+
+
+def test_uncached_embedding_runs_inside_the_admitted_section(monkeypatch):
+    monkeypatch.setattr(pipeline, "admission", AdmissionQueue(max_concurrent=1, max_queue=0))
+    monkeypatch.setattr(pipeline, "generate_answer_async", _answer)
+    retriever = MissingEmbeddingRetriever()
+    queries = QueryPipeline(retriever, AnswerCache(watch_paths=()))
+
+    result = asyncio.run(queries.answer_async(QUESTION))
+    assert result["answer"] == "Start APU."
+    assert retriever.active_at_embed == [1]
+    assert pipeline.admission.active == 0
+
+
+def test_full_governor_refuses_before_the_embedding_call(monkeypatch):
+    admission = AdmissionQueue(max_concurrent=1, max_queue=0)
+    admission.active = 1    # The only slot is taken
+    monkeypatch.setattr(pipeline, "admission", admission)
+    retriever = MissingEmbeddingRetriever()
+    queries = QueryPipeline(retriever, AnswerCache(watch_paths=()))
+
+    with pytest.raises(Overloaded):
+        asyncio.run(queries.answer_async(QUESTION))
+    assert retriever.active_at_embed == []
+
+
+def test_cached_answer_needs_no_slot(monkeypatch):
+    admission = AdmissionQueue(max_concurrent=1, max_queue=0)
+    admission.active = 1
+    monkeypatch.setattr(pipeline, "admission", admission)
+    queries = QueryPipeline(StubRetriever(), AnswerCache(watch_paths=()))
+    queries.answer_cache.store(QUESTION, VEC, "Start APU.", [12])
+
+    result = asyncio.run(queries.answer_async(QUESTION))
+    assert result["cached"] is True
+
+
+@pytest.fixture
+def fake_pipeline(tmp_path, monkeypatch):
+    """
+    A real Retriever and pipeline over a temporary index, with Gemini replaced by the
+    benchmark's stand-in (install() patches genai; monkeypatch restores it afterwards).
+    """
+    for name in ("configure", "embed_content", "embed_content_async", "GenerativeModel"):
+        monkeypatch.setattr(genai, name, getattr(genai, name))
+    install(FakeGemini())
+    confidence.use_calibration({})
+
+    paths = build_temp_index(shard_meta_path(), str(tmp_path))
+    retriever = Retriever(embed_cache=EmbeddingCache(max_size=0), **paths)
+    yield QueryPipeline(retriever, AnswerCache(watch_paths=()))
+
+    confidence.reset_calibration()
+    reset_models()
+
+
+def _golden():
+    with open(GOLDEN_SET_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _counting_generate(monkeypatch, failing=()):
+    # Wraps generate_answer_async to count the questions it answers (and fail some of them):
+    asked = []
+    generate = pipeline.generate_answer_async
+
+    async def generate_answer_async(query, retrieved):
+        asked.append(query)
+        if query in failing:
+            raise RuntimeError("generation failed")
+        return await generate(query, retrieved)
+
+    monkeypatch.setattr(pipeline, "generate_answer_async", generate_answer_async)
+    return asked
+
+
+def test_batch_results_keep_the_input_order(fake_pipeline):
+    golden = _golden()
+    items = [golden[0], golden[12], golden[6], golden[3]]    # Text and numeric questions mixed
+
+    results = asyncio.run(fake_pipeline.answer_batch_async([item["question"] for item in items]))
+
+    assert len(results) == len(items)
+    for item, result in zip(items, results):
+        assert set(result["pages"]) & set(item["pages"]), item["question"]
+
+
+def test_failing_batch_item_does_not_affect_the_others(fake_pipeline, monkeypatch):
+    questions = [item["question"] for item in _golden()[:3]]
+    _counting_generate(monkeypatch, failing={questions[1]})
+
+    results = asyncio.run(fake_pipeline.answer_batch_async(questions))
+
+    assert results[1] == {"error": "generation failed"}
+    assert "answer" in results[0] and "answer" in results[2]
+
+
+def test_duplicates_in_a_batch_are_answered_once(fake_pipeline, monkeypatch):
+    asked = _counting_generate(monkeypatch)
+    first, second = [item["question"] for item in _golden()[:2]]
+
+    results = asyncio.run(fake_pipeline.answer_batch_async([first, second, first, first.upper()]))
+
+    assert sorted(asked) == sorted([first, second])
+    assert results[0]["answer"] == results[2]["answer"] == results[3]["answer"]
+    assert [r["coalesced"] for r in results] == [False, False, True, True]
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from services import records
+from services.records import built_from, content_signature, newest_existing, signature_path
+
+
+def test_content_signature_ignores_mtime_but_not_content(tmp_path):
+    source = tmp_path / "tables.json"
+    source.write_text("[1, 2, 3]")
+    signature = content_signature(str(source))
+
+    # A clone or copy gives the source a newer mtime than the artifact built from it:
+    os.utime(source, (2_000_000_000, 2_000_000_000))
+    assert built_from(signature, str(source))
+
+    source.write_text("[1, 2, 4]")
+    assert not built_from(signature, str(source))
+
+
+def test_missing_source_keeps_the_artifact(tmp_path):
+    assert content_signature(str(tmp_path / "missing.json")) == ""
+    assert built_from("anything", str(tmp_path / "missing.json"))
+
+
+def test_newest_existing_prefers_the_file_written_last(tmp_path):
+    jsonl, json_ = str(tmp_path / "meta.jsonl"), str(tmp_path / "meta.json")
+    assert newest_existing(jsonl, json_) == json_
+
+    open(jsonl, "w").close()
+    assert newest_existing(jsonl, json_) == jsonl
+
+    open(json_, "w").close()
+    os.utime(jsonl, (1_000_000_000, 1_000_000_000))
+    assert newest_existing(jsonl, json_) == json_
+
+
+def test_signature_is_kept_in_a_sidecar_so_workers_do_not_rehash(tmp_path, monkeypatch):
+    source = str(tmp_path / "tables.json")
+    with open(source, "w") as f:
+        f.write("[1, 2, 3]")
+    signature = content_signature(source)
+    assert os.path.exists(signature_path(source))
+
+    # A new worker (empty in-process cache) only reads the sidecar:
+    monkeypatch.setattr(records, "_signatures", {})
+    monkeypatch.setattr(records, "_hash_file", lambda path: pytest.fail("hashed again"))
+    assert content_signature(source) == signature
+
+
+def test_stale_sidecar_is_ignored(tmp_path, monkeypatch):
+    source = str(tmp_path / "tables.json")
+    with open(source, "w") as f:
+        f.write("[1, 2, 3]")
+    signature = content_signature(source)
+
+    # Same size, new contents (the sidecar's mtime no longer matches):
+    with open(source, "w") as f:
+        f.write("[1, 2, 4]")
+    os.utime(source, (2_000_000_000, 2_000_000_000))
+    monkeypatch.setattr(records, "_signatures", {})
+    assert content_signature(source) != signature
+    assert not built_from(signature, source)
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from services import retriever
+from services.governor import Shed
+
+NUMERIC = "Landing distance at 60000 kg and 2000 ft?"
+TEXT = "What is the APU used for?"
+CANDIDATES = [{"page": p, "text": f"page {p}"} for p in (3, 7, 9)]
+DISTANCES = [0.4, 0.5, 0.6]
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """
+    Undecided local stages, so every question reaches a Gemini stage; `gemini` holds what
+    the (sync and async) selector and reranker return or raise.
+    """
+    stages = {"numeric_selector": CANDIDATES[1], "llm_rerank": CANDIDATES[::-1]}
+
+    def call(stage):
+        if isinstance(stages[stage], Exception):
+            raise stages[stage]
+        return stages[stage]
+
+    async def call_async(stage):
+        return call(stage)
+
+    monkeypatch.setattr(retriever, "gate", lambda query_type, distances: {
+        "query_type": query_type, "candidates": len(distances), "confident": False})
+    monkeypatch.setattr(retriever, "route_numeric_query", lambda query, candidates: None)
+    monkeypatch.setattr(retriever, "hybrid_rerank", lambda query, candidates, *a, top_k: (candidates, False))
+    monkeypatch.setattr(retriever, "choose_best_numeric_chunk", lambda q, c: call("numeric_selector"))
+    monkeypatch.setattr(retriever, "choose_best_numeric_chunk_async", lambda q, c: call_async("numeric_selector"))
+    monkeypatch.setattr(retriever, "rerank", lambda q, c, top_k: call("llm_rerank"))
+    monkeypatch.setattr(retriever, "rerank_async", lambda q, c, top_k: call_async("llm_rerank"))
+    return stages
+
+
+def _both(query):
+    """
+    [(pages, decision path)] of select_pages() and select_pages_async() for the same question.
+    """
+    sync_decision, async_decision = {}, {}
+    sync = retriever.select_pages(query, CANDIDATES, DISTANCES, None, 2, sync_decision)
+    async_ = asyncio.run(retriever.select_pages_async(query, CANDIDATES, DISTANCES, None, 2, async_decision))
+    return [(sync, sync_decision["path"]), (async_, async_decision["path"])]
+
+
+def test_gemini_stages_pick_the_pages(gemini):
+    assert _both(NUMERIC) == [([CANDIDATES[1]], "numeric_selector")] * 2
+    assert _both(TEXT) == [(CANDIDATES[::-1][:2], "llm_rerank")] * 2
+
+
+@pytest.mark.parametrize("error, path", [(Shed("rerank"), "rerank_shed"), (RuntimeError("500"), "rerank_error")])
+def test_failed_rerank_keeps_the_local_order(gemini, error, path):
+    gemini["llm_rerank"] = error
+    assert _both(TEXT) == [(CANDIDATES[:2], path)] * 2
+
+
+def test_failed_selector_falls_back_to_the_top_faiss_page(gemini):
+    gemini["numeric_selector"] = None
+    assert _both(NUMERIC) == [([CANDIDATES[0]], "selector_failed")] * 2
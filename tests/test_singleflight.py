@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from services.singleflight import SingleFlight
+
+
+def _run(flights, *requests):
+    """
+    Runs the (question, scope) requests concurrently; each computation takes a moment.
+    Returns the results and the number of computations.
+    """
+    computed = []
+
+    async def compute(question):
+        computed.append(question)
+        await asyncio.sleep(0.01)
+        if question.startswith("fail"):
+            raise RuntimeError("upstream error")
+        return f"answer to {question}"
+
+    async def ask(question, scope):
+        return await flights.do(question, lambda: compute(question), scope)
+
+    async def run_all():
+        return await asyncio.gather(*(ask(q, s) for q, s in requests), return_exceptions=True)
+
+    return asyncio.run(run_all()), len(computed)
+
+
+def test_identical_questions_are_computed_once():
+    flights = SingleFlight()
+    results, computed = _run(flights, ("What is the APU?", ""), ("what is the APU", ""))
+
+    assert computed == 1
+    assert results == [("answer to What is the APU?", False), ("answer to What is the APU?", True)]
+    assert flights.stats() == {"leaders": 1, "followers": 1, "in_flight": 0}
+
+
+def test_other_scopes_are_computed_separately():
+    results, computed = _run(SingleFlight(), ("What is the APU?", "B737"), ("What is the APU?", "A320"))
+    assert computed == 2
+    assert [coalesced for _, coalesced in results] == [False, False]
+
+
+def test_errors_reach_every_caller():
+    results, computed = _run(SingleFlight(), ("fail please", ""), ("fail please", ""))
+    assert computed == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_a_finished_question_is_computed_again():
+    flights = SingleFlight()
+    _run(flights, ("What is the APU?", ""))
+    _, computed = _run(flights, ("What is the APU?", ""))
+    assert computed == 1
+    assert flights.leaders == 2
@@ -0,0 +1,54 @@
+import fitz
+import pytest
+
+from services.ingest import iter_pdf_pages
+from services.table_extractor import extract_tables_for_pages, iter_page_tables
+
+TABLE_PAGES = {2, 5, 11}
+PAGE_COUNT = 12
+
+
+def _draw_table(page):
+    # A 3x2 ruled grid, which is what pdfplumber's default table finder looks for:
+    xs, ys = (72, 200, 328), (72, 100, 128, 156)
+    for x in xs:
+        page.draw_line((x, ys[0]), (x, ys[-1]))
+    for y in ys:
+        page.draw_line((xs[0], y), (xs[-1], y))
+    for r, (a, b) in enumerate((("WEIGHT (KG)", "FLAPS 5"), ("60000", "2100"), ("65000", "2300"))):
+        page.insert_text((76, ys[r] + 18), a, fontsize=9)
+        page.insert_text((204, ys[r] + 18), b, fontsize=9)
+
+
+@pytest.fixture(scope="module")
+def pdf_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("pdf") / "manual.pdf")
+    doc = fitz.open()
+    for page_num in range(1, PAGE_COUNT + 1):
+        page = doc.new_page()
+        page.insert_text((72, 400), f"Page text {page_num}", fontsize=11)
+        if page_num in TABLE_PAGES:
+            _draw_table(page)
+    doc.save(path)
+    return path
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pool_yields_every_page_in_order(pdf_path, workers):
+    pages = list(iter_page_tables(pdf_path, range(PAGE_COUNT, 0, -1), workers))
+    assert [p for p, _ in pages] == list(range(1, PAGE_COUNT + 1))
+    assert {p for p, tables in pages if tables} == TABLE_PAGES
+
+
+def test_extract_tables_for_pages_skips_pages_outside_the_document(pdf_path):
+    entries = extract_tables_for_pages(pdf_path, [11, 5, 3, 99], workers=2)
+    assert [e["page"] for e in entries] == [5, 11]
+    assert entries[0]["table"][0] == ["WEIGHT (KG)", "FLAPS 5"]
+
+
+def test_streaming_ingestion_pairs_text_and_tables(pdf_path):
+    pages = list(iter_pdf_pages(pdf_path, table_workers=2))
+    assert [p["page"] for p in pages] == list(range(1, PAGE_COUNT + 1))
+    for p in pages:
+        assert f"Page text {p['page']}" in p["text"]
+        assert bool(p["tables"]) == (p["page"] in TABLE_PAGES)
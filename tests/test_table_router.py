@@ -0,0 +1,24 @@
+import json
+
+import pytest
+
+from services.query_type import is_numeric_query
+from services.records import read_records
+from services.table_router import route_numeric_query
+
+GOLDEN = json.load(open("benchmarks/golden_set.json", encoding="utf-8"))
+META = {m["page"]: m for m in read_records("data/meta.json")}
+TABLE_PAGES = (81, 82, 83, 86, 100)
+
+
+@pytest.mark.parametrize("item", [g for g in GOLDEN if is_numeric_query(g["question"])], ids=lambda g: g["question"][:40])
+def test_router_picks_the_labelled_table_page_or_defers(item):
+    candidates = [META[p] for p in sorted({*item["pages"], *TABLE_PAGES, 33})]
+    routed = route_numeric_query(item["question"], candidates)
+
+    # Undecided is allowed (the LLM selector takes over); a wrong page is not:
+    assert routed is None or routed["page"] in item["pages"]
+
+
+def test_router_does_not_route_text_pages():
+    assert route_numeric_query("What is the field limit weight at 30 C and 2000 m?", [META[33], META[34]]) is None
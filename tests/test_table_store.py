@@ -0,0 +1,51 @@
+import os
+
+from services import table_loader
+from services.records import write_records
+from services.table_store import build_table_store, build_table_store_data, serialize_table
+
+TABLE = [["WEIGHT (1000 KG)", None, "FLAPS 5"], ["60", "", "2100\n2200"]]
+
+
+def test_serialize_table_drops_empty_cells_and_joins_multi_values():
+    assert serialize_table(TABLE) == "WEIGHT (1000 KG) | FLAPS 5\n60 | 2100 / 2200"
+
+
+def test_identical_tables_are_stored_once():
+    store = build_table_store_data([{"page": 1, "table": TABLE}, {"page": 2, "table": TABLE}])
+    assert store["pages"] == {"1": [0], "2": [0]}
+    assert len(store["tables"]) == 1
+
+
+def test_loader_uses_the_store_only_while_it_matches_the_tables(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("data")
+    tables_path, store_path = "data/tables.json", "data/table_store.json"
+    write_records(tables_path, [{"page": 1, "table": TABLE}])
+    build_table_store(tables_path, store_path)
+
+    table_loader.reset_table_cache()
+    assert table_loader._load_table_store()["source"]
+
+    # Tables re-extracted without rebuilding the store: it is rebuilt in memory instead.
+    write_records(tables_path, [{"page": 2, "table": TABLE}])
+    table_loader.reset_table_cache()
+    assert "source" not in table_loader._load_table_store()
+    assert table_loader.get_table_text_for_page(2)
+    table_loader.reset_table_cache()
+
+
+def test_loader_reads_the_newer_tables_file_at_call_time(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("data")
+    write_records("data/tables.json", [{"page": 1, "table": TABLE}])
+    table_loader.reset_table_cache()
+    assert table_loader.get_table_text_for_page(1)
+
+    # A later streaming ingestion writes tables.jsonl next to the older tables.json:
+    write_records("data/tables.jsonl", [{"page": 2, "table": TABLE}])
+    os.utime("data/tables.json", (1_000_000_000, 1_000_000_000))
+    table_loader.reset_table_cache()
+    assert table_loader.get_table_text_for_page(2)
+    assert not table_loader.get_table_text_for_page(1)
+    table_loader.reset_table_cache()
@@ -0,0 +1,18 @@
+# This script applies a new revision of the manual incrementally:
+# only pages whose content changed are re-embedded and re-scanned for tables, and the
+# FAISS index is updated in place. The running API picks up the new index automatically.
+
+from services.incremental import update_index
+
+PDF_PATH = "data/Boeing B737 Manual.pdf"
+
+
+def main():
+    result = update_index(PDF_PATH, batch_size=32, max_workers=4)
+    print(f"Re-indexed {result['changed']} pages, removed {result['removed']}, failed {result['failed']}.")
+
+
+# Tables are re-extracted in a process pool, whose workers re-import this script when they are
+# spawned (macOS, Windows), so the update must only start in the main process:
+if __name__ == "__main__":
+    main()